@@ -5,14 +5,39 @@ A QGIS plugin to organize lots within a block.
 """
 from qgis.PyQt.QtCore import QSettings, QTranslator, QCoreApplication, Qt
 from qgis.PyQt.QtGui import QIcon
-from qgis.PyQt.QtWidgets import QAction, QMessageBox
+from qgis.PyQt.QtWidgets import QAction, QMessageBox, QFileDialog, QInputDialog
 from qgis.gui import QgsMapToolIdentifyFeature
 from qgis.core import (
     QgsProject, QgsVectorLayer, QgsFeature, QgsExpression,
-    QgsProcessing, QgsProcessingFeedback, QgsMessageLog, Qgis)
+    QgsWkbTypes, QgsProcessing, QgsProcessingFeedback, QgsMessageLog, Qgis, QgsApplication)
 from .resources import *
 from .OrdenacaoDeLotes_dialog import OrganizadorDeLotesDialog
 from .services.Notification import show_notification 
+from .services.Ordenacao import (
+    interpretar_lista_quadras, montar_linhas, contar_com_matricula, validar_ordem_quadra, calcular_diferencas)
+from .services.IndiceLotes import IndiceLotes, normalizar_quadra
+from .services.RegistroCamadas import RegistroCamadas
+from .services.Tarefas import TarefaNovaOrdem, TarefaOrdemServidor, FilaTarefas
+from .services.Medicao import MEDICAO_NULA, iniciar_operacao
+from .services.PreBusca import CachePreBusca, TarefaPreBusca, ordem_original
+from .services.PreviaMapa import PreviaMapa
+from .services.Varredura import TarefaVarredura, criar_camada_relatorio, gravar_csv
+from .services.Consultas import validar_quadra, validar_quadras
+from .services.OrdemServidor import modo_servidor_configurado, origem_no_servidor
+from .services.Diario import DiarioNovaOrdem
+from .services.Instantaneo import (
+    montar_instantaneo, linhas_desfazer, linhas_restauracao, lotes_do_instantaneo, restauravel)
+from .services.OrdemGeometrica import calcular_linhas_geometricas, percorrer_quadras, ponto_do_lote
+from .services.RotaLeitura import TarefaRota, ler_setores
+from .services.SequenciaClique import FerramentaSequencia
+from .services.Compactacao import TarefaCompactacao
+from .services.FilaOffline import (
+    FilaOffline, TarefaSincronizacao, configurar_modo_offline, modo_offline_configurado)
+from .services.NovaOrdem import (
+    TABELA_NOVAORDEM, substituir_quadras, suporta_transacao, quadra_existe, quadras_existem,
+    invalidar_existencia, linhas_gravadas, descrever_contagem, observar_gravacoes,
+    deixar_de_observar_gravacoes, linhas_gravadas_por_quadra)
+from .services.Versoes import versoes_das_linhas, versao_linhas
 import os.path
 import processing
 
@@ -21,7 +46,21 @@ class OrganizadorDeLotes:
 
         self.iface = iface
         self.plugin_dir = os.path.dirname(__file__)
+        self.dlg = None
         self.tool = None
+        self.indice_lotes = None
+        self.registro_camadas = None
+        self.fila_tarefas = None
+        self.diario = None
+        self.pre_busca = CachePreBusca()
+        self.tarefas_pre_busca = {}
+        self.previa_mapa = None
+        self.tarefa_varredura = None
+        self.sessao_sequencia = None
+        self.tarefa_rota = None
+        self.fila_offline = None
+        self.tarefa_sincronizacao = None
+        self.tarefa_compactacao = None
         
         locale = QSettings().value('locale/userLocale')[0:2]
         locale_path = os.path.join(
@@ -72,12 +111,58 @@ class OrganizadorDeLotes:
             callback=self.run,
             parent=self.iface.mainWindow()
         )
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Verificar ordenação de todas as quadras'),
+            callback=self.executar_varredura,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow()
+        )
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Planejar rota de leitura por setor'),
+            callback=self.executar_rota_leitura,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow()
+        )
+        self.add_action(
+            icon_path,
+            text=self.tr(u'Renumerar n_ordem de todas as quadras (1..N)'),
+            callback=self.executar_compactacao,
+            add_to_toolbar=False,
+            parent=self.iface.mainWindow()
+        )
+        self.registro_camadas = RegistroCamadas()
+        observar_gravacoes(self.pre_busca.invalidar)
         self.first_start = True
 
     def unload(self):
         for action in self.actions:
             self.iface.removePluginVectorMenu(self.tr(u'&OrganizadorDeLotes'), action)
             self.iface.removeToolBarIcon(action)
+        if self.indice_lotes:
+            self.indice_lotes.desconectar()
+            self.indice_lotes = None
+        if self.registro_camadas:
+            self.registro_camadas.desconectar()
+            self.registro_camadas = None
+        if self.fila_tarefas:
+            self.fila_tarefas.cancelar_todas()
+        deixar_de_observar_gravacoes(self.pre_busca.invalidar)
+        for tarefa in list(self.tarefas_pre_busca.values()):
+            tarefa.cancel()
+        if self.tarefa_varredura:
+            self.tarefa_varredura.cancel()
+        if self.tarefa_rota:
+            self.tarefa_rota.cancel()
+        if self.tarefa_sincronizacao:
+            self.tarefa_sincronizacao.cancel()
+        if self.tarefa_compactacao:
+            self.tarefa_compactacao.cancel()
+        self.pre_busca.invalidar()
+        if self.previa_mapa:
+            self.previa_mapa.limpar()
+            self.previa_mapa = None
 
     def _log(self, message, level=Qgis.Info):
         """Helper para logging"""
@@ -122,16 +207,38 @@ class OrganizadorDeLotes:
         settings.endGroup()
         return conexoes
 
+    def _escolher_conexao(self, titulo):
+        """
+        Pede ao usuário a conexão PostgreSQL das ações do menu
+
+        A conexão do diálogo, se houver, vem sugerida, mas nunca é assumida:
+        gravar na conexão errada não tem volta.
+
+        Returns:
+            Nome da conexão escolhida, ou None se não há conexões ou o usuário cancelou
+        """
+        conexoes = self.listar_conexoes_postgis()
+        if not conexoes:
+            show_notification("Aviso", "Nenhuma conexão PostgreSQL encontrada!", "warning", 4000)
+            return None
+        atual = self.dlg.cmbConexao.currentText() if self.dlg else ''
+        escolha, ok = QInputDialog.getItem(
+            self.iface.mainWindow(), titulo, "Conexão PostgreSQL:", conexoes,
+            conexoes.index(atual) if atual in conexoes else 0, False)
+        return escolha if ok and escolha else None
+
+    def _get_registro_camadas(self):
+        if self.registro_camadas is None:
+            self.registro_camadas = RegistroCamadas()
+        return self.registro_camadas
+
     def _get_quadra_layer(self):
         """Retorna camada Quadra se existir"""
-        layers = QgsProject.instance().mapLayers().values()
-        return next((layer for layer in layers if layer.name() == "Quadra"), None)
+        return self._get_registro_camadas().camada('quadra')
 
     def _get_lotes_layer(self):
         """Retorna camada de lotes se existir"""
-        layers = QgsProject.instance().mapLayers().values()
-        return next((layer for layer in layers 
-                    if 'gis_boletim_lote' in layer.name().lower() or 'lote' in layer.name().lower()), None)
+        return self._get_registro_camadas().camada('lote')
 
     def ativarFerramentaSelecao(self):
         """Ativa ferramenta de seleção de quadra no mapa"""
@@ -160,20 +267,157 @@ class OrganizadorDeLotes:
             show_notification("Quadra Selecionada", f"Quadra {ins_quadra} capturada com sucesso!", "success", 5000)
             if hasattr(self.dlg, 'lineInsQuadra'):
                 self.dlg.lineInsQuadra.setText(str(ins_quadra))
+            self.iniciar_pre_busca(ins_quadra)
+            self.atualizar_previa_mapa()
 
         # Garante que a janela volte ao primeiro plano
             self._resetar_ferramenta_e_janela()
 
-    def _filtrar_lotes_quadra(self, camada_lotes, ins_quadra):
-        """Filtra lotes por quadra"""
-        alg_params = {
-            'FIELD': 'ins_quadra',
-            'INPUT': camada_lotes,
-            'OPERATOR': 0,
-            'VALUE': str(ins_quadra),
-            'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-        }
-        return processing.run('native:extractbyattribute', alg_params)['OUTPUT']
+    def _get_indice_lotes(self, camada_lotes):
+        """Retorna o índice de lotes por quadra, criando-o se a camada mudou"""
+        if self.indice_lotes:
+            try:
+                mesma_camada = self.indice_lotes.camada.id() == camada_lotes.id()
+            except RuntimeError:
+                mesma_camada = False
+            if mesma_camada:
+                return self.indice_lotes
+            self.indice_lotes.desconectar()
+
+        self.indice_lotes = IndiceLotes(camada_lotes)
+        return self.indice_lotes
+
+    def iniciar_pre_busca(self, ins_quadra):
+        """
+        Mostra o resumo da quadra e lê em segundo plano seus lotes e linhas gravadas
+
+        O resultado vai para o cache de pré-busca, usado pela pré-visualização
+        de Executar e Restaurar para não reler a camada nem o banco.
+        """
+        try:
+            ins_quadra = normalizar_quadra(ins_quadra)
+            camada_lotes = self._get_lotes_layer()
+            if not isinstance(ins_quadra, int) or ins_quadra == 99 or not camada_lotes:
+                self._mostrar_resumo_quadra(None)
+                return
+
+            indice_lotes = self._get_indice_lotes(camada_lotes)
+            lotes = indice_lotes.ler_com_nv_ordem([ins_quadra]).get(ins_quadra, [])
+            resumo = {'num_lotes': contar_com_matricula(lotes), 'ordem_original': ordem_original(lotes)}
+            self._mostrar_resumo_quadra(ins_quadra, resumo)
+
+            conexao = self.dlg.cmbConexao.currentText() if self.dlg else ''
+            if not conexao or (conexao, ins_quadra) in self.tarefas_pre_busca or modo_offline_configurado():
+                return
+            entrada = self.pre_busca.obter(conexao, ins_quadra, indice_lotes.versao)
+            if entrada:
+                self._mostrar_resumo_quadra(ins_quadra, entrada)
+                return
+
+            resumo['geracao'] = self.pre_busca.geracao
+            tarefa = TarefaPreBusca(conexao, ins_quadra, camada_lotes, indice_lotes.fids_das_quadras([ins_quadra]),
+                                    resumo, indice_lotes.versao)
+            tarefa.concluida.connect(self._ao_concluir_pre_busca)
+            self.tarefas_pre_busca[(conexao, ins_quadra)] = tarefa
+            QgsApplication.taskManager().addTask(tarefa)
+        except Exception as e:
+            self._log(f"Erro na pré-busca da quadra {ins_quadra}: {e}", Qgis.Warning)
+
+    def _ao_concluir_pre_busca(self, entrada):
+        self.tarefas_pre_busca.pop((entrada['conexao'], entrada['ins_quadra']), None)
+        if 'erro' in entrada:
+            self._log(f"Pré-busca da quadra {entrada['ins_quadra']} não concluída: {entrada['erro']}", Qgis.Warning)
+            return
+        self.pre_busca.guardar(entrada)
+        if self.dlg and self.dlg.lineInsQuadra.text() == str(entrada['ins_quadra']):
+            self._mostrar_resumo_quadra(entrada['ins_quadra'], entrada)
+
+    def _mostrar_resumo_quadra(self, ins_quadra, dados=None):
+        """Resumo da quadra abaixo do campo da quadra selecionada"""
+        if not self.dlg or not hasattr(self.dlg, 'lblResumoQuadra'):
+            return
+        if ins_quadra is None or dados is None:
+            self.dlg.lblResumoQuadra.setText("")
+            return
+        texto = (f"{dados['num_lotes']} lote(s) com matrícula · "
+                 f"{'ordem original' if dados['ordem_original'] else 'ordem alterada'}")
+        if 'gravadas' in dados:
+            texto += (f" · novaordem: {len(dados['gravadas'])} linha(s)" if dados['gravadas']
+                      else " · sem novaordem")
+        self.dlg.lblResumoQuadra.setText(texto)
+
+    def _pre_busca_valida(self, conexao, ins_quadra):
+        """Entrada do cache de pré-busca da quadra, se ainda valer"""
+        camada_lotes = self._get_lotes_layer()
+        if not camada_lotes:
+            return None
+        return self.pre_busca.obter(conexao, ins_quadra, self._get_indice_lotes(camada_lotes).versao)
+
+    def atualizar_previa_mapa(self, *args):
+        """
+        Mostra no mapa, como rótulos, a nova ordem da quadra selecionada, sem gravar
+
+        Os lotes da quadra são lidos uma vez (da pré-busca, se houver); as
+        mudanças da ordem inicial só recalculam os rótulos.
+        """
+        if not self.dlg or not hasattr(self.dlg, 'chkPreviaMapa') or self.sessao_sequencia:
+            return
+        try:
+            ins_quadra = normalizar_quadra(self.dlg.lineInsQuadra.text())
+            camada_lotes = self._get_lotes_layer()
+            if not self.dlg.chkPreviaMapa.isChecked() or not isinstance(ins_quadra, int) or not camada_lotes:
+                if self.previa_mapa:
+                    self.previa_mapa.limpar()
+                return
+
+            if self.previa_mapa is None:
+                self.previa_mapa = PreviaMapa()
+            versao = self._get_indice_lotes(camada_lotes).versao
+            if (self.previa_mapa.camada is None or self.previa_mapa.ins_quadra != ins_quadra
+                    or self.previa_mapa.versao != versao):
+                entrada = self._pre_busca_valida(self.dlg.cmbConexao.currentText(), ins_quadra)
+                if entrada:
+                    lotes = entrada['lotes']
+                else:
+                    lotes = self._ler_lotes_quadras(camada_lotes, [ins_quadra]).get(ins_quadra, [])
+                self.previa_mapa.carregar(camada_lotes, ins_quadra, lotes, versao)
+
+            # Ordem inválida não grava nada: a prévia mostra a ordem original
+            try:
+                ordem_primeira = int(self.dlg.lineOrdemPrimeira.text())
+            except ValueError:
+                ordem_primeira = None
+            if ordem_primeira is not None and validar_ordem_quadra(
+                    ins_quadra, ordem_primeira, self.previa_mapa.num_lotes):
+                ordem_primeira = None
+            self.previa_mapa.atualizar(ordem_primeira)
+        except Exception as e:
+            self._log(f"Erro na prévia da quadra no mapa: {e}", Qgis.Warning)
+
+    def _fechar_previa_mapa(self, *args):
+        if self.previa_mapa:
+            self.previa_mapa.limpar()
+
+    def _ler_lotes_quadras(self, camada_lotes, quadras):
+        """Lê matricula, ordem e geometria dos lotes das quadras pelo índice"""
+        return self._get_indice_lotes(camada_lotes).ler_lotes(quadras)
+
+    def _criar_camada_novaordem(self, camada_lotes, linhas):
+        """Cria camada em memória com as linhas prontas para a tabela novaordem"""
+        tipo_geometria = QgsWkbTypes.displayString(camada_lotes.wkbType())
+        camada = QgsVectorLayer(
+            f"{tipo_geometria}?crs={camada_lotes.crs().authid()}"
+            "&field=matricula:integer&field=ins_quadra:integer&field=n_ordem:long",
+            "novaordem", "memory")
+
+        features = []
+        for linha in linhas:
+            feature = QgsFeature(camada.fields())
+            feature.setAttributes([linha['matricula'], linha['ins_quadra'], linha['n_ordem']])
+            feature.setGeometry(linha['geometria'])
+            features.append(feature)
+        camada.dataProvider().addFeatures(features)
+        return camada
 
     def contar_lotes_na_quadra(self, ins_quadra, tipo):
         """Conta e verifica lotes na quadra"""
@@ -182,15 +426,15 @@ class OrganizadorDeLotes:
             if not camada_lotes:
                 raise Exception("Camada de lotes não encontrada!")
 
-            camada_filtrada = self._filtrar_lotes_quadra(camada_lotes, ins_quadra)
+            indice_lotes = self._get_indice_lotes(camada_lotes)
             
             if tipo == 'OrganizarLotes':
-                return sum(1 for f in camada_filtrada.getFeatures() 
-                          if f['matricula'] is not None and f['matricula'] != '')
+                return contar_com_matricula(indice_lotes.lotes_da_quadra(ins_quadra).values())
             else:
-                for feature in camada_filtrada.getFeatures():
-                    if feature['matricula'] is not None and feature['matricula'] != '':
-                        return feature['ordem'] != feature['nv_ordem']
+                # nv_ordem lido da camada na hora: reflete a última gravação da novaordem
+                for lote in indice_lotes.ler_com_nv_ordem([ins_quadra]).get(normalizar_quadra(ins_quadra), []):
+                    if lote['matricula'] is not None and lote['matricula'] != '':
+                        return lote['ordem'] != lote['nv_ordem']
                 return False
 
         except Exception as e:
@@ -200,20 +444,7 @@ class OrganizadorDeLotes:
     def verificar_ins_quadra_existe(self, conexao, ins_quadra):
         """Verifica se ins_quadra existe na tabela novaordem"""
         try:
-            sql = f'''
-                SELECT 1 as existe
-                FROM comercial_umc.novaordem
-                WHERE ins_quadra = {ins_quadra}
-                LIMIT 1
-            '''
-            alg_params = {
-                'DATABASE': conexao,
-                'SQL': sql,
-                'OUTPUT': 'memory:temp_verificacao'
-            }
-            
-            result = processing.run('native:postgisexecuteandloadsql', alg_params)
-            existe = result['OUTPUT'].featureCount() > 0
+            existe = quadra_existe(conexao, ins_quadra)
             self._log(f"Verificação ins_quadra {ins_quadra}: {'encontrado' if existe else 'não encontrado'}")
             return existe
 
@@ -225,8 +456,8 @@ class OrganizadorDeLotes:
                     DECLARE rec_count INTEGER;
                     BEGIN
                         SELECT COUNT(*) INTO rec_count
-                        FROM comercial_umc.novaordem
-                        WHERE ins_quadra = {ins_quadra};
+                        FROM {TABELA_NOVAORDEM}
+                        WHERE ins_quadra = {validar_quadra(ins_quadra)};
                         IF rec_count = 0 THEN
                             RAISE EXCEPTION 'NO_RECORDS_FOUND';
                         END IF;
@@ -237,24 +468,13 @@ class OrganizadorDeLotes:
             except Exception as e2:
                 return 'no_records_found' not in str(e2).lower()
 
-    def excluir_ins_quadra_existente(self, conexao, ins_quadra):
-        """Exclui registros da quadra na tabela novaordem"""
+    def verificar_quadras_existem(self, conexao, quadras):
+        """Verifica, em uma única consulta, quais quadras existem na tabela novaordem"""
         try:
-            sql = f'DELETE FROM comercial_umc.novaordem WHERE ins_quadra = {ins_quadra}'
-            processing.run('native:postgisexecutesql', {'DATABASE': conexao, 'SQL': sql})
-            self._log(f"Registros da quadra {ins_quadra} excluídos com sucesso")
-            return True
+            return quadras_existem(conexao, quadras)
         except Exception as e:
-            self._log(f"Erro ao excluir registros: {e}", Qgis.Critical)
-            return False
-
-    def _preparar_campos_refactor(self, ordem_expr='ordem'):
-        """Prepara mapeamento de campos para refactor"""
-        return [
-            {'expression': '"matricula"', 'length': -1, 'name': 'matricula', 'precision': 0, 'type': 2},
-            {'expression': '"ins_quadra"', 'length': -1, 'name': 'ins_quadra', 'precision': 0, 'type': 2},
-            {'expression': f'"{ordem_expr}"', 'length': -1, 'name': 'n_ordem', 'precision': 0, 'type': 4}
-        ]
+            self._log(f"Erro ao verificar quadras na novaordem: {e}", Qgis.Warning)
+            return {int(q): self.verificar_ins_quadra_existe(conexao, q) for q in quadras}
 
     def _importar_para_postgis(self, conexao, camada):
         """Importa camada para PostgreSQL"""
@@ -275,63 +495,997 @@ class OrganizadorDeLotes:
         }
         processing.run('gdal:importvectorintopostgisdatabaseavailableconnections', alg_params)
 
-    def restaurar_ordem_original(self, conexao, ins_quadra):
-        """Restaura ordem original dos lotes"""
+    def _gravar_quadras(self, conexao, camada_lotes, quadras, linhas, incremental=False, medicao=MEDICAO_NULA):
+        """
+        Substitui as linhas das quadras em novaordem em uma única transação
+
+        Returns:
+            Contagem de linhas atualizadas, inseridas e excluídas, ou None no
+            fluxo antigo (processing), que não informa as linhas afetadas
+        """
+        if suporta_transacao():
+            return substituir_quadras(conexao, quadras, linhas, incremental, medicao=medicao)
+
+        # Sem psycopg2 nem API de conexões: exclusão e importação em conexões separadas
+        lista = ', '.join(str(q) for q in validar_quadras(quadras))
+        sql = f'DELETE FROM {TABELA_NOVAORDEM} WHERE ins_quadra IN ({lista})'
+        try:
+            with medicao.etapa('excluidas'):
+                processing.run('native:postgisexecutesql', {'DATABASE': conexao, 'SQL': sql})
+            with medicao.etapa('criar_camada', linhas=len(linhas)):
+                camada = self._criar_camada_novaordem(camada_lotes, linhas)
+            with medicao.etapa('importar_ogr2ogr', linhas=len(linhas)):
+                self._importar_para_postgis(conexao, camada)
+        finally:
+            invalidar_existencia(conexao, quadras)
+        return None
+
+    def _preparar_linhas(self, ins_quadra, ordem_primeira=None, medicao=MEDICAO_NULA):
+        """Lê os lotes da quadra e monta as linhas de novaordem (ordem original se ordem_primeira=None)"""
+        camada_lotes = self._get_lotes_layer()
+        if not camada_lotes:
+            raise Exception("Camada de lotes não encontrada!")
+
+        with medicao.etapa('ler_lotes') as etapa:
+            lotes = self._ler_lotes_quadras(camada_lotes, [ins_quadra]).get(normalizar_quadra(ins_quadra), [])
+            etapa.registrar(linhas=len(lotes))
+        with medicao.etapa('montar_linhas', linhas=len(lotes)):
+            linhas = montar_linhas(int(ins_quadra), lotes, ordem_primeira)
+        return camada_lotes, linhas
+
+    def _get_diario(self):
+        if self.diario is None:
+            self.diario = DiarioNovaOrdem()
+        return self.diario
+
+    def _ultimo_instantaneo(self, conexao, ins_quadra):
+        """Instantâneo mais recente da quadra no diário, ou None"""
+        try:
+            return self._get_diario().ultimo(conexao, ins_quadra)
+        except Exception as e:
+            self._log(f"Erro ao ler o diário: {e}", Qgis.Warning)
+            return None
+
+    def _montar_instantaneos(self, conexao, quadras, gravadas=None, ler_lotes=True):
+        """
+        Instantâneos do estado atual das quadras, a guardar no diário após a gravação
+
+        Com ler_lotes=False os instantâneos trazem só as linhas gravadas: bastam
+        para o Desfazer e dispensam a camada de lotes (que pode nem estar carregada)
+        """
+        if gravadas is None:
+            gravadas = linhas_gravadas(conexao, quadras)
+        gravadas_por_quadra = {}
+        for linha in gravadas:
+            gravadas_por_quadra.setdefault(int(linha[1]), []).append(linha)
+        indice_lotes = self._get_indice_lotes(self._get_lotes_layer()) if ler_lotes else None
+        return [montar_instantaneo(q, gravadas_por_quadra.get(int(q), []),
+                                   indice_lotes.lotes_da_quadra(q).values() if indice_lotes else [])
+                for q in quadras]
+
+    def _atualizar_diario(self, conexao, descricao, resultado, instantaneos=None, desfeito=None):
+        """Guarda os instantâneos de uma gravação concluída e descarta o instantâneo desfeito"""
+        if not resultado['success']:
+            return
+        try:
+            diario = self._get_diario()
+            for instantaneo in instantaneos or []:
+                instantaneo['descricao'] = descricao
+            diario.registrar_varios(conexao, instantaneos or [])
+            if desfeito is not None:
+                diario.remover(desfeito)
+        except Exception as e:
+            self._log(f"Erro ao atualizar o diário: {e}", Qgis.Warning)
+
+    def _previa(self, linhas, gravadas, medicao, reaplicar=False):
+        """Compara as linhas com as gravadas e monta o dicionário da pré-visualização"""
+        with medicao.etapa('diferenca') as etapa:
+            diferencas = calcular_diferencas(gravadas, linhas)
+            etapa.registrar(atualizar=len(diferencas['atualizar']), inserir=len(diferencas['inserir']),
+                            excluir=len(diferencas['excluir']), inalteradas=diferencas['inalteradas'])
+        if reaplicar:
+            mensagem = (f"{len(diferencas['atualizar'])} a atualizar, "
+                        f"{len(diferencas['excluir'])} a excluir, "
+                        f"{diferencas['inalteradas']} sem alteração")
+            if diferencas['inserir']:
+                mensagem += f", {len(diferencas['inserir'])} sem linha gravada (não serão recriados)"
+        else:
+            mensagem = (f"{len(diferencas['atualizar'])} a atualizar, "
+                        f"{len(diferencas['inserir'])} a inserir, "
+                        f"{len(diferencas['excluir'])} a excluir, "
+                        f"{diferencas['inalteradas']} sem alteração")
+        return {'success': True, 'message': mensagem, 'diferencas': diferencas, 'linhas': linhas,
+                'reaplicar': reaplicar}
+
+    def _previa_offline(self, linhas):
+        """Pré-visualização no modo offline: sem o servidor não há o que comparar"""
+        return {'success': True, 'diferencas': None, 'linhas': linhas, 'reaplicar': False,
+                'message': f"{len(linhas)} linha(s) vão para a fila offline; "
+                           f"a comparação com o servidor é feita na sincronização"}
+
+    def pre_visualizar_quadra(self, conexao, ins_quadra, ordem_primeira=None, medicao=MEDICAO_NULA):
+        """
+        Compara a ordem calculada com a gravada em novaordem, sem gravar
+
+        Usa os lotes e as linhas da pré-busca da quadra, se ainda valerem.
+        No modo offline só as linhas são calculadas (ver _previa_offline).
+
+        Returns:
+            Dicionário com 'success', 'message', 'diferencas' (ver
+            Ordenacao.calcular_diferencas), 'linhas' calculadas,
+            'instantaneos' do estado atual, para o diário, e 'versoes' das
+            linhas gravadas, conferidas na gravação
+        """
+        try:
+            entrada = self._pre_busca_valida(conexao, ins_quadra)
+            if entrada:
+                with medicao.etapa('montar_linhas', linhas=len(entrada['lotes']), pre_busca=True):
+                    linhas = montar_linhas(int(ins_quadra), entrada['lotes'], ordem_primeira)
+                gravadas = entrada['gravadas']
+            else:
+                _, linhas = self._preparar_linhas(ins_quadra, ordem_primeira, medicao)
+                gravadas = None
+            if modo_offline_configurado():
+                return self._previa_offline(linhas)
+            if gravadas is None:
+                with medicao.etapa('ler_gravadas') as etapa:
+                    gravadas = linhas_gravadas(conexao, [ins_quadra])
+                    etapa.registrar(linhas=len(gravadas))
+            previa = self._previa(linhas, gravadas, medicao)
+            previa['instantaneos'] = self._montar_instantaneos(conexao, [ins_quadra], gravadas)
+            previa['versoes'] = versoes_das_linhas(gravadas, [ins_quadra])
+            return previa
+        except Exception as e:
+            self._log(f"Erro ao pré-visualizar quadra {ins_quadra}: {e}", Qgis.Warning)
+            return {'success': False, 'message': f"Erro: {e}", 'diferencas': None, 'linhas': None}
+
+    def pre_visualizar_instantaneo(self, conexao, instantaneo, linhas, medicao=MEDICAO_NULA):
+        """
+        Pré-visualiza a reaplicação de um instantâneo do diário, sem ler a camada de lotes
+
+        Args:
+            instantaneo: Instantâneo da quadra (ver Diario.py)
+            linhas: linhas_restauracao(instantaneo) ou linhas_desfazer(instantaneo)
+        """
+        ins_quadra = instantaneo['ins_quadra']
+        try:
+            with medicao.etapa('ler_gravadas') as etapa:
+                gravadas = linhas_gravadas(conexao, [ins_quadra])
+                etapa.registrar(linhas=len(gravadas))
+            previa = self._previa(linhas, gravadas, medicao, reaplicar=True)
+            previa['instantaneos'] = [montar_instantaneo(ins_quadra, gravadas, lotes_do_instantaneo(instantaneo))]
+            previa['versoes'] = versoes_das_linhas(gravadas, [ins_quadra])
+            return previa
+        except Exception as e:
+            self._log(f"Erro ao pré-visualizar instantâneo da quadra {ins_quadra}: {e}", Qgis.Warning)
+            return {'success': False, 'message': f"Erro: {e}", 'diferencas': None, 'linhas': None}
+
+    def _origem_servidor(self, conexao, no_servidor=None):
+        """
+        Tabela dos lotes no banco da conexão, se o cálculo no servidor foi pedido
+
+        no_servidor=None segue a configuração OrganizaLoteClick/servidor/ativo.
+        """
+        if no_servidor is None:
+            no_servidor = modo_servidor_configurado()
+        if not no_servidor:
+            return None
+        try:
+            origem = origem_no_servidor(self._get_lotes_layer(), conexao)
+        except ValueError as e:
+            self._log(f"{e}. Cálculo feito no cliente", Qgis.Warning)
+            show_notification("Cálculo no Servidor", str(e), "warning", 5000)
+            return None
+        if origem is None:
+            self._log("A camada de lotes não está no banco da conexão: cálculo feito no cliente", Qgis.Warning)
+        return origem
+
+    def enfileirar_lote_de_quadras(self, conexao, quadras):
+        """
+        Agenda a reorganização de várias quadras em uma única gravação
+
+        Na thread principal os lotes de todas as quadras são lidos de uma vez
+        e as novas ordens calculadas em memória; a gravação, em uma única
+        transação, vai para a fila de tarefas (ver _agendar_gravacao). No
+        modo servidor as quadras e ordens vão em arrays para um único
+        comando no banco. No modo offline as linhas vão para a fila local.
+
+        Args:
+            conexao: Nome da conexão PostgreSQL
+            quadras: Lista de tuplas (ins_quadra, ordem_primeira)
+
+        Returns:
+            Dicionário com 'success', 'message' e 'relatorio' (uma entrada
+            por quadra). O resultado da gravação chega por _ao_concluir_tarefa.
+        """
+        relatorio = []
         try:
             camada_lotes = self._get_lotes_layer()
             if not camada_lotes:
                 raise Exception("Camada de lotes não encontrada!")
 
-            camada_filtrada = self._filtrar_lotes_quadra(camada_lotes, ins_quadra)
-
-            alg_params = {
-                'FIELDS_MAPPING': self._preparar_campos_refactor(),
-                'INPUT': camada_filtrada,
-                'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
+            indice_lotes = self._get_indice_lotes(camada_lotes)
+            offline = modo_offline_configurado()
+            existentes = {} if offline else self.verificar_quadras_existem(conexao, [q for q, _ in quadras])
+
+            validas = {}
+            total = len(quadras)
+            for ins_quadra, ordem_primeira in quadras:
+                num_lotes = contar_com_matricula(indice_lotes.lotes_da_quadra(ins_quadra).values())
+
+                mensagem = validar_ordem_quadra(ins_quadra, ordem_primeira, num_lotes)
+                if mensagem is None:
+                    validas[ins_quadra] = ordem_primeira
+                    mensagem = f"{num_lotes} lote(s) a partir da ordem {ordem_primeira}"
+
+                relatorio.append({
+                    'ins_quadra': ins_quadra,
+                    'ordem_primeira': ordem_primeira,
+                    'num_lotes': num_lotes,
+                    'novaordem_existente': existentes.get(ins_quadra, False),
+                    'success': ins_quadra in validas,
+                    'message': mensagem
+                })
+                if ins_quadra not in validas:
+                    self._log(f"Lote de quadras: quadra {ins_quadra} ignorada: {mensagem}", Qgis.Warning)
+
+            if not validas:
+                return {'success': False, 'message': 'Nenhuma quadra válida para reorganizar!',
+                        'relatorio': relatorio}
+
+            descricao = f"Reorganizar {len(validas)} quadra(s) em lote"
+            quadras_validas = list(validas)
+            instantaneos = versoes = servidor = None
+            if not offline and suporta_transacao():
+                # Os instantâneos e as versões conferidas saem da mesma leitura: o
+                # diário guarda exatamente o estado que a gravação sobrescreve
+                gravadas = linhas_gravadas(conexao, quadras_validas)
+                instantaneos = self._montar_instantaneos(conexao, quadras_validas, gravadas)
+                versoes = versoes_das_linhas(gravadas, quadras_validas)
+                origem = self._origem_servidor(conexao)
+                if origem:
+                    servidor = (origem, list(validas.items()))
+
+            linhas = []
+            if servidor is None:
+                lotes_por_quadra = self._ler_lotes_quadras(camada_lotes, validas)
+                for ins_quadra, ordem_primeira in validas.items():
+                    linhas.extend(montar_linhas(ins_quadra, lotes_por_quadra.get(ins_quadra, []), ordem_primeira))
+
+            self._agendar_gravacao(descricao, conexao, quadras_validas, linhas,
+                                   f'{len(validas)} de {total} quadra(s) reorganizada(s) com sucesso!',
+                                   instantaneos=instantaneos, versoes=versoes, servidor=servidor)
+            return {
+                'success': True,
+                'message': f'{len(validas)} de {total} quadra(s) adicionada(s) à fila de gravação',
+                'relatorio': relatorio
             }
-            camada_processada = processing.run('native:refactorfields', alg_params)['OUTPUT']
+        except Exception as e:
+            self._log(f"Erro ao organizar lote de quadras: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+
+    def _get_fila_tarefas(self):
+        if self.fila_tarefas is None:
+            self.fila_tarefas = FilaTarefas()
+            self.fila_tarefas.alterada.connect(self._atualizar_fila)
+            self.fila_tarefas.progresso.connect(self._mostrar_progresso_tarefa)
+        return self.fila_tarefas
+
+    def _agendar_gravacao(self, descricao, conexao, quadras, linhas, mensagem_sucesso, medicao=MEDICAO_NULA,
+                          instantaneos=None, reaplicar=False, desfeito=None, versoes=None, servidor=None):
+        """
+        Agenda a gravação das linhas calculadas em segundo plano
+
+        A gravação é incremental: só as linhas que mudaram são regravadas.
+        Sem psycopg2 nem API de conexões a gravação depende do processing e
+        é feita na hora, pelo fluxo antigo. A medição passa a ser finalizada
+        pela gravação.
+
+        Concluída a gravação, os instantâneos do estado anterior vão para o
+        diário e o instantâneo desfeito, se houver, é descartado. Com
+        reaplicar=True as linhas vêm de um instantâneo e só são atualizadas
+        ou apagadas. versoes são as versões das linhas gravadas vistas na
+        pré-visualização: se outro operador gravou as quadras depois dela, a
+        gravação é recusada. No modo offline as linhas vão para a fila local
+        (ver _registrar_offline). servidor=(origem, quadras_e_ordens) faz o
+        cálculo e a gravação no banco (ver _origem_servidor); as linhas
+        ficam só para a fila offline.
+
+        Returns:
+            A TarefaNovaOrdem criada, ou None se a gravação já foi concluída
+        """
+        quadras = [int(q) for q in quadras]
+        if modo_offline_configurado():
+            self._registrar_offline(descricao, conexao, quadras, linhas, medicao, reaplicar)
+            return None
+        if not suporta_transacao():
+            resultado = {'quadras': quadras, 'cancelada': False, 'alteracoes': None}
+            try:
+                with medicao.etapa('gravar', linhas=len(linhas)):
+                    self._gravar_quadras(conexao, self._get_lotes_layer(), quadras, linhas, medicao=medicao)
+                resultado.update({'success': True, 'message': mensagem_sucesso})
+            except Exception as e:
+                self._log(f"Erro na gravação '{descricao}': {e}", Qgis.Critical)
+                resultado.update({'success': False, 'message': f"Erro: {e}"})
+            medicao.finalizar(resultado['success'])
+            self._atualizar_diario(conexao, descricao, resultado, instantaneos, desfeito)
+            self._ao_concluir_tarefa(resultado)
+            return None
+
+        if servidor:
+            origem, quadras_e_ordens = servidor
+            tarefa = TarefaOrdemServidor(descricao, conexao, origem, quadras_e_ordens,
+                                         mensagem_sucesso=mensagem_sucesso, medicao=medicao, versoes=versoes)
+        else:
+            tarefa = TarefaNovaOrdem(descricao, conexao, quadras, linhas, mensagem_sucesso=mensagem_sucesso,
+                                     medicao=medicao, reaplicar=reaplicar, versoes=versoes)
+        tarefa.concluida.connect(
+            lambda resultado: self._atualizar_diario(conexao, descricao, resultado, instantaneos, desfeito))
+        tarefa.concluida.connect(self._ao_concluir_tarefa)
+        self._log(f"Tarefa agendada: {descricao}")
+        return self._get_fila_tarefas().adicionar(tarefa)
+
+    def _get_fila_offline(self):
+        if self.fila_offline is None:
+            self.fila_offline = FilaOffline()
+        return self.fila_offline
+
+    def _registrar_offline(self, descricao, conexao, quadras, linhas, medicao=MEDICAO_NULA, reaplicar=False):
+        """
+        Guarda as linhas das quadras na fila offline, para gravar na sincronização
+
+        Os instantâneos do diário não são feitos: o estado anterior só é
+        conhecido na sincronização, que os guarda.
+        """
+        resultado = {'quadras': quadras, 'cancelada': False, 'alteracoes': None}
+        try:
+            if reaplicar:
+                raise Exception("Reaplicar o diário requer conexão com o servidor")
+            with medicao.etapa('fila_offline', linhas=len(linhas)):
+                self._get_fila_offline().registrar(conexao, descricao, quadras, linhas)
+            resultado.update({'success': True,
+                              'message': f"{descricao}: guardado na fila offline até a sincronização"})
+        except Exception as e:
+            self._log(f"Erro ao guardar '{descricao}' na fila offline: {e}", Qgis.Critical)
+            resultado.update({'success': False, 'message': f"Erro: {e}"})
+        medicao.finalizar(resultado['success'])
+        self._ao_concluir_tarefa(resultado)
+        self._atualizar_botao_sincronizar()
+
+    def _enfileirar(self, descricao, conexao, ins_quadra, ordem_primeira, mensagem_sucesso, previa=None,
+                    medicao=MEDICAO_NULA):
+        """
+        Lê os lotes na thread principal e agenda a gravação da quadra
+
+        previa pode trazer a pré-visualização já feita, com as linhas
+        calculadas e os instantâneos para o diário. No modo servidor a
+        gravação é feita pelo comando do banco, conferindo as versões da
+        pré-visualização.
+        """
+        if previa is None or not previa['success']:
+            previa = self.pre_visualizar_quadra(conexao, ins_quadra, ordem_primeira, medicao)
+            if not previa['success']:
+                raise Exception(previa['message'])
+        servidor = None
+        if not previa.get('reaplicar') and not modo_offline_configurado() and suporta_transacao():
+            origem = self._origem_servidor(conexao)
+            if origem:
+                servidor = (origem, [(int(ins_quadra), ordem_primeira)])
+        return self._agendar_gravacao(descricao, conexao, [ins_quadra], previa['linhas'], mensagem_sucesso,
+                                      medicao, previa.get('instantaneos'), previa.get('reaplicar', False),
+                                      versoes=previa.get('versoes'), servidor=servidor)
+
+    def enfileirar_organizacao(self, conexao, ins_quadra, ordem_primeira, previa=None, medicao=MEDICAO_NULA):
+        """Agenda a reorganização da quadra a partir de ordem_primeira"""
+        return self._enfileirar(
+            f"Reorganizar quadra {ins_quadra}", conexao, ins_quadra, ordem_primeira,
+            f"Quadra {ins_quadra} reorganizada com sucesso!", previa, medicao)
+
+    def enfileirar_restauracao(self, conexao, ins_quadra, previa=None, medicao=MEDICAO_NULA):
+        """Agenda a restauração da ordem original da quadra"""
+        return self._enfileirar(
+            f"Restaurar quadra {ins_quadra}", conexao, ins_quadra, None,
+            f"Quadra {ins_quadra} restaurada para ordem original!", previa, medicao)
+
+    def _quadras_do_dialogo(self):
+        """Quadras do campo de lote ou, se vazio, a quadra selecionada no mapa"""
+        texto = self.dlg.lineQuadrasLote.text().strip()
+        if texto:
+            return [q for q, _ in interpretar_lista_quadras(texto)]
+        ins_quadra = self.dlg.lineInsQuadra.text()
+        return [int(ins_quadra)] if ins_quadra.isdigit() and ins_quadra != '99' else []
+
+    def executar_ordenacao_geometrica(self):
+        """Ordena os lotes pelo perímetro da quadra a partir do canto ou lote escolhido"""
+        try:
+            conexao = self.dlg.cmbConexao.currentText()
+            if not conexao:
+                show_notification("Aviso", "Selecione uma conexão PostgreSQL!", "warning", 5000)
+                return
+
+            try:
+                quadras = self._quadras_do_dialogo()
+            except ValueError as e:
+                show_notification("Aviso", str(e), "warning", 5000)
+                return
+
+            if not quadras:
+                show_notification("Aviso", "Selecione uma quadra ou informe as quadras do lote!", "warning", 5000)
+                return
+
+            inicio = self.dlg.cmbCantoInicial.currentData()
+            if inicio != 'lote':
+                self._ordenar_pela_geometria(conexao, quadras, inicio, self.dlg.cmbCantoInicial.currentText())
+                return
 
-            self._importar_para_postgis(conexao, camada_processada)
+            if len(quadras) != 1:
+                show_notification("Aviso", "Para partir de um lote clicado, informe uma única quadra!", "warning", 5000)
+                return
+            self._ativar_selecao_lote_inicial(conexao, quadras[0])
+
+        except Exception as e:
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro na ordenação pela geometria: {e}", Qgis.Critical)
+
+    def _ativar_selecao_lote_inicial(self, conexao, ins_quadra):
+        """Ativa ferramenta para clicar no lote que passa a ser o primeiro"""
+        camada_lotes = self._get_lotes_layer()
+        if not camada_lotes:
+            show_notification("Aviso", "Camada de lotes não encontrada!", "warning", 5000)
+            return
+
+        self.tool = QgsMapToolIdentifyFeature(self.iface.mapCanvas())
+        self.tool.setLayer(camada_lotes)
+        self.tool.featureIdentified.connect(
+            lambda feature: self._ao_clicar_lote_inicial(feature, conexao, ins_quadra))
+        self.iface.mapCanvas().setMapTool(self.tool)
+        self.iface.mainWindow().setCursor(Qt.PointingHandCursor)
+
+        show_notification("Ferramenta Ativa", f"Clique no primeiro lote da quadra {ins_quadra}", "info", 5000)
+
+    def _ao_clicar_lote_inicial(self, feature, conexao, ins_quadra):
+        """Usa o centroide do lote clicado como início do percurso"""
+        self._resetar_ferramenta_e_janela()
+        if not feature.isValid() or not feature.hasGeometry():
+            return
+        camada_quadras = self._get_quadra_layer()
+        if not camada_quadras:
+            show_notification("Aviso", "Camada 'Quadra' não encontrada!", "warning", 5000)
+            return
+        ponto = ponto_do_lote(feature.geometry(), self._get_lotes_layer(), camada_quadras)
+        self._ordenar_pela_geometria(conexao, [ins_quadra], ponto, "lote clicado")
+
+    def _ordenar_pela_geometria(self, conexao, quadras, inicio, descricao_inicio):
+        """Calcula a ordem pela geometria, confirma e agenda a gravação"""
+        try:
+            camada_quadras = self._get_quadra_layer()
+            camada_lotes = self._get_lotes_layer()
+            if not camada_quadras or not camada_lotes:
+                raise Exception("Camadas Quadra e de lotes são necessárias!")
+
+            linhas, relatorio = calcular_linhas_geometricas(camada_quadras, camada_lotes, quadras, inicio)
+            validas = [r['ins_quadra'] for r in relatorio if r['success']]
+            for r in relatorio:
+                self._log(f"Ordem pela geometria, quadra {r['ins_quadra']}: {r['message']}")
+
+            if not validas:
+                show_notification("Aviso", "Nenhuma quadra pôde ser ordenada pela geometria!", "warning", 5000)
+                return
+
+            ignoradas = len(relatorio) - len(validas)
+            resposta = QMessageBox.question(
+                self.dlg, "Confirmar Operação",
+                f"Ordenar {len(linhas)} lote(s) de {len(validas)} quadra(s) pelo perímetro, "
+                f"a partir do {descricao_inicio.lower()}?\n\n"
+                + (f"{ignoradas} quadra(s) ignorada(s), veja o log.\n\n" if ignoradas else "")
+                + "ATENÇÃO: Registros existentes serão substituídos!",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if resposta == QMessageBox.No:
+                return
+
+            gravadas = [] if modo_offline_configurado() else linhas_gravadas(conexao, validas)
+            if self._agendar_gravacao(f"Ordenar {len(validas)} quadra(s) pela geometria", conexao, validas,
+                                      linhas, f"{len(validas)} quadra(s) ordenada(s) pela geometria!",
+                                      instantaneos=self._montar_instantaneos(conexao, validas, gravadas),
+                                      versoes=versoes_das_linhas(gravadas, validas)):
+                show_notification("Processando", "Ordenação pela geometria adicionada à fila", "info", 2000)
 
-            return {'success': True, 'message': 'Ordem original restaurada com sucesso!'}
         except Exception as e:
-            self._log(f"Erro ao restaurar ordem: {e}", Qgis.Critical)
-            return {'success': False, 'message': f"Erro: {e}"}
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro na ordenação pela geometria: {e}", Qgis.Critical)
 
-    def organizar_ordem_lote(self, conexao, ins_quadra, ordem_primeira):
-        """Organiza ordem dos lotes"""
+    def executar_sequencia_clique(self):
+        """
+        Ativa a ferramenta para clicar nos lotes da quadra na ordem desejada
+
+        Os lotes e as linhas gravadas são lidos uma vez (da pré-busca, se
+        houver); os números aparecem na camada de prévia a cada clique e a
+        sequência é gravada de uma vez ao concluir (ver SequenciaClique.py).
+        """
         try:
+            conexao = self.dlg.cmbConexao.currentText()
+            ins_quadra = normalizar_quadra(self.dlg.lineInsQuadra.text())
+            if not conexao:
+                show_notification("Aviso", "Selecione uma conexão PostgreSQL!", "warning", 5000)
+                return
+            if not isinstance(ins_quadra, int) or ins_quadra == 99:
+                show_notification("Aviso", "Selecione uma quadra válida!", "warning", 5000)
+                return
             camada_lotes = self._get_lotes_layer()
             if not camada_lotes:
-                raise Exception("Camada de lotes não encontrada!")
+                show_notification("Aviso", "Camada de lotes não encontrada!", "warning", 5000)
+                return
 
-            camada_filtrada = self._filtrar_lotes_quadra(camada_lotes, ins_quadra)
+            entrada = self._pre_busca_valida(conexao, ins_quadra)
+            if entrada:
+                lotes, gravadas = entrada['lotes'], entrada['gravadas']
+            else:
+                lotes = self._ler_lotes_quadras(camada_lotes, [ins_quadra]).get(ins_quadra, [])
+                gravadas = [] if modo_offline_configurado() else linhas_gravadas(conexao, [ins_quadra])
+            if not lotes:
+                show_notification("Aviso", "Nenhum lote encontrado!", "warning", 5000)
+                return
+
+            if self.tool:
+                # Encerra a ferramenta anterior (e uma ordenação por cliques em andamento)
+                ferramenta, self.tool = self.tool, None
+                self.iface.mapCanvas().unsetMapTool(ferramenta)
+
+            if self.previa_mapa is None:
+                self.previa_mapa = PreviaMapa()
+            self.previa_mapa.carregar(camada_lotes, ins_quadra, lotes,
+                                      self._get_indice_lotes(camada_lotes).versao)
+            self.previa_mapa.mostrar_ordens({posicao: None for posicao in range(len(lotes))})
+
+            self.tool = FerramentaSequencia(self.iface.mapCanvas(), camada_lotes, lotes)
+            self.sessao_sequencia = {'conexao': conexao, 'ins_quadra': ins_quadra, 'lotes': lotes,
+                                     'gravadas': gravadas, 'clicaveis': len(self.tool.indice)}
+            self.tool.alterada.connect(self._ao_alterar_sequencia)
+            self.tool.concluida.connect(self._ao_concluir_sequencia)
+            self.tool.cancelada.connect(self._ao_cancelar_sequencia)
+            self.iface.mapCanvas().setMapTool(self.tool)
+            self.iface.mapCanvas().setFocus()
+
+            show_notification("Ferramenta Ativa",
+                              f"Clique nos lotes da quadra {ins_quadra} na ordem desejada. "
+                              "Botão direito desfaz, Enter conclui, Esc cancela", "info", 6000)
+        except Exception as e:
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro ao iniciar a ordenação por cliques: {e}", Qgis.Critical)
+
+    def _ao_alterar_sequencia(self, posicao, n_ordem):
+        if self.previa_mapa:
+            self.previa_mapa.mostrar_ordens({posicao: n_ordem})
+        if self.sessao_sequencia and self.tool:
+            self.iface.mainWindow().statusBar().showMessage(
+                f"Quadra {self.sessao_sequencia['ins_quadra']}: {len(self.tool.sequencia)} de "
+                f"{self.sessao_sequencia['clicaveis']} lote(s) clicado(s)")
+
+    def _encerrar_sequencia(self):
+        """Devolve o mapa e a prévia ao estado anterior à ordenação por cliques"""
+        sessao, self.sessao_sequencia = self.sessao_sequencia, None
+        if isinstance(self.tool, FerramentaSequencia) and not self.tool.isActive():
+            # Outra ferramenta já assumiu o mapa
+            self.tool = None
+        if self.iface:
+            self.iface.mainWindow().statusBar().clearMessage()
+        self._resetar_ferramenta_e_janela()
+        self.atualizar_previa_mapa()
+        return sessao
+
+    def _ao_cancelar_sequencia(self):
+        if self._encerrar_sequencia():
+            show_notification("Cancelado", "Ordenação por cliques cancelada", "warning", 3000)
+
+    def _ao_concluir_sequencia(self, sequencia):
+        """Confirma e agenda a gravação da ordem clicada, em uma única transação"""
+        sessao = self._encerrar_sequencia()
+        if not sessao:
+            return
+        conexao, ins_quadra = sessao['conexao'], sessao['ins_quadra']
+        if not sequencia:
+            show_notification("Aviso", "Nenhum lote foi clicado!", "warning", 4000)
+            return
+        try:
+            linhas = montar_linhas(ins_quadra, sessao['lotes'], sequencia=sequencia)
+            if modo_offline_configurado():
+                previa = self._previa_offline(linhas)
+            else:
+                previa = self._previa(linhas, sessao['gravadas'], MEDICAO_NULA)
+            if self._sem_alteracoes(previa):
+                show_notification("Aviso", f"A quadra {ins_quadra} já está com esta ordem!", "warning", 4000)
+                return
 
-            offset = sum(1 for f in camada_filtrada.getFeatures() if f['ordem'] >= ordem_primeira)
+            restantes = sum(1 for linha in linhas if linha['n_ordem'] is not None) - len(sequencia)
+            resposta = QMessageBox.question(
+                self.dlg, "Confirmar Operação",
+                f"Gravar a ordem clicada de {len(sequencia)} lote(s) da quadra {ins_quadra}?\n\n"
+                + (f"{restantes} lote(s) não clicado(s) seguem depois, na ordem original.\n\n"
+                   if restantes else "")
+                + f"{self._texto_pre_visualizacao(previa)}\n\n"
+                "ATENÇÃO: Registros existentes serão substituídos!",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if resposta == QMessageBox.No:
+                return
 
-            ordem_expr = f'''
-                CASE
-                    WHEN "ordem" >= {ordem_primeira} THEN "ordem" - ({ordem_primeira} - 1)
-                    WHEN "ordem" < {ordem_primeira} THEN "ordem" + {offset}
-                END
-            '''
+            if self._agendar_gravacao(f"Ordenar quadra {ins_quadra} por cliques", conexao, [ins_quadra], linhas,
+                                      f"Quadra {ins_quadra} ordenada pelos cliques!",
+                                      instantaneos=self._montar_instantaneos(conexao, [ins_quadra],
+                                                                             sessao['gravadas']),
+                                      versoes=versoes_das_linhas(sessao['gravadas'], [ins_quadra])):
+                show_notification("Processando", f"Quadra {ins_quadra} adicionada à fila de gravação", "info", 2000)
 
-            campos = self._preparar_campos_refactor()
-            campos[2]['expression'] = ordem_expr
-            
-            alg_params = {
-                'FIELDS_MAPPING': campos,
-                'INPUT': camada_filtrada,
-                'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
-            }
-            camada_processada = processing.run('native:refactorfields', alg_params)['OUTPUT']
+        except Exception as e:
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro na ordenação por cliques: {e}", Qgis.Critical)
+
+    def _texto_pre_visualizacao(self, previa):
+        """Texto da pré-visualização para as mensagens de confirmação"""
+        if not previa['success']:
+            return "Não foi possível pré-visualizar as alterações."
+        return f"Alterações previstas: {previa['message']}."
+
+    def _sem_alteracoes(self, previa):
+        diferencas = previa.get('diferencas')
+        return bool(diferencas) and not (
+            diferencas['atualizar'] or diferencas['inserir'] or diferencas['excluir'])
+
+    def _ao_concluir_tarefa(self, resultado):
+        """Mostra o resultado de uma tarefa de gravação"""
+        if resultado['success']:
+            show_notification("Sucesso!", resultado['message'], "success", 3500)
+        elif resultado.get('cancelada'):
+            show_notification("Cancelado", resultado['message'], "warning", 3500)
+        else:
+            show_notification("Erro", resultado['message'], "error", 4000)
+        self._log(resultado['message'], Qgis.Info if resultado['success'] else Qgis.Warning)
+
+    def _atualizar_fila(self, pendentes):
+        """Atualiza a barra de progresso e o botão de cancelar do diálogo"""
+        if not self.dlg or not hasattr(self.dlg, 'progressTarefa'):
+            return
+        self.dlg.btnCancelarTarefas.setEnabled(pendentes > 0)
+        if pendentes == 0:
+            self.dlg.progressTarefa.setValue(0)
+            self.dlg.progressTarefa.setFormat("Nenhuma tarefa em andamento")
 
-            self._importar_para_postgis(conexao, camada_processada)
+    def _mostrar_progresso_tarefa(self, descricao, valor):
+        if not self.dlg or not hasattr(self.dlg, 'progressTarefa'):
+            return
+        pendentes = self.fila_tarefas.pendentes() - 1 if self.fila_tarefas else 0
+        sufixo = f" (+{pendentes} na fila)" if pendentes > 0 else ""
+        self.dlg.progressTarefa.setValue(int(valor))
+        self.dlg.progressTarefa.setFormat(f"{descricao}: %p%{sufixo}")
+
+    def executar_varredura(self):
+        """
+        Verifica a ordenação de todas as quadras de uma vez (ver Varredura.py)
+
+        O resultado vai para a camada 'Verificação da ordenação' e, se o
+        usuário escolher um arquivo, para um CSV.
+        """
+        try:
+            if self.tarefa_varredura:
+                show_notification("Aviso", "A verificação das quadras já está em andamento", "warning", 4000)
+                return
+            camada_lotes = self._get_lotes_layer()
+            if not camada_lotes:
+                show_notification("Erro", "Camada de lotes não encontrada!", "error", 4000)
+                return
 
-            return {'success': True, 'message': 'Nova ordem atualizada com sucesso!'}
+            conexao = self._escolher_conexao("Verificação das Quadras")
+            if not conexao:
+                return
+            caminho_csv, _ = QFileDialog.getSaveFileName(
+                self.iface.mainWindow(), "Salvar relatório da verificação (opcional)", '', "CSV (*.csv)")
+
+            indice_lotes = self._get_indice_lotes(camada_lotes)
+            lotes_por_quadra = {q: lotes for q, lotes in indice_lotes.ler_com_nv_ordem().items()
+                                if isinstance(q, int)}
+
+            self.tarefa_varredura = TarefaVarredura(conexao, lotes_por_quadra)
+            self.tarefa_varredura.concluida.connect(
+                lambda resultado: self._ao_concluir_varredura(resultado, caminho_csv))
+            QgsApplication.taskManager().addTask(self.tarefa_varredura)
+            show_notification("Processando", f"Verificando {len(lotes_por_quadra)} quadra(s)...", "info", 3000)
         except Exception as e:
-            self._log(f"Erro ao organizar ordem: {e}", Qgis.Critical)
-            return {'success': False, 'message': f"Erro: {e}"}
+            self.tarefa_varredura = None
+            show_notification("Erro", f"Erro na verificação: {str(e)}", "error", 4000)
+            self._log(f"Erro ao iniciar a verificação das quadras: {e}", Qgis.Critical)
+
+    def _ao_concluir_varredura(self, resultado, caminho_csv):
+        self.tarefa_varredura = None
+        if not resultado['success']:
+            show_notification("Erro", resultado['message'], "error", 5000)
+            self._log(f"Verificação das quadras: {resultado['message']}", Qgis.Warning)
+            return
+        try:
+            relatorio = resultado['relatorio']
+            QgsProject.instance().addMapLayer(criar_camada_relatorio(relatorio, self._get_quadra_layer()))
+            if caminho_csv:
+                gravar_csv(relatorio, caminho_csv)
+            show_notification("Verificação Concluída", resultado['message'],
+                              "warning" if relatorio else "success", 5000)
+            self._log(f"Verificação das quadras: {resultado['message']}"
+                      + (f" (CSV: {caminho_csv})" if caminho_csv else ""))
+        except Exception as e:
+            show_notification("Erro", f"Erro ao gravar o relatório: {str(e)}", "error", 4000)
+            self._log(f"Erro ao gravar o relatório da verificação: {e}", Qgis.Critical)
+
+    def executar_rota_leitura(self):
+        """
+        Planeja e grava a rota de leitura de um setor ou de todos (ver RotaLeitura.py)
+
+        Os lotes de cada quadra são ordenados pelo perímetro aqui; a
+        sequência entre as quadras e a gravação rodam em segundo plano.
+        """
+        try:
+            if self.tarefa_rota:
+                show_notification("Aviso", "O planejamento das rotas já está em andamento", "warning", 4000)
+                return
+            if modo_offline_configurado():
+                show_notification("Aviso", "A rota de leitura requer conexão com o servidor!", "warning", 4000)
+                return
+            camada_quadras = self._get_quadra_layer()
+            camada_lotes = self._get_lotes_layer()
+            if not camada_quadras or not camada_lotes:
+                show_notification("Erro", "Camadas Quadra e de lotes são necessárias!", "error", 4000)
+                return
+            conexao = self._escolher_conexao("Rota de Leitura")
+            if not conexao:
+                return
+
+            por_setor = ler_setores(camada_quadras)
+            if not por_setor:
+                show_notification("Aviso", "Nenhuma quadra com setor na camada Quadra!", "warning", 4000)
+                return
+            todos = "Todos os setores"
+            opcoes = [todos] + sorted(por_setor)
+            escolha, ok = QInputDialog.getItem(
+                self.iface.mainWindow(), "Rota de Leitura", "Setor:", opcoes, 0, False)
+            if not ok:
+                return
+            if escolha != todos:
+                por_setor = {escolha: por_setor[escolha]}
+
+            quadras = [q for quadras_setor in por_setor.values() for q in quadras_setor]
+            resposta = QMessageBox.question(
+                self.iface.mainWindow(), "Confirmar Operação",
+                f"Planejar a rota de leitura de {len(por_setor)} setor(es), {len(quadras)} quadra(s)?\n\n"
+                "ATENÇÃO: A rota gravada desses setores será substituída!",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if resposta == QMessageBox.No:
+                return
+
+            percursos, _ = percorrer_quadras(camada_quadras, camada_lotes, quadras)
+            percursos_por_setor = {setor: {q: percursos[q] for q in quadras_setor if q in percursos}
+                                   for setor, quadras_setor in por_setor.items()}
+            percursos_por_setor = {setor: p for setor, p in percursos_por_setor.items() if p}
+            if not percursos_por_setor:
+                show_notification("Aviso", "Nenhum lote encontrado nas quadras dos setores!", "warning", 4000)
+                return
+
+            self.tarefa_rota = TarefaRota(conexao, percursos_por_setor)
+            self.tarefa_rota.concluida.connect(self._ao_concluir_rota_leitura)
+            QgsApplication.taskManager().addTask(self.tarefa_rota)
+            show_notification("Processando", f"Planejando a rota de {len(percursos_por_setor)} setor(es)...",
+                              "info", 3000)
+        except Exception as e:
+            self.tarefa_rota = None
+            show_notification("Erro", f"Erro na rota de leitura: {str(e)}", "error", 4000)
+            self._log(f"Erro ao iniciar o planejamento das rotas: {e}", Qgis.Critical)
+
+    def _ao_concluir_rota_leitura(self, resultado):
+        self.tarefa_rota = None
+        for item in resultado['relatorio']:
+            self._log(f"Rota do setor {item['setor']}: {item['quadras']} quadra(s), {item['lotes']} lote(s), "
+                      f"{item['comprimento']} (vizinho mais próximo: {item['comprimento_inicial']})")
+        if resultado['success']:
+            show_notification("Rota Gravada", resultado['message'], "success", 5000)
+        else:
+            show_notification("Erro", resultado['message'], "error", 5000)
+            self._log(f"Rota de leitura: {resultado['message']}", Qgis.Warning)
+
+    def executar_compactacao(self):
+        """
+        Renumera para 1..N, em segundo plano, as quadras da novaordem com lacunas ou repetições
+
+        Ver Compactacao.py: a ordem relativa é mantida e não se lê a camada
+        de lotes; cada grupo de quadras é uma transação.
+        """
+        try:
+            if self.tarefa_compactacao:
+                show_notification("Aviso", "A renumeração já está em andamento", "warning", 4000)
+                return
+            if modo_offline_configurado():
+                show_notification("Aviso", "A renumeração requer conexão com o servidor!", "warning", 4000)
+                return
+            conexao = self._escolher_conexao("Renumerar novaordem")
+            if not conexao:
+                return
+
+            resposta = QMessageBox.question(
+                self.iface.mainWindow(), "Confirmar Operação",
+                f"Renumerar para 1..N o n_ordem de todas as quadras da novaordem ({conexao}) com lacunas, "
+                "repetições ou que não começam em 1?\n\n"
+                "A ordem relativa dos lotes é mantida. O estado anterior de cada quadra vai para o "
+                "diário: o botão Desfazer volta a quadra ao n_ordem de antes da renumeração.",
+                QMessageBox.Yes | QMessageBox.No
+            )
+            if resposta == QMessageBox.No:
+                return
+
+            self.tarefa_compactacao = TarefaCompactacao(conexao)
+            self.tarefa_compactacao.concluida.connect(
+                lambda resultado: self._ao_concluir_compactacao(conexao, resultado))
+            QgsApplication.taskManager().addTask(self.tarefa_compactacao)
+            show_notification("Processando", "Renumerando a novaordem...", "info", 3000)
+        except Exception as e:
+            self.tarefa_compactacao = None
+            show_notification("Erro", f"Erro na renumeração: {str(e)}", "error", 4000)
+            self._log(f"Erro ao iniciar a renumeração: {e}", Qgis.Critical)
+
+    def _ao_concluir_compactacao(self, conexao, resultado):
+        """Guarda no diário o estado anterior das quadras renumeradas e descarta a pré-busca delas"""
+        self.tarefa_compactacao = None
+        if resultado['quadras']:
+            # Além do aviso da tarefa a cada grupo, o resumo da quadra
+            # selecionada é refeito com o n_ordem renumerado
+            self.pre_busca.invalidar(conexao, resultado['quadras'])
+            selecionada = normalizar_quadra(self.dlg.lineInsQuadra.text()) if self.dlg else None
+            if selecionada in resultado['quadras']:
+                self.iniciar_pre_busca(selecionada)
+            try:
+                # Só as linhas lidas pela tarefa: a renumeração não depende da camada de lotes
+                instantaneos = self._montar_instantaneos(conexao, resultado['quadras'], resultado['gravadas'],
+                                                         ler_lotes=False)
+                self._atualizar_diario(conexao, "Renumerar n_ordem (1..N)", {'success': True}, instantaneos)
+            except Exception as e:
+                self._log(f"Erro ao atualizar o diário após a renumeração: {e}", Qgis.Warning)
+        self._log(f"Renumeração da novaordem: {resultado['message']}",
+                  Qgis.Info if resultado['success'] else Qgis.Warning)
+        if resultado['success']:
+            show_notification("Renumeração Concluída", resultado['message'], "success", 5000)
+        else:
+            show_notification("Erro", resultado['message'], "error", 5000)
+
+    def cancelar_tarefas(self):
+        """Cancela a gravação em andamento e descarta as pendentes"""
+        if self.fila_tarefas:
+            self.fila_tarefas.cancelar_todas()
+
+    def alternar_modo_offline(self, ativo):
+        """
+        Liga ou desliga o modo offline (ver FilaOffline.py)
+
+        Ao ligar, ainda com conexão, guarda a versão de todas as quadras
+        gravadas no servidor, para a sincronização reconhecer os conflitos.
+        Ao desligar com operações na fila, oferece sincronizar.
+        """
+        configurar_modo_offline(ativo)
+        conexao = self.dlg.cmbConexao.currentText() if self.dlg else ''
+        try:
+            if ativo:
+                if not conexao:
+                    return
+                try:
+                    versoes = {q: versao_linhas(linhas) for q, linhas in linhas_gravadas_por_quadra(conexao).items()}
+                except Exception as e:
+                    self._log(f"Versões das quadras não lidas ao ligar o modo offline: {e}", Qgis.Warning)
+                    show_notification(
+                        "Modo Offline",
+                        "Sem conexão com o servidor: na sincronização, as quadras já gravadas no servidor "
+                        "serão tratadas como conflito", "warning", 6000)
+                    return
+                self._get_fila_offline().lembrar_versoes(conexao, versoes, substituir=True)
+                show_notification("Modo Offline", "As gravações vão para a fila local até a sincronização",
+                                  "info", 4000)
+                return
+
+            pendentes = self._get_fila_offline().pendentes(conexao) if conexao else 0
+            if pendentes:
+                resposta = QMessageBox.question(
+                    self.dlg, "Sincronizar Fila Offline",
+                    f"Há {pendentes} operação(ões) na fila offline. Sincronizar agora?",
+                    QMessageBox.Yes | QMessageBox.No
+                )
+                if resposta == QMessageBox.Yes:
+                    self.sincronizar_fila_offline()
+        except Exception as e:
+            show_notification("Erro", f"Erro no modo offline: {str(e)}", "error", 4000)
+            self._log(f"Erro ao alternar o modo offline: {e}", Qgis.Critical)
+        finally:
+            self._atualizar_botao_sincronizar()
+
+    def _atualizar_botao_sincronizar(self, *args):
+        """Mostra no botão Sincronizar quantas operações da conexão estão na fila offline"""
+        if not self.dlg or not hasattr(self.dlg, 'btnSincronizarOffline'):
+            return
+        conexao = self.dlg.cmbConexao.currentText()
+        try:
+            pendentes = self._get_fila_offline().pendentes(conexao) if conexao else 0
+        except Exception as e:
+            self._log(f"Erro ao ler a fila offline: {e}", Qgis.Warning)
+            pendentes = 0
+        self.dlg.btnSincronizarOffline.setText(f"🔄  Sincronizar ({pendentes})" if pendentes else "🔄  Sincronizar")
+        self.dlg.btnSincronizarOffline.setEnabled(pendentes > 0 and self.tarefa_sincronizacao is None)
+
+    def sincronizar_fila_offline(self, quadras=None, forcar=False):
+        """
+        Grava no servidor, em segundo plano e em uma única transação, a fila offline da conexão
+
+        Args:
+            quadras: Só estas quadras da fila (padrão: todas)
+            forcar: Se True, sobrescreve as quadras em conflito
+        """
+        try:
+            if self.tarefa_sincronizacao:
+                show_notification("Aviso", "A sincronização já está em andamento", "warning", 4000)
+                return
+            conexao = self.dlg.cmbConexao.currentText()
+            if not conexao:
+                show_notification("Aviso", "Selecione uma conexão PostgreSQL!", "warning", 5000)
+                return
+            if not suporta_transacao():
+                show_notification("Aviso", "Sincronizar requer o psycopg2 ou o QGIS 3.10+!", "warning", 5000)
+                return
+            if not self._get_fila_offline().pendentes(conexao):
+                show_notification("Aviso", "A fila offline está vazia!", "warning", 4000)
+                return
+
+            self.tarefa_sincronizacao = TarefaSincronizacao(self._get_fila_offline(), conexao, quadras, forcar)
+            self.tarefa_sincronizacao.concluida.connect(
+                lambda resultado: self._ao_concluir_sincronizacao(conexao, resultado))
+            QgsApplication.taskManager().addTask(self.tarefa_sincronizacao)
+            self._atualizar_botao_sincronizar()
+            show_notification("Processando", "Sincronizando a fila offline...", "info", 2000)
+        except Exception as e:
+            self.tarefa_sincronizacao = None
+            show_notification("Erro", f"Erro na sincronização: {str(e)}", "error", 4000)
+            self._log(f"Erro ao iniciar a sincronização: {e}", Qgis.Critical)
+
+    def _ao_concluir_sincronizacao(self, conexao, resultado):
+        """Guarda no diário o estado anterior das quadras gravadas e trata os conflitos"""
+        self.tarefa_sincronizacao = None
+        self._atualizar_botao_sincronizar()
+        if resultado['sincronizadas']:
+            try:
+                instantaneos = self._montar_instantaneos(conexao, resultado['sincronizadas'], resultado['gravadas'])
+                self._atualizar_diario(conexao, "Sincronizar fila offline", {'success': True}, instantaneos)
+            except Exception as e:
+                self._log(f"Erro ao atualizar o diário após a sincronização: {e}", Qgis.Warning)
+
+        self._log(f"Fila offline: {resultado['message']}", Qgis.Info if resultado['success'] else Qgis.Warning)
+        if not resultado['success']:
+            show_notification("Erro", resultado['message'], "error", 5000)
+            return
+        mensagem = resultado['message']
+        if resultado['alteracoes']:
+            mensagem += f"\n{descrever_contagem(resultado['alteracoes'])}"
+        show_notification("Sincronizado", mensagem, "success", 5000)
+
+        conflitos = resultado['conflitos']
+        if not conflitos:
+            return
+        resposta = QMessageBox.question(
+            self.dlg, "Conflitos na Sincronização",
+            f"A(s) quadra(s) {', '.join(str(q) for q in conflitos)} foi(ram) gravada(s) no servidor por outra "
+            f"sessão enquanto você estava offline.\n\n"
+            "Sim: sobrescrever com a ordem da fila offline\n"
+            "Não: manter na fila para decidir depois\n"
+            "Descartar: apagar da fila as operações dessas quadras",
+            QMessageBox.Yes | QMessageBox.No | QMessageBox.Discard,
+            QMessageBox.No
+        )
+        if resposta == QMessageBox.Yes:
+            self.sincronizar_fila_offline(conflitos, forcar=True)
+        elif resposta == QMessageBox.Discard:
+            self._get_fila_offline().descartar(conexao, conflitos)
+            self._atualizar_botao_sincronizar()
+            show_notification("Fila Offline", f"{len(conflitos)} quadra(s) descartada(s) da fila", "warning", 4000)
 
     def _validar_entrada_organizacao(self, conexao, ins_quadra, ordem_primeira):
         """Valida entradas antes de organizar"""
@@ -354,6 +1508,8 @@ class OrganizadorDeLotes:
 
     def executar_organizacao(self):
         """Executa organização dos lotes"""
+        medicao = MEDICAO_NULA
+        entregue = False
         try:
             conexao = self.dlg.cmbConexao.currentText()
             ins_quadra = self.dlg.lineInsQuadra.text()
@@ -368,7 +1524,11 @@ class OrganizadorDeLotes:
             if not self._validar_entrada_organizacao(conexao, ins_quadra, ordem_primeira):
                 return
 
-            num_lotes = self.contar_lotes_na_quadra(ins_quadra, 'OrganizarLotes')
+            medicao = iniciar_operacao(f"Reorganizar quadra {ins_quadra}", ins_quadra=int(ins_quadra),
+                                       ordem_primeira=ordem_primeira)
+            with medicao.etapa('contar_lotes') as etapa:
+                num_lotes = self.contar_lotes_na_quadra(ins_quadra, 'OrganizarLotes')
+                etapa.registrar(linhas=num_lotes)
             if num_lotes == 0:
                 show_notification("Aviso", "Nenhum lote encontrado!", "warning", 5000)
                 self._resetar_ferramenta_e_janela()
@@ -384,9 +1544,60 @@ class OrganizadorDeLotes:
                 self._resetar_ferramenta_e_janela()
                 return
 
+            previa = self.pre_visualizar_quadra(conexao, ins_quadra, ordem_primeira, medicao)
+            if self._sem_alteracoes(previa):
+                show_notification("Aviso", f"A quadra {ins_quadra} já está com esta ordem!", "warning", 4000)
+                return
+
+            with medicao.etapa('confirmacao'):
+                resposta = QMessageBox.question(
+                    self.dlg, "Confirmar Operação",
+                    f"Reorganizar lotes da quadra {ins_quadra} a partir da ordem {ordem_primeira}?\n\n"
+                    f"{self._texto_pre_visualizacao(previa)}\n\n"
+                    f"ATENÇÃO: Registros existentes serão substituídos!",
+                    QMessageBox.Yes | QMessageBox.No
+                )
+
+            if resposta == QMessageBox.No:
+                return
+
+            entregue = True
+            if self.enfileirar_organizacao(conexao, ins_quadra, ordem_primeira, previa, medicao):
+                show_notification("Processando", f"Quadra {ins_quadra} adicionada à fila de gravação", "info", 2000)
+
+        except Exception as e:
+            medicao.finalizar(False, erro=str(e))
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro na execução: {e}", Qgis.Critical)
+        finally:
+            if not entregue:
+                medicao.finalizar(False)
+
+    def executar_organizacao_lote(self):
+        """Executa organização de várias quadras de uma vez"""
+        try:
+            conexao = self.dlg.cmbConexao.currentText()
+            texto_quadras = self.dlg.lineQuadrasLote.text()
+            texto_ordem = self.dlg.lineOrdemPrimeira.text()
+            ordem_padrao = int(texto_ordem) if texto_ordem.isdigit() else 1
+
+            if not conexao:
+                show_notification("Aviso", "Selecione uma conexão PostgreSQL!", "warning", 5000)
+                return
+
+            try:
+                quadras = interpretar_lista_quadras(texto_quadras, max(ordem_padrao, 1))
+            except ValueError as e:
+                show_notification("Aviso", str(e), "warning", 5000)
+                return
+
+            if not quadras:
+                show_notification("Aviso", "Informe as quadras do lote!", "warning", 5000)
+                return
+
             resposta = QMessageBox.question(
                 self.dlg, "Confirmar Operação",
-                f"Reorganizar lotes da quadra {ins_quadra} a partir da ordem {ordem_primeira}?\n\n"
+                f"Reorganizar {len(quadras)} quadra(s) em lote?\n\n"
                 f"ATENÇÃO: Registros existentes serão substituídos!",
                 QMessageBox.Yes | QMessageBox.No
             )
@@ -394,31 +1605,25 @@ class OrganizadorDeLotes:
             if resposta == QMessageBox.No:
                 return
 
-            show_notification("Processando", "Reorganizando lotes...", "info", 2000)
+            resultado = self.enfileirar_lote_de_quadras(conexao, quadras)
 
-            if not self.excluir_ins_quadra_existente(conexao, ins_quadra):
-                show_notification("Erro", "Erro ao excluir registros existentes!", "error", 4000)
-                return
-
-            resultado = self.organizar_ordem_lote(conexao, ins_quadra, ordem_primeira)
-            
+            ignoradas = [r for r in resultado['relatorio'] if not r['success']]
             if resultado['success']:
-                show_notification(
-                    "Sucesso!",
-                    f"Quadra {ins_quadra} reorganizada com sucesso!",
-                    "success",
-                    3500
-                )
-                self.dlg.close()
+                mensagem = resultado['message']
+                if ignoradas:
+                    mensagem += f"\n{len(ignoradas)} quadra(s) ignorada(s), veja o log."
+                show_notification("Processando", mensagem, "info", 3000)
             else:
                 show_notification("Erro", resultado['message'], "error", 4000)
 
         except Exception as e:
             show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
-            self._log(f"Erro na execução: {e}", Qgis.Critical)
+            self._log(f"Erro na execução em lote: {e}", Qgis.Critical)
 
     def executar_exclusao_novaordem(self):
         """Exclui novaordem e restaura ordem original"""
+        medicao = MEDICAO_NULA
+        entregue = False
         try:
             conexao = self.dlg.cmbConexao.currentText()
             ins_quadra_text = self.dlg.lineInsQuadra.text()
@@ -434,7 +1639,11 @@ class OrganizadorDeLotes:
                 self._resetar_ferramenta_e_janela()
                 return
 
-            if not self.contar_lotes_na_quadra(ins_quadra, 'Reorganizar'):
+            medicao = iniciar_operacao(f"Restaurar quadra {ins_quadra}", ins_quadra=ins_quadra)
+            with medicao.etapa('verificar_alterada'):
+                alterada = self.contar_lotes_na_quadra(ins_quadra, 'Reorganizar')
+
+            if not alterada:
                 show_notification(
                     "Aviso",
                     f"A quadra {ins_quadra} já está com a ordem original!",
@@ -444,39 +1653,96 @@ class OrganizadorDeLotes:
                 self._resetar_ferramenta_e_janela()
                 return
 
-            resposta = QMessageBox.question(
-                self.dlg, "Confirmar Exclusão e Restauração",
-                f"Você deseja restaurar a ordem da quadra ({ins_quadra}) para a ordem original?\n\n"
-                f"ATENÇÃO: Será preenchida com valores do campo 'ordem' original!",
-                QMessageBox.Yes | QMessageBox.No
-            )
+            # Com um instantâneo no diário a ordem original vem dele, sem reler a camada de lotes;
+            # a reaplicação confere o servidor, então no modo offline a ordem vem da camada
+            instantaneo = (self._ultimo_instantaneo(conexao, ins_quadra)
+                           if suporta_transacao() and not modo_offline_configurado() else None)
+            if restauravel(instantaneo):
+                previa = self.pre_visualizar_instantaneo(
+                    conexao, instantaneo, linhas_restauracao(instantaneo), medicao)
+            else:
+                previa = self.pre_visualizar_quadra(conexao, ins_quadra, medicao=medicao)
+
+            with medicao.etapa('confirmacao'):
+                resposta = QMessageBox.question(
+                    self.dlg, "Confirmar Exclusão e Restauração",
+                    f"Você deseja restaurar a ordem da quadra ({ins_quadra}) para a ordem original?\n\n"
+                    f"{self._texto_pre_visualizacao(previa)}\n\n"
+                    f"ATENÇÃO: Será preenchida com valores do campo 'ordem' original!",
+                    QMessageBox.Yes | QMessageBox.No
+                )
 
             if resposta == QMessageBox.No:
                 return
 
-            show_notification("Processando", "Restaurando ordem original...", "info", 2000)
+            entregue = True
+            if self.enfileirar_restauracao(conexao, ins_quadra, previa, medicao):
+                show_notification("Processando", f"Restauração da quadra {ins_quadra} adicionada à fila", "info", 2000)
 
-            if not self.excluir_ins_quadra_existente(conexao, ins_quadra):
-                show_notification("Erro", "Erro ao excluir registros!", "error", 4000)
-                self._resetar_ferramenta_e_janela()
+        except Exception as e:
+            medicao.finalizar(False, erro=str(e))
+            show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
+            self._log(f"Erro: {e}", Qgis.Critical)
+        finally:
+            if not entregue:
+                medicao.finalizar(False)
+
+    def executar_desfazer(self):
+        """Volta a quadra ao estado anterior à última gravação, pelo diário"""
+        try:
+            conexao = self.dlg.cmbConexao.currentText()
+            ins_quadra_text = self.dlg.lineInsQuadra.text()
+            ins_quadra = int(ins_quadra_text) if ins_quadra_text.isdigit() else 0
+
+            if not conexao:
+                show_notification("Aviso", "Selecione uma conexão PostgreSQL!", "warning", 5000)
                 return
 
-            resultado = self.restaurar_ordem_original(conexao, ins_quadra)
-            
-            if resultado['success']:
-                show_notification(
-                    "Sucesso!",
-                    f"Quadra {ins_quadra} restaurada para ordem original!",
-                    "success",
-                    5000
-                )
-                self.dlg.close()
-            else:
-                show_notification("Erro", resultado['message'], "error", 4000)
+            if ins_quadra in (0, 99):
+                show_notification("Aviso", "Selecione uma quadra válida!", "warning", 5000)
+                return
+
+            if not suporta_transacao():
+                show_notification("Aviso", "Desfazer requer o psycopg2 ou o QGIS 3.10+!", "warning", 5000)
+                return
+
+            if modo_offline_configurado():
+                show_notification("Aviso", "Desfazer requer conexão com o servidor: desligue o modo offline!",
+                                  "warning", 5000)
+                return
+
+            instantaneo = self._ultimo_instantaneo(conexao, ins_quadra)
+            if instantaneo is None:
+                show_notification("Aviso", f"Nada a desfazer na quadra {ins_quadra}!", "warning", 4000)
+                return
+
+            previa = self.pre_visualizar_instantaneo(conexao, instantaneo, linhas_desfazer(instantaneo))
+            if not previa['success']:
+                show_notification("Erro", previa['message'], "error", 4000)
+                return
+
+            restantes = self._get_diario().niveis_disponiveis(conexao, ins_quadra) - 1
+            aviso = (f"\n{instantaneo['sem_matricula']} linha(s) sem matrícula não podem ser recuperadas."
+                     if instantaneo['sem_matricula'] else "")
+            resposta = QMessageBox.question(
+                self.dlg, "Confirmar Desfazer",
+                f"Desfazer '{instantaneo['descricao']}' ({instantaneo['data']}) na quadra {ins_quadra}?\n\n"
+                f"{self._texto_pre_visualizacao(previa)}{aviso}\n\n"
+                f"Depois desta, restará(ão) {restantes} etapa(s) para desfazer.",
+                QMessageBox.Yes | QMessageBox.No
+            )
+
+            if resposta == QMessageBox.No:
+                return
+
+            if self._agendar_gravacao(f"Desfazer quadra {ins_quadra}", conexao, [ins_quadra], previa['linhas'],
+                                      f"Quadra {ins_quadra}: '{instantaneo['descricao']}' desfeito!",
+                                      reaplicar=True, desfeito=instantaneo['id'], versoes=previa.get('versoes')):
+                show_notification("Processando", f"Desfazer da quadra {ins_quadra} adicionado à fila", "info", 2000)
 
         except Exception as e:
             show_notification("Erro", f"Erro na execução: {str(e)}", "error", 4000)
-            self._log(f"Erro: {e}", Qgis.Critical)
+            self._log(f"Erro ao desfazer: {e}", Qgis.Critical)
 
     def run (self):
         """Processa o algoritmo principal"""
@@ -511,8 +1777,37 @@ class OrganizadorDeLotes:
             if hasattr(self.dlg, 'btnExcluirNovaOrdem'):
                 self.dlg.btnExcluirNovaOrdem.clicked.connect(self.executar_exclusao_novaordem)
 
+            if hasattr(self.dlg, 'btnDesfazer'):
+                self.dlg.btnDesfazer.clicked.connect(self.executar_desfazer)
+
+            if hasattr(self.dlg, 'btnExecutarLote'):
+                self.dlg.btnExecutarLote.clicked.connect(self.executar_organizacao_lote)
+
+            if hasattr(self.dlg, 'btnOrdenarGeometria'):
+                self.dlg.btnOrdenarGeometria.clicked.connect(self.executar_ordenacao_geometrica)
+
+            if hasattr(self.dlg, 'btnSequenciaClique') and self.iface:
+                self.dlg.btnSequenciaClique.clicked.connect(self.executar_sequencia_clique)
+
+            if hasattr(self.dlg, 'btnCancelarTarefas'):
+                self.dlg.btnCancelarTarefas.clicked.connect(self.cancelar_tarefas)
+
+            if hasattr(self.dlg, 'chkOffline'):
+                self.dlg.chkOffline.setChecked(modo_offline_configurado())
+                self.dlg.chkOffline.toggled.connect(self.alternar_modo_offline)
+                self.dlg.btnSincronizarOffline.clicked.connect(lambda: self.sincronizar_fila_offline())
+                self.dlg.cmbConexao.currentTextChanged.connect(self._atualizar_botao_sincronizar)
+
+            if hasattr(self.dlg, 'chkPreviaMapa'):
+                self.dlg.chkPreviaMapa.toggled.connect(self.atualizar_previa_mapa)
+                self.dlg.lineOrdemPrimeira.textChanged.connect(self.atualizar_previa_mapa)
+                self.dlg.finished.connect(self._fechar_previa_mapa)
+
+        self._atualizar_botao_sincronizar()
+
+        # Diálogo não modal: o mapa continua disponível enquanto as tarefas gravam
         self.dlg.show()
-        if hasattr(self.dlg, 'exec_'):
-            self.dlg.exec_()
+        self.dlg.raise_()
+        self.dlg.activateWindow()
         
         return {}
\ No newline at end of file
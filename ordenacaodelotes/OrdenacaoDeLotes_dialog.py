@@ -7,10 +7,11 @@ Tema: Embasa
 
 from qgis.PyQt.QtWidgets import (
     QDialog, QVBoxLayout, QHBoxLayout, QLabel, QComboBox, 
-    QPushButton, QLineEdit, QFrame, QGraphicsDropShadowEffect, QSizePolicy
+    QPushButton, QLineEdit, QFrame, QGraphicsDropShadowEffect, QSizePolicy,
+    QProgressBar, QCheckBox, QScrollArea
 )
 from qgis.PyQt.QtCore import Qt, QPropertyAnimation, QEasingCurve, pyqtProperty
-from qgis.PyQt.QtGui import QColor, QFont, QPainter, QPainterPath, QLinearGradient, QPixmap, QImage
+from qgis.PyQt.QtGui import QColor, QFont, QPainter, QPainterPath, QLinearGradient, QPixmap, QImage, QGuiApplication
 import os
 
 
@@ -132,12 +133,20 @@ class OrganizadorDeLotesDialog(QDialog):
     def __init__(self, parent=None):
         super().__init__(parent)
         self.setWindowTitle("Organizador de Lotes")
-        self.setFixedSize(530, 530)
+        self.setMinimumWidth(530)
         self.setWindowFlags(Qt.Dialog | Qt.WindowCloseButtonHint)
         
         self.setup_ui()
         self.apply_styles()
         self.load_logo()
+        self.ajustar_altura()
+    
+    def ajustar_altura(self, altura=900):
+        """Usa a altura desejada ou a da tela, se menor (o conteúdo rola)"""
+        tela = QGuiApplication.primaryScreen()
+        if tela is not None:
+            altura = min(altura, tela.availableGeometry().height() - 60)
+        self.resize(530, max(altura, 300))
         
     def setup_ui(self):
         """Configura a interface do usuário"""
@@ -223,6 +232,25 @@ class OrganizadorDeLotesDialog(QDialog):
         self.cmbConexao.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         conexao_card.layout().addWidget(self.cmbConexao)
         
+        offline_layout = QHBoxLayout()
+        offline_layout.setSpacing(8)
+        
+        self.chkOffline = QCheckBox("Trabalhar offline (fila local)")
+        self.chkOffline.setObjectName("chkOffline")
+        self.chkOffline.setFont(QFont("Segoe UI", 8))
+        self.chkOffline.setCursor(Qt.PointingHandCursor)
+        offline_layout.addWidget(self.chkOffline)
+        
+        self.btnSincronizarOffline = ModernButton("🔄  Sincronizar", "secondary")
+        self.btnSincronizarOffline.setObjectName("btnSincronizarOffline")
+        self.btnSincronizarOffline.setCursor(Qt.PointingHandCursor)
+        self.btnSincronizarOffline.setFont(QFont("Segoe UI", 8, QFont.DemiBold))
+        self.btnSincronizarOffline.setMinimumHeight(22)
+        self.btnSincronizarOffline.setMaximumHeight(22)
+        self.btnSincronizarOffline.setEnabled(False)
+        offline_layout.addWidget(self.btnSincronizarOffline)
+        conexao_card.layout().addLayout(offline_layout)
+        
         content_layout.addWidget(conexao_card)
         
         # ===== CARD 2: NOVA ORDEM =====
@@ -243,6 +271,12 @@ class OrganizadorDeLotesDialog(QDialog):
         self.lineOrdemPrimeira.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         ordem_card.layout().addWidget(self.lineOrdemPrimeira)
         
+        self.chkPreviaMapa = QCheckBox("Pré-visualizar a nova ordem no mapa")
+        self.chkPreviaMapa.setObjectName("chkPreviaMapa")
+        self.chkPreviaMapa.setFont(QFont("Segoe UI", 8))
+        self.chkPreviaMapa.setCursor(Qt.PointingHandCursor)
+        ordem_card.layout().addWidget(self.chkPreviaMapa)
+        
         content_layout.addWidget(ordem_card)
         
         # ===== CARD 3: QUADRA =====
@@ -263,6 +297,13 @@ class OrganizadorDeLotesDialog(QDialog):
         self.lineInsQuadra.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
         quadra_card.layout().addWidget(self.lineInsQuadra)
         
+        self.lblResumoQuadra = QLabel("")
+        self.lblResumoQuadra.setObjectName("lblResumoQuadra")
+        self.lblResumoQuadra.setFont(QFont("Segoe UI", 8))
+        self.lblResumoQuadra.setAlignment(Qt.AlignCenter)
+        self.lblResumoQuadra.setMinimumHeight(16)
+        quadra_card.layout().addWidget(self.lblResumoQuadra)
+        
         # Botão selecionar dentro do card
         self.btnSelecionarQuadra = ModernButton("🗺️  Selecionar no Mapa", "secondary")
         self.btnSelecionarQuadra.setObjectName("btnSelecionarQuadra")
@@ -274,6 +315,72 @@ class OrganizadorDeLotesDialog(QDialog):
         
         content_layout.addWidget(quadra_card)   
         
+        # ===== CARD 4: LOTE DE QUADRAS =====
+        lote_card = self.create_input_card(
+            "🧮",
+            "Quadras em Lote",
+            "Ex.: 101-120:1; 130:3 (quadra ou intervalo : ordem inicial)"
+        )
+        
+        self.lineQuadrasLote = QLineEdit()
+        self.lineQuadrasLote.setObjectName("lineQuadrasLote")
+        self.lineQuadrasLote.setPlaceholderText("101-120:1; 130:3")
+        self.lineQuadrasLote.setFont(QFont("Segoe UI", 8))
+        self.lineQuadrasLote.setMinimumHeight(30)
+        self.lineQuadrasLote.setMaximumHeight(30)
+        self.lineQuadrasLote.setAlignment(Qt.AlignCenter)
+        self.lineQuadrasLote.setSizePolicy(QSizePolicy.Expanding, QSizePolicy.Fixed)
+        lote_card.layout().addWidget(self.lineQuadrasLote)
+        
+        self.btnExecutarLote = ModernButton("📦  Organizar Quadras em Lote", "secondary")
+        self.btnExecutarLote.setObjectName("btnExecutarLote")
+        self.btnExecutarLote.setCursor(Qt.PointingHandCursor)
+        self.btnExecutarLote.setFont(QFont("Segoe UI", 8, QFont.DemiBold))
+        self.btnExecutarLote.setMinimumHeight(30)
+        self.btnExecutarLote.setMaximumHeight(30)
+        lote_card.layout().addWidget(self.btnExecutarLote)
+        
+        content_layout.addWidget(lote_card)
+        
+        # ===== CARD 5: ORDEM PELA GEOMETRIA =====
+        geometria_card = self.create_input_card(
+            "📐",
+            "Ordem pela Geometria",
+            "Percorre a quadra no sentido horário ou segue os lotes clicados"
+        )
+        
+        geometria_layout = QHBoxLayout()
+        geometria_layout.setSpacing(8)
+        
+        self.cmbCantoInicial = ModernComboBox()
+        self.cmbCantoInicial.setObjectName("cmbCantoInicial")
+        self.cmbCantoInicial.setFont(QFont("Segoe UI", 8))
+        self.cmbCantoInicial.setMinimumHeight(30)
+        for texto, valor in (("Noroeste", "noroeste"), ("Nordeste", "nordeste"),
+                             ("Sudeste", "sudeste"), ("Sudoeste", "sudoeste"),
+                             ("Lote clicado no mapa", "lote")):
+            self.cmbCantoInicial.addItem(texto, valor)
+        geometria_layout.addWidget(self.cmbCantoInicial)
+        
+        self.btnOrdenarGeometria = ModernButton("📐  Ordenar pelo Perímetro", "secondary")
+        self.btnOrdenarGeometria.setObjectName("btnOrdenarGeometria")
+        self.btnOrdenarGeometria.setCursor(Qt.PointingHandCursor)
+        self.btnOrdenarGeometria.setFont(QFont("Segoe UI", 8, QFont.DemiBold))
+        self.btnOrdenarGeometria.setMinimumHeight(30)
+        self.btnOrdenarGeometria.setMaximumHeight(30)
+        geometria_layout.addWidget(self.btnOrdenarGeometria)
+        
+        geometria_card.layout().addLayout(geometria_layout)
+        
+        self.btnSequenciaClique = ModernButton("👆  Clicar nos Lotes na Ordem Desejada", "secondary")
+        self.btnSequenciaClique.setObjectName("btnSequenciaClique")
+        self.btnSequenciaClique.setCursor(Qt.PointingHandCursor)
+        self.btnSequenciaClique.setFont(QFont("Segoe UI", 8, QFont.DemiBold))
+        self.btnSequenciaClique.setMinimumHeight(30)
+        self.btnSequenciaClique.setMaximumHeight(30)
+        geometria_card.layout().addWidget(self.btnSequenciaClique)
+        content_layout.addWidget(geometria_card)
+        
         content_layout.addSpacing(5)
         
         # ===== BOTÕES PRINCIPAIS =====
@@ -291,12 +398,56 @@ class OrganizadorDeLotesDialog(QDialog):
         self.btnExcluirNovaOrdem.setFont(QFont("Segoe UI", 10, QFont.DemiBold))
         self.btnExcluirNovaOrdem.setMinimumHeight(30)
         self.btnExcluirNovaOrdem.setMaximumHeight(30)
-        content_layout.addWidget(self.btnExcluirNovaOrdem)
+        
+        self.btnDesfazer = ModernButton("⏪  Desfazer", "secondary")
+        self.btnDesfazer.setObjectName("btnDesfazer")
+        self.btnDesfazer.setCursor(Qt.PointingHandCursor)
+        self.btnDesfazer.setFont(QFont("Segoe UI", 10, QFont.DemiBold))
+        self.btnDesfazer.setMinimumHeight(30)
+        self.btnDesfazer.setMaximumHeight(30)
+        
+        restaurar_layout = QHBoxLayout()
+        restaurar_layout.setSpacing(8)
+        restaurar_layout.addWidget(self.btnExcluirNovaOrdem, 2)
+        restaurar_layout.addWidget(self.btnDesfazer, 1)
+        content_layout.addLayout(restaurar_layout)
+        
+        # ===== FILA DE TAREFAS =====
+        fila_layout = QHBoxLayout()
+        fila_layout.setSpacing(8)
+        
+        self.progressTarefa = QProgressBar()
+        self.progressTarefa.setObjectName("progressTarefa")
+        self.progressTarefa.setFont(QFont("Segoe UI", 8))
+        self.progressTarefa.setMaximumHeight(22)
+        self.progressTarefa.setRange(0, 100)
+        self.progressTarefa.setValue(0)
+        self.progressTarefa.setFormat("Nenhuma tarefa em andamento")
+        fila_layout.addWidget(self.progressTarefa)
+        
+        self.btnCancelarTarefas = ModernButton("⏹️  Cancelar", "danger")
+        self.btnCancelarTarefas.setObjectName("btnCancelarTarefas")
+        self.btnCancelarTarefas.setCursor(Qt.PointingHandCursor)
+        self.btnCancelarTarefas.setFont(QFont("Segoe UI", 8, QFont.DemiBold))
+        self.btnCancelarTarefas.setMinimumHeight(22)
+        self.btnCancelarTarefas.setMaximumHeight(22)
+        self.btnCancelarTarefas.setEnabled(False)
+        fila_layout.addWidget(self.btnCancelarTarefas)
+        
+        content_layout.addLayout(fila_layout)
         
         content_layout.addStretch()
         
         container_layout.addWidget(content_frame)
-        main_layout.addWidget(main_container)
+        
+        # Em telas baixas o conteúdo rola em vez de ser cortado
+        scroll_area = QScrollArea(self)
+        scroll_area.setObjectName("scrollPrincipal")
+        scroll_area.setWidgetResizable(True)
+        scroll_area.setFrameShape(QFrame.NoFrame)
+        scroll_area.setHorizontalScrollBarPolicy(Qt.ScrollBarAlwaysOff)
+        scroll_area.setWidget(main_container)
+        main_layout.addWidget(scroll_area)
     
     def create_input_card(self, icon, title, description):
         """Cria card de input estilizado"""
@@ -348,6 +499,11 @@ class OrganizadorDeLotesDialog(QDialog):
                 border-radius: 0px;
             }
             
+            QScrollArea#scrollPrincipal {
+                background-color: white;
+                border: none;
+            }
+            
             /* Header com gradiente Embasa */
             QFrame#headerFrame {
                 background: qlineargradient(x1:0, y1:0, x2:1, y2:1,
@@ -388,8 +544,17 @@ class OrganizadorDeLotesDialog(QDialog):
                 color: #6c757d;
             }
             
+            QLabel#lblResumoQuadra {
+                color: #495057;
+            }
+            
+            QCheckBox#chkPreviaMapa {
+                color: #495057;
+                spacing: 6px;
+            }
+            
             /* ComboBox */
-            QComboBox#cmbConexao {
+            QComboBox#cmbConexao, QComboBox#cmbCantoInicial {
                 background-color: white;
                 border: 2px solid #dee2e6;
                 border-radius: 10px;
@@ -397,28 +562,28 @@ class OrganizadorDeLotesDialog(QDialog):
                 color: #495057;
             }
             
-            QComboBox#cmbConexao:hover {
+            QComboBox#cmbConexao:hover, QComboBox#cmbCantoInicial:hover {
                 border: 2px solid #4fa3d1;
             }
             
-            QComboBox#cmbConexao:focus {
+            QComboBox#cmbConexao:focus, QComboBox#cmbCantoInicial:focus {
                 border: 2px solid #003d7a;
                 background-color: #f0f8ff;
             }
             
-            QComboBox#cmbConexao::drop-down {
+            QComboBox#cmbConexao::drop-down, QComboBox#cmbCantoInicial::drop-down {
                 border: none;
                 width: 30px;
             }
             
-            QComboBox#cmbConexao::down-arrow {
+            QComboBox#cmbConexao::down-arrow, QComboBox#cmbCantoInicial::down-arrow {
                 border-left: 5px solid transparent;
                 border-right: 5px solid transparent;
                 border-top: 6px solid #6c757d;
                 margin-right: 10px;
             }
             
-            QComboBox#cmbConexao QAbstractItemView {
+            QComboBox#cmbConexao QAbstractItemView, QComboBox#cmbCantoInicial QAbstractItemView {
                 background-color: white;
                 border: 2px solid #dee2e6;
                 border-radius: 10px;
@@ -428,12 +593,12 @@ class OrganizadorDeLotesDialog(QDialog):
                 outline: none;
             }
             
-            QComboBox#cmbConexao QAbstractItemView::item {
+            QComboBox#cmbConexao QAbstractItemView::item, QComboBox#cmbCantoInicial QAbstractItemView::item {
                 padding: 8px 8px;
                 border-radius: 6px;
             }
             
-            QComboBox#cmbConexao QAbstractItemView::item:hover {
+            QComboBox#cmbConexao QAbstractItemView::item:hover, QComboBox#cmbCantoInicial QAbstractItemView::item:hover {
                 background-color: #e3f2fd;
             }
             
@@ -455,6 +620,36 @@ class OrganizadorDeLotesDialog(QDialog):
                 background-color: #f0f8ff;
             }
             
+            QLineEdit#lineQuadrasLote {
+                background-color: white;
+                border: 2px solid #dee2e6;
+                border-radius: 10px;
+                padding: 8px 8px;
+                color: #495057;
+            }
+            
+            QLineEdit#lineQuadrasLote:hover {
+                border: 2px solid #4fa3d1;
+            }
+            
+            QLineEdit#lineQuadrasLote:focus {
+                border: 2px solid #003d7a;
+                background-color: #f0f8ff;
+            }
+
+            QProgressBar#progressTarefa {
+                background-color: white;
+                border: 2px solid #dee2e6;
+                border-radius: 8px;
+                color: #495057;
+                text-align: center;
+            }
+
+            QProgressBar#progressTarefa::chunk {
+                background-color: #4fa3d1;
+                border-radius: 6px;
+            }
+
             QLineEdit#lineInsQuadra {
                 background-color: #fff8e1;
                 border: 2px solid #ffb74d;
@@ -0,0 +1,325 @@
+# -*- coding: utf-8 -*-
+"""
+Medição de desempenho do Organizador de Lotes
+Arquivo: benchmark.py
+
+Gera quadras e lotes sintéticos (ver services/DadosSinteticos.py) em cada
+escala pedida e mede as etapas dos fluxos de reorganização e restauração:
+índice de lotes, contagem, leitura, cálculo da nova ordem, ordem pela
+geometria, rota de leitura, montagem do SQL e gravação. A tabela
+comercial_umc.novaordem é substituída por uma tabela SQLite local,
+preenchida pelo mesmo fluxo COPY do plugin. O resultado é gravado em JSON
+para comparação entre versões.
+
+Uso, a partir da pasta de plugins:
+    python -m ordenacaodelotes.benchmark --escalas 10 1000 10000 100000 --saida atual.json
+    python -m ordenacaodelotes.benchmark --escalas 10000 --formato gpkg --comparar anterior.json
+
+Com --comparar, o código de saída é 1 se alguma etapa ficou mais lenta que
+o limite (--limite, padrão 1.25x) em relação ao arquivo anterior.
+"""
+
+import argparse
+import json
+import os
+import platform
+import re
+import sqlite3
+import sys
+import tempfile
+import time
+from datetime import datetime
+
+
+ETAPAS = (
+    'gerar_dados', 'construir_indice', 'contar_lotes', 'ler_lotes', 'calcular_nova_ordem',
+    'montar_sql', 'gravar_substituicao', 'gravar_incremental', 'restaurar', 'ordem_geometrica',
+    'previa_mapa', 'rota_leitura')
+
+_PADRAO_COPY = re.compile(r'COPY\s+(\w+)\s+\(([^)]*)\)\s+FROM\s+STDIN', re.IGNORECASE)
+
+
+class _CursorCopy:
+    """Cursor SQLite que aceita o copy_expert usado por copiar_linhas"""
+
+    def __init__(self, cursor):
+        self.cursor = cursor
+
+    def copy_expert(self, sql, arquivo):
+        tabela, colunas = _PADRAO_COPY.match(sql).groups()
+        colunas = [c.strip() for c in colunas.split(',')]
+        linhas = []
+        for texto in arquivo.read().decode('utf-8').splitlines():
+            linhas.append([None if v == '\\N' else v for v in texto.split('\t')])
+        marcadores = ', '.join('?' for _ in colunas)
+        self.cursor.executemany(
+            f"INSERT INTO {tabela} ({', '.join(colunas)}) VALUES ({marcadores})", linhas)
+
+
+class NovaOrdemLocal:
+    """Tabela novaordem em SQLite, no lugar do PostgreSQL"""
+
+    def __init__(self, caminho):
+        self.conexao = sqlite3.connect(caminho)
+        self.conexao.execute(
+            'CREATE TABLE IF NOT EXISTS novaordem '
+            '(matricula INTEGER, ins_quadra INTEGER, n_ordem INTEGER, geom TEXT)')
+        self.conexao.execute('CREATE INDEX IF NOT EXISTS novaordem_quadra ON novaordem (ins_quadra)')
+        self.conexao.execute('CREATE INDEX IF NOT EXISTS novaordem_matricula ON novaordem (matricula)')
+        self.conexao.commit()
+
+    def fechar(self):
+        self.conexao.close()
+
+    @staticmethod
+    def _lista(quadras):
+        return ', '.join(str(int(q)) for q in quadras)
+
+    def linhas_gravadas(self, quadras):
+        return self.conexao.execute(
+            f'SELECT matricula, ins_quadra, n_ordem FROM novaordem '
+            f'WHERE ins_quadra IN ({self._lista(quadras)})').fetchall()
+
+    def substituir(self, quadras, linhas):
+        """Apaga as linhas das quadras e insere as novas com o fluxo COPY do plugin"""
+        from .services.CopyLoader import TAMANHO_LOTE_PADRAO, copiar_linhas
+        from .services.NovaOrdem import COLUNAS_ENTRADA, SRID, _valores_linha
+
+        with self.conexao:
+            cursor = self.conexao.cursor()
+            cursor.execute(f'DELETE FROM novaordem WHERE ins_quadra IN ({self._lista(quadras)})')
+            copiar_linhas(_CursorCopy(cursor), 'novaordem', COLUNAS_ENTRADA,
+                          (_valores_linha(l) for l in linhas), ['geom'], SRID, TAMANHO_LOTE_PADRAO)
+        return len(linhas)
+
+    def aplicar_diferencas(self, quadras, linhas):
+        """Grava apenas o que mudou, como a gravação incremental do plugin"""
+        from .services.CopyLoader import ewkb_hex
+        from .services.NovaOrdem import SRID
+        from .services.Ordenacao import calcular_diferencas
+
+        diferencas = calcular_diferencas(self.linhas_gravadas(quadras), linhas)
+        with self.conexao:
+            self.conexao.executemany(
+                'UPDATE novaordem SET n_ordem = ? WHERE matricula = ?',
+                [(nova, matricula) for matricula, _, nova in diferencas['atualizar']])
+            self.conexao.executemany(
+                'INSERT INTO novaordem (matricula, ins_quadra, n_ordem, geom) VALUES (?, ?, ?, ?)',
+                [(l['matricula'], l['ins_quadra'], l['n_ordem'], ewkb_hex(l.get('geometria'), SRID))
+                 for l in diferencas['inserir']])
+            self.conexao.executemany(
+                'DELETE FROM novaordem WHERE matricula IS ? AND n_ordem IS ?', diferencas['excluir'])
+        return {'atualizadas': len(diferencas['atualizar']), 'inseridas': len(diferencas['inserir']),
+                'excluidas': len(diferencas['excluir'])}
+
+
+def _cronometrar(tempos, etapa, funcao, *args):
+    inicio = time.perf_counter()
+    resultado = funcao(*args)
+    tempos[etapa] = time.perf_counter() - inicio
+    return resultado
+
+
+def _montar_todas(lotes_por_quadra, ordens):
+    from .services.Ordenacao import montar_linhas
+
+    linhas = []
+    for ins_quadra, ordem_primeira in ordens.items():
+        linhas.extend(montar_linhas(ins_quadra, lotes_por_quadra.get(ins_quadra, []), ordem_primeira))
+    return linhas
+
+
+def medir_escala(total_lotes, lotes_por_quadra, formato, pasta, max_quadras):
+    """
+    Executa uma rodada dos fluxos sobre dados sintéticos
+
+    Returns:
+        Tupla ({etapa: segundos}, número de quadras medidas)
+    """
+    from qgis.core import QgsProject
+
+    from .services.DadosSinteticos import gerar_camadas, salvar_geopackage
+    from .services.IndiceLotes import IndiceLotes
+    from .services.NovaOrdem import sql_substituir_quadras
+    from .services.OrdemGeometrica import calcular_linhas_geometricas, percorrer_quadras
+    from .services.Ordenacao import contar_com_matricula
+    from .services.PreviaMapa import PreviaMapa
+    from .services.RotaLeitura import calcular_rota_setor
+
+    tempos = {}
+
+    def _gerar():
+        camada_quadras, camada_lotes = gerar_camadas(total_lotes, lotes_por_quadra)
+        if formato == 'gpkg':
+            caminho = os.path.join(pasta, f'sinteticos_{total_lotes}.gpkg')
+            camada_quadras = salvar_geopackage(camada_quadras, caminho, 'quadra')
+            camada_lotes = salvar_geopackage(camada_lotes, caminho, 'lote')
+        return camada_quadras, camada_lotes
+
+    camada_quadras, camada_lotes = _cronometrar(tempos, 'gerar_dados', _gerar)
+
+    indice = IndiceLotes(camada_lotes)
+    banco = NovaOrdemLocal(os.path.join(pasta, f'novaordem_{total_lotes}.sqlite'))
+    try:
+        _cronometrar(tempos, 'construir_indice', indice.construir)
+        quadras = sorted(indice.quadras())[:max_quadras]
+
+        contagens = _cronometrar(tempos, 'contar_lotes', lambda: {
+            q: contar_com_matricula(indice.lotes_da_quadra(q).values()) for q in quadras})
+        lotes = _cronometrar(tempos, 'ler_lotes', indice.ler_lotes, quadras)
+
+        # Cada quadra passa a começar no segundo lote, o que muda todas as linhas
+        ordens = {q: 2 if contagens[q] > 1 else 1 for q in quadras}
+        linhas = _cronometrar(tempos, 'calcular_nova_ordem', _montar_todas, lotes, ordens)
+        _cronometrar(tempos, 'montar_sql', sql_substituir_quadras, quadras, linhas, True)
+
+        originais = _montar_todas(lotes, dict.fromkeys(quadras))
+        banco.substituir(quadras, originais)
+        _cronometrar(tempos, 'gravar_substituicao', banco.substituir, quadras, linhas)
+        banco.substituir(quadras, originais)
+        _cronometrar(tempos, 'gravar_incremental', banco.aplicar_diferencas, quadras, linhas)
+        _cronometrar(tempos, 'restaurar', lambda: banco.aplicar_diferencas(
+            quadras, _montar_todas(indice.ler_lotes(quadras), dict.fromkeys(quadras))))
+
+        _cronometrar(tempos, 'ordem_geometrica', calcular_linhas_geometricas,
+                     camada_quadras, camada_lotes, quadras, 'noroeste')
+
+        # Uma atualização dos rótulos da prévia na maior quadra, com os pontos já carregados
+        maior = max(quadras, key=lambda q: len(lotes.get(q, [])))
+        previa = PreviaMapa(QgsProject())
+        previa.carregar(camada_lotes, maior, lotes.get(maior, []))
+        _cronometrar(tempos, 'previa_mapa', previa.atualizar, ordens[maior])
+        previa.limpar()
+
+        # Todas as quadras medidas como um único setor; a gravação não entra na medida
+        percursos, _ = percorrer_quadras(camada_quadras, camada_lotes, quadras, 'noroeste')
+        _cronometrar(tempos, 'rota_leitura', calcular_rota_setor, percursos)
+    finally:
+        indice.desconectar()
+        banco.fechar()
+    return tempos, len(quadras)
+
+
+def _resumir(rodadas):
+    resumo = {}
+    for etapa in ETAPAS:
+        valores = [r[etapa] for r in rodadas if etapa in r]
+        if valores:
+            resumo[etapa] = {'min': min(valores), 'media': sum(valores) / len(valores), 'max': max(valores)}
+    return resumo
+
+
+def _versao_plugin():
+    caminho = os.path.join(os.path.dirname(__file__), 'metadata.txt')
+    try:
+        with open(caminho, encoding='utf-8') as arquivo:
+            for linha in arquivo:
+                if linha.startswith('version='):
+                    return linha.split('=', 1)[1].strip()
+    except OSError:
+        pass
+    return None
+
+
+def comparar(atual, anterior, limite):
+    """
+    Compara o tempo mínimo de cada etapa com o de uma execução anterior
+
+    Returns:
+        Lista de {'lotes', 'etapa', 'anterior', 'atual', 'razao'} das etapas
+        que ficaram mais lentas que o limite
+    """
+    anteriores = {(r['lotes'], r['formato']): r['etapas'] for r in anterior.get('resultados', [])}
+    regressoes = []
+    for resultado in atual['resultados']:
+        etapas_anteriores = anteriores.get((resultado['lotes'], resultado['formato']), {})
+        for etapa, tempos in resultado['etapas'].items():
+            if etapa not in etapas_anteriores or etapas_anteriores[etapa]['min'] <= 0:
+                continue
+            razao = tempos['min'] / etapas_anteriores[etapa]['min']
+            if razao > limite:
+                regressoes.append({'lotes': resultado['lotes'], 'etapa': etapa,
+                                   'anterior': etapas_anteriores[etapa]['min'],
+                                   'atual': tempos['min'], 'razao': round(razao, 2)})
+    return regressoes
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='ordenacaodelotes.benchmark',
+        description='Mede o desempenho da ordenação de lotes com dados sintéticos')
+    parser.add_argument('--escalas', type=int, nargs='+', default=[10, 1000, 10000, 100000],
+                        help='Números totais de lotes (10 a 100000)')
+    parser.add_argument('--lotes-por-quadra', type=int, default=20)
+    parser.add_argument('--formato', choices=('memoria', 'gpkg'), default='memoria',
+                        help='Camadas em memória ou em GeoPackage')
+    parser.add_argument('--repeticoes', type=int, default=3)
+    parser.add_argument('--max-quadras', type=int, default=5000,
+                        help='Quadras medidas por rodada em cada escala')
+    parser.add_argument('--pasta', default='', help='Pasta dos arquivos temporários (padrão: temporária)')
+    parser.add_argument('--saida', default='', help='Arquivo JSON do resultado (padrão: saída padrão)')
+    parser.add_argument('--comparar', default='', help='JSON de uma execução anterior')
+    parser.add_argument('--limite', type=float, default=1.25,
+                        help='Razão de tempo acima da qual a etapa é considerada regressão')
+    return parser.parse_args(argv)
+
+
+def executar(args, pasta):
+    """Mede todas as escalas e retorna o dicionário de resultado"""
+    from qgis.core import Qgis
+    from .services.Perimetro import np
+
+    resultados = []
+    for total_lotes in args.escalas:
+        rodadas = []
+        quadras = 0
+        for _ in range(max(1, args.repeticoes)):
+            tempos, quadras = medir_escala(total_lotes, args.lotes_por_quadra, args.formato,
+                                           pasta, args.max_quadras)
+            rodadas.append(tempos)
+        resultados.append({'lotes': total_lotes, 'formato': args.formato, 'quadras_medidas': quadras,
+                           'repeticoes': len(rodadas), 'etapas': _resumir(rodadas)})
+
+    return {
+        'versao_plugin': _versao_plugin(),
+        'data': datetime.now().isoformat(timespec='seconds'),
+        'ambiente': {'python': platform.python_version(), 'qgis': Qgis.QGIS_VERSION,
+                     'numpy': np is not None, 'sistema': platform.platform()},
+        'lotes_por_quadra': args.lotes_por_quadra,
+        'resultados': resultados
+    }
+
+
+def main(argv=None):
+    args = _argumentos(argv if argv is not None else sys.argv[1:])
+
+    from qgis.core import QgsApplication
+    app = QgsApplication([], False)
+    app.initQgis()
+    try:
+        if args.pasta:
+            os.makedirs(args.pasta, exist_ok=True)
+            resultado = executar(args, args.pasta)
+        else:
+            with tempfile.TemporaryDirectory(prefix='organizador_benchmark_') as pasta:
+                resultado = executar(args, pasta)
+    finally:
+        app.exitQgis()
+
+    codigo = 0
+    if args.comparar:
+        with open(args.comparar, encoding='utf-8') as arquivo:
+            resultado['regressoes'] = comparar(resultado, json.load(arquivo), args.limite)
+        codigo = 1 if resultado['regressoes'] else 0
+
+    texto = json.dumps(resultado, ensure_ascii=False, indent=2)
+    if args.saida:
+        with open(args.saida, 'w', encoding='utf-8') as arquivo:
+            arquivo.write(texto)
+    else:
+        print(texto)
+    return codigo
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,148 @@
+# -*- coding: utf-8 -*-
+"""
+Linha de comando do Organizador de Lotes
+
+Executa as operações do plugin sem o QGIS aberto, com o resultado em JSON
+na saída padrão. Requer o PyQGIS no PYTHONPATH (QGIS_PREFIX_PATH apontando
+para a instalação) e a conexão PostgreSQL cadastrada no perfil do QGIS.
+
+Uso, a partir da pasta de plugins:
+    python -m ordenacaodelotes.cli contar      --conexao cadastro --lotes comercial_umc.gis_boletim_lote --quadras "101-120"
+    python -m ordenacaodelotes.cli reorganizar --conexao cadastro --lotes comercial_umc.gis_boletim_lote --quadras "101-120:1; 130:3"
+    python -m ordenacaodelotes.cli restaurar   --conexao cadastro --lotes comercial_umc.gis_boletim_lote --quadras "130"
+    python -m ordenacaodelotes.cli reorganizar --conexao cadastro --lotes comercial_umc.gis_boletim_lote --todas --calcular-no-servidor
+    python -m ordenacaodelotes.cli verificar   --conexao cadastro --lotes comercial_umc.gis_boletim_lote --todas
+    python -m ordenacaodelotes.cli varrer      --conexao cadastro --lotes comercial_umc.gis_boletim_lote --todas \
+        --csv verificacao.csv
+    python -m ordenacaodelotes.cli geometria   --conexao cadastro --lotes comercial_umc.gis_boletim_lote \
+        --camada-quadras comercial_umc.quadra --quadras "101-120" --inicio noroeste
+    python -m ordenacaodelotes.cli rota        --conexao cadastro --lotes comercial_umc.gis_boletim_lote \
+        --camada-quadras comercial_umc.quadra --todas --setores "12; 13"
+    python -m ordenacaodelotes.cli compactar   --conexao cadastro --todas
+
+O comando compactar renumera a novaordem para 1..N por quadra; não usa a
+camada de lotes, e --todas significa todas as quadras da tabela novaordem.
+
+O código de saída é 0 quando a operação teve sucesso e 1 caso contrário.
+"""
+
+import argparse
+import cProfile
+import json
+import sys
+
+
+COMANDOS = ('contar', 'reorganizar', 'restaurar', 'verificar', 'varrer', 'geometria', 'rota', 'compactar')
+CANTOS = ('noroeste', 'nordeste', 'sudeste', 'sudoeste')
+
+
+def _argumentos(argv):
+    parser = argparse.ArgumentParser(
+        prog='ordenacaodelotes.cli',
+        description='Ordenação de lotes (tabela comercial_umc.novaordem) sem interface')
+    parser.add_argument('comando', choices=COMANDOS)
+    parser.add_argument('--conexao', required=True, help='Nome da conexão PostgreSQL do QGIS')
+    parser.add_argument('--lotes', default='',
+                        help="Camada de lotes: 'esquema.tabela' na conexão ou fonte de dados do provedor "
+                             "(todos os comandos, exceto compactar)")
+    parser.add_argument('--provedor', default=None, help="Provedor da camada de lotes (padrão: postgres/ogr)")
+    parser.add_argument('--chave', default='', help='Coluna chave da camada de lotes (views)')
+    quadras = parser.add_mutually_exclusive_group(required=True)
+    quadras.add_argument('--quadras', help='Lista de quadras, ex.: "101-120:1; 130:3"')
+    quadras.add_argument('--arquivo-quadras', help='Arquivo com a lista de quadras')
+    quadras.add_argument('--todas', action='store_true', help='Todas as quadras da camada de lotes')
+    parser.add_argument('--ordem', type=int, default=1, help='Ordem inicial padrão (reorganizar)')
+    parser.add_argument('--camada-quadras', default='',
+                        help="Camada de quadras (geometria): 'esquema.tabela' na conexão ou fonte de dados")
+    parser.add_argument('--inicio', choices=CANTOS, default='noroeste',
+                        help='Canto de partida do percurso horário (geometria, rota)')
+    parser.add_argument('--setores', default='', help='Setores separados por ";" (rota; padrão: todos)')
+    parser.add_argument('--campo-setor', default='setor', help='Campo do setor na camada de quadras (rota)')
+    parser.add_argument('--tempo-limite', type=float, default=None,
+                        help='Segundos para melhorar a rota de cada setor (rota)')
+    parser.add_argument('--completo', action='store_true',
+                        help='Regrava todas as linhas das quadras em vez de só as diferenças')
+    parser.add_argument('--calcular-no-servidor', action='store_true',
+                        help='Calcula e grava no banco com um único comando por grupo (reorganizar/restaurar)')
+    parser.add_argument('--csv', default='', help='Grava o relatório neste arquivo CSV (varrer)')
+    parser.add_argument('--perfil-qgis', default='', help='Pasta do perfil do QGIS com as conexões')
+    parser.add_argument('--cprofile', default='', help='Grava o perfil de execução (cProfile) neste arquivo')
+    return parser.parse_args(argv)
+
+
+def _texto_quadras(args):
+    if args.arquivo_quadras:
+        with open(args.arquivo_quadras, encoding='utf-8') as arquivo:
+            return arquivo.read()
+    return args.quadras
+
+
+def executar(args):
+    """Executa o comando e retorna o dicionário de resultado"""
+    from .services.Api import ApiOrdenacao, abrir_camada_lotes
+    from .services.Compactacao import compactar_novaordem
+    from .services.Ordenacao import interpretar_lista_quadras
+
+    if args.comando == 'compactar':
+        quadras = None if args.todas else [q for q, _ in interpretar_lista_quadras(_texto_quadras(args))]
+        return compactar_novaordem(args.conexao, quadras)
+    if not args.lotes:
+        raise Exception(f"Informe --lotes para o comando {args.comando}")
+
+    camada = abrir_camada_lotes(args.conexao, args.lotes, args.provedor, chave=args.chave)
+    api = ApiOrdenacao(args.conexao, camada)
+    try:
+        if args.todas:
+            quadras = [(q, args.ordem) for q in api.quadras()]
+        else:
+            quadras = interpretar_lista_quadras(_texto_quadras(args), args.ordem)
+
+        incremental = not args.completo
+        if args.comando == 'contar':
+            return api.contar([q for q, _ in quadras])
+        if args.comando == 'reorganizar':
+            return api.reorganizar(quadras, incremental, no_servidor=args.calcular_no_servidor)
+        if args.comando == 'restaurar':
+            return api.restaurar([q for q, _ in quadras], incremental, no_servidor=args.calcular_no_servidor)
+        if args.comando == 'varrer':
+            return api.varrer([q for q, _ in quadras], args.csv or None)
+        if args.comando in ('geometria', 'rota'):
+            if not args.camada_quadras:
+                raise Exception(f"Informe --camada-quadras para o comando {args.comando}")
+            camada_quadras = abrir_camada_lotes(args.conexao, args.camada_quadras, args.provedor)
+            if args.comando == 'rota':
+                setores = [s.strip() for s in args.setores.split(';') if s.strip()] or None
+                return api.planejar_rotas(camada_quadras, None if args.todas else [q for q, _ in quadras],
+                                          setores, args.campo_setor, args.inicio, args.tempo_limite)
+            return api.ordenar_pela_geometria(camada_quadras, [q for q, _ in quadras], args.inicio, incremental)
+        return api.verificar([q for q, _ in quadras])
+    finally:
+        api.fechar()
+
+
+def main(argv=None):
+    args = _argumentos(argv if argv is not None else sys.argv[1:])
+
+    from qgis.core import QgsApplication
+    app = QgsApplication([], False, args.perfil_qgis) if args.perfil_qgis else QgsApplication([], False)
+    app.initQgis()
+    try:
+        if args.cprofile:
+            perfil = cProfile.Profile()
+            resultado = perfil.runcall(executar, args)
+            perfil.dump_stats(args.cprofile)
+        else:
+            resultado = executar(args)
+    except Exception as e:
+        resultado = {'success': False, 'message': f"Erro: {e}"}
+    finally:
+        from .services.ConnectionPool import obter_gerenciador
+        obter_gerenciador().fechar_todos()
+        app.exitQgis()
+
+    print(json.dumps(resultado, ensure_ascii=False, indent=2, default=str))
+    return 0 if resultado.get('success') else 1
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,360 @@
+"""
+API de ordenação de lotes sem interface
+Arquivo: Api.py
+
+Expõe as operações do plugin (contar, reorganizar, restaurar, verificar,
+varrer, ordenar pela geometria, planejar a rota de leitura dos setores e
+renumerar a novaordem)
+sem depender do diálogo, do iface ou do projeto
+aberto, para uso em scripts PyQGIS, rotinas noturnas e na linha de comando
+(ver cli.py).
+"""
+
+import re
+
+from qgis.core import QgsMessageLog, QgsVectorLayer, Qgis
+
+from .Compactacao import QUADRAS_POR_GRUPO, compactar_novaordem
+from .ConnectionPool import uri_da_conexao
+from .IndiceLotes import IndiceLotes
+from .NovaOrdem import linhas_gravadas, linhas_gravadas_por_quadra, quadras_existem, substituir_quadras
+from .OrdemGeometrica import calcular_linhas_geometricas, percorrer_quadras
+from .OrdemServidor import origem_no_servidor, reordenar_no_servidor
+from .RotaLeitura import CAMPO_SETOR, calcular_rota_setor, gravar_rota, ler_setores
+from .Varredura import gravar_csv, varrer_quadras
+from .Ordenacao import contar_com_matricula, montar_linhas, validar_ordem_quadra, verificar_consistencia
+
+
+_PADRAO_TABELA = re.compile(r'^(\w+)\.(\w+)$')
+
+# Quadras gravadas por transação nas operações em massa
+QUADRAS_POR_TRANSACAO = 500
+
+
+def _log(message, level=Qgis.Info):
+    QgsMessageLog.logMessage(message, 'OrganizadorDeLotes', level)
+
+
+def abrir_camada_lotes(conexao, fonte, provedor=None, coluna_geometria='geom', chave=''):
+    """
+    Abre a camada de lotes sem passar pelo projeto
+
+    Args:
+        conexao: Nome da conexão PostgreSQL do QGIS
+        fonte: 'esquema.tabela' na conexão informada, ou qualquer fonte de
+            dados aceita pelo provedor (arquivo, URI completa)
+        provedor: Provedor da fonte ('postgres', 'ogr', ...). Padrão:
+            'postgres' para 'esquema.tabela' e 'ogr' para as demais
+        coluna_geometria: Coluna de geometria da tabela
+        chave: Coluna chave (obrigatória para views)
+    """
+    correspondencia = _PADRAO_TABELA.match(fonte)
+    if correspondencia and provedor in (None, 'postgres'):
+        uri = uri_da_conexao(conexao)
+        uri.setDataSource(correspondencia.group(1), correspondencia.group(2), coluna_geometria, '', chave)
+        camada = QgsVectorLayer(uri.uri(False), 'lotes', 'postgres')
+    else:
+        camada = QgsVectorLayer(fonte, 'lotes', provedor or 'ogr')
+
+    if not camada.isValid():
+        raise Exception(f"Não foi possível abrir a camada de lotes: {fonte}")
+    return camada
+
+
+def _em_grupos(itens, tamanho):
+    for inicio in range(0, len(itens), tamanho):
+        yield itens[inicio:inicio + tamanho]
+
+
+def _somar_contagem(total, contagem):
+    for chave in total:
+        total[chave] += (contagem or {}).get(chave, 0)
+
+
+class ApiOrdenacao:
+    """
+    Operações de ordenação sobre uma conexão e uma camada de lotes
+
+    Todas as operações recebem várias quadras e retornam um dicionário com
+    'success', 'message' e 'relatorio' (uma entrada por quadra), no mesmo
+    formato usado pelo plugin.
+
+    Exemplo:
+        camada = abrir_camada_lotes('cadastro', 'comercial_umc.gis_boletim_lote')
+        api = ApiOrdenacao('cadastro', camada)
+        api.reorganizar([(101, 3), (102, 1)])
+    """
+
+    def __init__(self, conexao, camada_lotes, indice=None):
+        self.conexao = conexao
+        self.camada_lotes = camada_lotes
+        self.indice = indice or IndiceLotes(camada_lotes)
+
+    def fechar(self):
+        """Desconecta o índice da camada"""
+        self.indice.desconectar()
+
+    def quadras(self):
+        """Retorna todas as quadras da camada de lotes"""
+        return sorted(q for q in self.indice.quadras() if isinstance(q, int))
+
+    def num_lotes(self, ins_quadra):
+        """Número de lotes com matrícula na quadra"""
+        return contar_com_matricula(self.indice.lotes_da_quadra(ins_quadra).values())
+
+    def contar(self, quadras):
+        """Conta os lotes com matrícula de cada quadra"""
+        relatorio = [{'ins_quadra': int(q), 'num_lotes': self.num_lotes(q)} for q in quadras]
+        total = sum(r['num_lotes'] for r in relatorio)
+        return {'success': True, 'message': f'{total} lote(s) em {len(relatorio)} quadra(s)',
+                'relatorio': relatorio}
+
+    def _origem_servidor(self, no_servidor):
+        if not no_servidor:
+            return None
+        origem = origem_no_servidor(self.camada_lotes, self.conexao)
+        if origem is None:
+            raise Exception("A camada de lotes não é uma tabela do banco da conexão: use o cálculo no cliente")
+        return origem
+
+    def _gravar(self, quadras_e_ordens, incremental, tamanho_grupo, no_servidor=False):
+        """
+        Calcula e grava as linhas em grupos de quadras, uma transação por grupo
+
+        Com no_servidor=True cada grupo é um único comando no banco, sem
+        ler as feições (ver OrdemServidor.py).
+        """
+        origem = self._origem_servidor(no_servidor)
+        alteracoes = {'atualizadas': 0, 'inseridas': 0, 'excluidas': 0}
+        for grupo in _em_grupos(list(quadras_e_ordens.items()), tamanho_grupo):
+            if origem:
+                _somar_contagem(alteracoes, reordenar_no_servidor(self.conexao, origem, grupo, incremental))
+                _log(f"API: {len(grupo)} quadra(s) gravada(s) no servidor")
+                continue
+            lotes_por_quadra = self.indice.ler_lotes([q for q, _ in grupo])
+            linhas = []
+            for ins_quadra, ordem_primeira in grupo:
+                linhas.extend(montar_linhas(ins_quadra, lotes_por_quadra.get(ins_quadra, []), ordem_primeira))
+            _somar_contagem(alteracoes, substituir_quadras(self.conexao, [q for q, _ in grupo], linhas, incremental))
+            _log(f"API: {len(grupo)} quadra(s) gravada(s)")
+        return alteracoes
+
+    def reorganizar(self, quadras, incremental=True, tamanho_grupo=QUADRAS_POR_TRANSACAO, no_servidor=False):
+        """
+        Reorganiza as quadras a partir da ordem inicial de cada uma
+
+        Args:
+            quadras: Lista de tuplas (ins_quadra, ordem_primeira)
+            incremental: Se True, grava apenas as linhas que mudaram
+            tamanho_grupo: Quadras gravadas por transação
+            no_servidor: Calcula e grava no banco, sem ler as feições
+        """
+        relatorio = []
+        validas = {}
+        try:
+            for ins_quadra, ordem_primeira in quadras:
+                ins_quadra, ordem_primeira = int(ins_quadra), int(ordem_primeira)
+                num_lotes = self.num_lotes(ins_quadra)
+                mensagem = validar_ordem_quadra(ins_quadra, ordem_primeira, num_lotes)
+                if mensagem is None:
+                    validas[ins_quadra] = ordem_primeira
+                    mensagem = f"{num_lotes} lote(s) a partir da ordem {ordem_primeira}"
+                relatorio.append({'ins_quadra': ins_quadra, 'ordem_primeira': ordem_primeira,
+                                  'num_lotes': num_lotes, 'success': ins_quadra in validas,
+                                  'message': mensagem})
+
+            if not validas:
+                return {'success': False, 'message': 'Nenhuma quadra válida para reorganizar!',
+                        'relatorio': relatorio}
+
+            alteracoes = self._gravar(validas, incremental, tamanho_grupo, no_servidor)
+            return {'success': True,
+                    'message': f'{len(validas)} de {len(relatorio)} quadra(s) reorganizada(s) com sucesso!',
+                    'relatorio': relatorio, 'alteracoes': alteracoes}
+        except Exception as e:
+            _log(f"API: erro ao reorganizar quadras: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+
+    def restaurar(self, quadras, incremental=True, tamanho_grupo=QUADRAS_POR_TRANSACAO, no_servidor=False):
+        """Restaura a ordem original (campo 'ordem') das quadras"""
+        relatorio = []
+        validas = {}
+        try:
+            for ins_quadra in quadras:
+                ins_quadra = int(ins_quadra)
+                num_lotes = self.num_lotes(ins_quadra)
+                if ins_quadra == 99 or num_lotes == 0:
+                    mensagem = "Quadra inválida ou sem lotes"
+                else:
+                    validas[ins_quadra] = None
+                    mensagem = f"{num_lotes} lote(s) restaurado(s)"
+                relatorio.append({'ins_quadra': ins_quadra, 'num_lotes': num_lotes,
+                                  'success': ins_quadra in validas, 'message': mensagem})
+
+            if not validas:
+                return {'success': False, 'message': 'Nenhuma quadra válida para restaurar!',
+                        'relatorio': relatorio}
+
+            alteracoes = self._gravar(validas, incremental, tamanho_grupo, no_servidor)
+            return {'success': True,
+                    'message': f'{len(validas)} de {len(relatorio)} quadra(s) restaurada(s) com sucesso!',
+                    'relatorio': relatorio, 'alteracoes': alteracoes}
+        except Exception as e:
+            _log(f"API: erro ao restaurar quadras: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+
+    def ordenar_pela_geometria(self, camada_quadras, quadras, inicio='noroeste', incremental=True,
+                               tamanho_grupo=QUADRAS_POR_TRANSACAO):
+        """
+        Ordena os lotes percorrendo o contorno de cada quadra no sentido horário
+
+        Args:
+            camada_quadras: Camada Quadra (com ins_quadra)
+            quadras: Quadras a ordenar
+            inicio: Canto de partida ('noroeste', 'nordeste', 'sudeste',
+                'sudoeste') ou ponto (x, y) no SRC das quadras
+        """
+        relatorio = []
+        alteracoes = {'atualizadas': 0, 'inseridas': 0, 'excluidas': 0}
+        try:
+            for grupo in _em_grupos([int(q) for q in quadras], tamanho_grupo):
+                linhas, relatorio_grupo = calcular_linhas_geometricas(
+                    camada_quadras, self.camada_lotes, grupo, inicio)
+                relatorio.extend(relatorio_grupo)
+                validas = [r['ins_quadra'] for r in relatorio_grupo if r['success']]
+                if validas:
+                    _somar_contagem(alteracoes, substituir_quadras(self.conexao, validas, linhas, incremental))
+                    _log(f"API: {len(validas)} quadra(s) ordenada(s) pela geometria")
+
+            ordenadas = sum(1 for r in relatorio if r['success'])
+            return {'success': ordenadas > 0,
+                    'message': f'{ordenadas} de {len(relatorio)} quadra(s) ordenada(s) pela geometria',
+                    'relatorio': relatorio, 'alteracoes': alteracoes}
+        except Exception as e:
+            _log(f"API: erro ao ordenar pela geometria: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+
+    def verificar(self, quadras):
+        """
+        Confere a tabela novaordem contra a camada de lotes
+
+        Para cada quadra informa se há linhas gravadas e, se houver, as
+        matrículas faltantes ou excedentes e as ordens repetidas ou nulas.
+        """
+        try:
+            quadras = [int(q) for q in quadras]
+            existentes = quadras_existem(self.conexao, quadras)
+            com_linhas = [q for q in quadras if existentes.get(q)]
+            gravadas_por_quadra = {}
+            if com_linhas:
+                for linha in linhas_gravadas(self.conexao, com_linhas):
+                    gravadas_por_quadra.setdefault(int(linha[1]), []).append(linha)
+
+            relatorio = []
+            for ins_quadra in quadras:
+                lotes = list(self.indice.lotes_da_quadra(ins_quadra).values())
+                entrada = {'ins_quadra': ins_quadra, 'num_lotes': contar_com_matricula(lotes),
+                           'novaordem_existente': existentes.get(ins_quadra, False)}
+                if entrada['novaordem_existente']:
+                    entrada.update(verificar_consistencia(lotes, gravadas_por_quadra.get(ins_quadra, [])))
+                else:
+                    entrada['consistente'] = True
+                relatorio.append(entrada)
+
+            inconsistentes = sum(1 for r in relatorio if not r['consistente'])
+            return {'success': inconsistentes == 0,
+                    'message': f'{inconsistentes} de {len(relatorio)} quadra(s) inconsistente(s)',
+                    'relatorio': relatorio}
+        except Exception as e:
+            _log(f"API: erro ao verificar quadras: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': []}
+
+    def varrer(self, quadras=None, arquivo_csv=None, conferir_novaordem=True):
+        """
+        Procura problemas de ordenação em todas as quadras de uma vez
+
+        Ver Varredura.py. Os lotes vêm de uma leitura da camada (com o
+        nv_ordem atual) e a novaordem, de uma única consulta. O relatório
+        traz só as quadras com problema.
+
+        Args:
+            quadras: Quadras a conferir (padrão: todas as da camada)
+            arquivo_csv: Se informado, grava o relatório neste CSV
+            conferir_novaordem: Se False, confere só a camada de lotes
+        """
+        try:
+            quadras = self.quadras() if quadras is None else [int(q) for q in quadras]
+            lotes_por_quadra = self.indice.ler_com_nv_ordem(quadras)
+            lotes_por_quadra = {q: lotes_por_quadra.get(q, []) for q in quadras}
+            gravadas = linhas_gravadas_por_quadra(self.conexao) if conferir_novaordem else None
+            relatorio = varrer_quadras(lotes_por_quadra, gravadas)
+            if arquivo_csv:
+                gravar_csv(relatorio, arquivo_csv)
+            return {'success': not relatorio,
+                    'message': f'{len(relatorio)} de {len(quadras)} quadra(s) com problema',
+                    'relatorio': relatorio}
+        except Exception as e:
+            _log(f"API: erro ao varrer quadras: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': []}
+
+    def planejar_rotas(self, camada_quadras, quadras=None, setores=None, campo_setor=CAMPO_SETOR,
+                       inicio='noroeste', tempo_limite=None):
+        """
+        Calcula e grava a rota de leitura de cada setor (ver RotaLeitura.py)
+
+        Args:
+            camada_quadras: Camada Quadra (com ins_quadra e o campo do setor)
+            quadras: Se informadas, só estas quadras entram nas rotas
+            setores: Setores a planejar (padrão: todos os das quadras)
+            campo_setor: Campo do setor na camada Quadra
+            inicio: Canto de partida do percurso de cada quadra
+            tempo_limite: Segundos para as melhorias de cada rota
+        """
+        relatorio = []
+        try:
+            por_setor = ler_setores(camada_quadras, quadras, campo_setor)
+            if setores is not None:
+                por_setor = {str(s): por_setor.get(str(s), []) for s in setores}
+            todas = [q for quadras_setor in por_setor.values() for q in quadras_setor]
+            percursos, _ = percorrer_quadras(camada_quadras, self.camada_lotes, todas, inicio)
+
+            for setor in sorted(por_setor):
+                percursos_setor = {q: percursos[q] for q in por_setor[setor] if q in percursos}
+                if not percursos_setor:
+                    relatorio.append({'setor': setor, 'quadras': 0, 'lotes': 0, 'success': False,
+                                      'message': 'Nenhuma quadra com lotes no setor'})
+                    continue
+                rota = calcular_rota_setor(percursos_setor, tempo_limite=tempo_limite)
+                gravadas = gravar_rota(self.conexao, setor, rota['linhas'])
+                relatorio.append({'setor': setor, 'quadras': rota['quadras'], 'lotes': gravadas,
+                                  'comprimento': round(rota['comprimento'], 1),
+                                  'comprimento_inicial': round(rota['comprimento_inicial'], 1),
+                                  'success': True,
+                                  'message': f"{rota['quadras']} quadra(s), {gravadas} lote(s) na rota"})
+                _log(f"API: rota do setor {setor} gravada ({gravadas} lote(s))")
+
+            planejados = sum(1 for r in relatorio if r['success'])
+            return {'success': planejados > 0,
+                    'message': f'Rota de leitura gravada para {planejados} de {len(relatorio)} setor(es)',
+                    'relatorio': relatorio}
+        except Exception as e:
+            _log(f"API: erro ao planejar rotas: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+
+    def compactar(self, quadras=None, tamanho_grupo=QUADRAS_POR_GRUPO):
+        """
+        Renumera para 1..N as quadras da novaordem com lacunas ou repetições (ver Compactacao.py)
+
+        Args:
+            quadras: Só estas quadras (padrão: a tabela inteira, não só as da camada)
+            tamanho_grupo: Quadras por transação
+        """
+        try:
+            resultado = compactar_novaordem(
+                self.conexao, quadras, tamanho_grupo,
+                progresso=lambda concluidas, total: _log(f"API: {concluidas}/{total} quadra(s) renumerada(s)"))
+            resultado['relatorio'] = [{'ins_quadra': q, 'success': True} for q in resultado['quadras']]
+            return resultado
+        except Exception as e:
+            _log(f"API: erro ao renumerar a novaordem: {e}", Qgis.Critical)
+            return {'success': False, 'message': f"Erro: {e}", 'relatorio': []}
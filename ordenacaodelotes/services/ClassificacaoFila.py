@@ -0,0 +1,72 @@
+"""
+Compactação e classificação da fila offline
+Arquivo: ClassificacaoFila.py
+
+Funções puras, sem dependência do QGIS, usadas pela sincronização de
+FilaOffline.py: reduzem a fila à última operação de cada quadra e separam
+as quadras pelo estado atual no servidor (gravar, conflito ou iguais).
+"""
+
+from .Versoes import VERSAO_VAZIA, versao_linhas
+
+
+def compactar(operacoes):
+    """
+    Última operação de cada quadra
+
+    Args:
+        operacoes: Operações da fila em ordem de registro, com 'id',
+            'ins_quadra', 'versao_base' e 'linhas'
+
+    Returns:
+        {ins_quadra: operação mais recente}, com 'ids' (todas as operações
+        da quadra), 'operacoes' (quantas eram) e 'versao_base' da primeira,
+        que é o estado do servidor de onde o operador partiu
+    """
+    por_quadra = {}
+    for operacao in operacoes:
+        anterior = por_quadra.get(operacao['ins_quadra'])
+        compactada = dict(operacao)
+        if anterior is None:
+            compactada.update(ids=[operacao['id']], operacoes=1)
+        else:
+            compactada.update(ids=anterior['ids'] + [operacao['id']], operacoes=anterior['operacoes'] + 1,
+                              versao_base=anterior['versao_base'])
+        por_quadra[operacao['ins_quadra']] = compactada
+    return por_quadra
+
+
+def _tuplas(linhas):
+    return [(l['matricula'], l['ins_quadra'], l['n_ordem']) for l in linhas]
+
+
+def classificar(compactadas, gravadas):
+    """
+    Separa as quadras da fila pelo estado atual no servidor
+
+    Args:
+        compactadas: Resultado de compactar
+        gravadas: Tuplas (matricula, ins_quadra, n_ordem) lidas do servidor
+
+    Returns:
+        Dicionário com 'versoes' ({ins_quadra: versão atual no servidor}) e
+        as listas 'gravar' (servidor na versão de partida), 'conflitos'
+        (servidor alterado por outra sessão) e 'iguais' (servidor já com
+        as linhas da fila, nada a gravar)
+    """
+    por_quadra = {q: [] for q in compactadas}
+    for linha in gravadas:
+        if linha[1] is not None and int(linha[1]) in por_quadra:
+            por_quadra[int(linha[1])].append(linha)
+
+    resultado = {'versoes': {}, 'gravar': [], 'conflitos': [], 'iguais': []}
+    for ins_quadra, operacao in sorted(compactadas.items()):
+        atual = versao_linhas(por_quadra[ins_quadra])
+        resultado['versoes'][ins_quadra] = atual
+        if atual == versao_linhas(_tuplas(operacao['linhas'])):
+            resultado['iguais'].append(ins_quadra)
+        elif atual == (operacao['versao_base'] or VERSAO_VAZIA):
+            resultado['gravar'].append(ins_quadra)
+        else:
+            resultado['conflitos'].append(ins_quadra)
+    return resultado
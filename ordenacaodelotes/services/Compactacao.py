@@ -0,0 +1,177 @@
+"""
+Renumeração contínua da tabela novaordem
+Arquivo: Compactacao.py
+
+Depois de muitas reorganizações e restaurações parciais o n_ordem de uma
+quadra pode ficar com lacunas, repetições ou sem começar em 1. A
+compactação renumera cada quadra para 1..N mantendo a ordem relativa
+(empates desfeitos pela matrícula), sem ler a camada de lotes: as quadras
+com problema saem de uma única consulta agregada e são renumeradas em
+grupos, com um UPDATE por grupo (row_number() sobre a própria tabela), cada
+grupo em uma transação com as quadras travadas. Linhas com n_ordem nulo
+ficam como estão.
+
+Para o diário, cada grupo lê, já travado, as linhas das quadras antes de
+renumerá-las: o plugin guarda esse estado como instantâneo, e o Desfazer
+volta a quadra ao n_ordem de antes da renumeração.
+"""
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsTask
+
+from .ConnectionPool import disponivel as pool_disponivel, obter_pool
+from .NovaOrdem import (
+    SQL_LINHAS_GRAVADAS, TABELA_NOVAORDEM, consultar, consultar_quadras, executar_modelo, executar_quadras,
+    invalidar_existencia, linhas_gravadas, travar_quadras)
+
+
+# Quadras renumeradas por transação
+QUADRAS_POR_GRUPO = 2000
+
+# Quadras cujo n_ordem não é exatamente 1..N (N = linhas com n_ordem)
+_SQL_A_COMPACTAR = f'''
+    SELECT ins_quadra FROM {TABELA_NOVAORDEM}
+    WHERE n_ordem IS NOT NULL AND ins_quadra IS NOT NULL{{filtro}}
+    GROUP BY ins_quadra
+    HAVING min(n_ordem) <> 1 OR max(n_ordem) <> count(*) OR count(DISTINCT n_ordem) <> count(*)
+    ORDER BY ins_quadra'''
+SQL_A_COMPACTAR = _SQL_A_COMPACTAR.replace('{filtro}', '')
+SQL_A_COMPACTAR_QUADRAS = _SQL_A_COMPACTAR.replace('{filtro}', ' AND ins_quadra = ANY({quadras})')
+
+# O ctid identifica a linha dentro do comando: a tabela não tem chave garantida
+SQL_COMPACTAR = f'''
+    UPDATE {TABELA_NOVAORDEM} n
+    SET n_ordem = c.nova
+    FROM (SELECT ctid AS linha,
+                 row_number() OVER (PARTITION BY ins_quadra ORDER BY n_ordem, matricula, ctid) AS nova
+          FROM {TABELA_NOVAORDEM}
+          WHERE ins_quadra = ANY({{quadras}}) AND n_ordem IS NOT NULL) AS c
+    WHERE n.ctid = c.linha AND n.n_ordem <> c.nova'''
+
+
+def quadras_a_compactar(conexao, quadras=None):
+    """Quadras com lacunas, repetições ou início fora do 1 no n_ordem (todas as da tabela ou só as informadas)"""
+    if quadras is None:
+        linhas = consultar(conexao, SQL_A_COMPACTAR)
+    else:
+        linhas = consultar_quadras(conexao, SQL_A_COMPACTAR_QUADRAS, quadras)
+    return [int(linha[0]) for linha in linhas]
+
+
+def compactar_quadras(conexao, quadras, ler_gravadas=False):
+    """
+    Renumera as quadras para 1..N em uma única transação, com as quadras travadas
+
+    Args:
+        ler_gravadas: Se True, lê também as linhas das quadras antes da
+            renumeração (na mesma transação, com psycopg2)
+
+    Returns:
+        Tupla (linhas atualizadas, linhas gravadas antes ou None). As linhas
+        atualizadas são None pela API de conexões do QGIS, que não as informa
+    """
+    try:
+        if pool_disponivel():
+            def _compactar(cur):
+                travar_quadras(cur, quadras)
+                gravadas = None
+                if ler_gravadas:
+                    executar_modelo(cur, SQL_LINHAS_GRAVADAS, quadras)
+                    gravadas = [tuple(linha) for linha in cur.fetchall()]
+                executar_modelo(cur, SQL_COMPACTAR, quadras)
+                return max(cur.rowcount, 0), gravadas
+            return obter_pool(conexao).executar_transacao(_compactar)
+        gravadas = linhas_gravadas(conexao, quadras) if ler_gravadas else None
+        executar_quadras(conexao, SQL_COMPACTAR, quadras)
+        return None, gravadas
+    finally:
+        invalidar_existencia(conexao, quadras)
+
+
+def compactar_novaordem(conexao, quadras=None, tamanho_grupo=QUADRAS_POR_GRUPO, progresso=None, cancelada=None,
+                        ler_gravadas=False):
+    """
+    Renumera para 1..N todas as quadras da novaordem que precisam
+
+    Args:
+        conexao: Nome da conexão PostgreSQL
+        quadras: Só estas quadras (padrão: a tabela inteira)
+        tamanho_grupo: Quadras por transação
+        progresso: Função opcional chamada por grupo com (concluidas, total)
+        cancelada: Função sem argumentos que interrompe entre os grupos se True
+        ler_gravadas: Se True, traz as linhas das quadras antes da renumeração
+
+    Returns:
+        Dicionário com 'success', 'message', 'quadras' (renumeradas),
+        'pendentes' (não renumeradas por cancelamento ou erro), 'atualizadas'
+        (linhas alteradas, ou None sem psycopg2) e 'gravadas' (tuplas
+        (matricula, ins_quadra, n_ordem) de antes, se ler_gravadas). Se um
+        grupo falhar, 'success' é False e 'quadras'/'gravadas' trazem os
+        grupos já gravados antes do erro
+    """
+    a_compactar = quadras_a_compactar(conexao, quadras)
+    concluidas = []
+    gravadas = []
+    atualizadas = 0
+    erro = None
+    for inicio in range(0, len(a_compactar), tamanho_grupo):
+        if cancelada and cancelada():
+            break
+        grupo = a_compactar[inicio:inicio + tamanho_grupo]
+        try:
+            contagem, gravadas_grupo = compactar_quadras(conexao, grupo, ler_gravadas)
+        except Exception as e:
+            erro = e
+            break
+        gravadas.extend(gravadas_grupo or [])
+        atualizadas = None if contagem is None or atualizadas is None else atualizadas + contagem
+        concluidas.extend(grupo)
+        if progresso:
+            progresso(len(concluidas), len(a_compactar))
+
+    pendentes = len(a_compactar) - len(concluidas)
+    mensagem = f'{len(concluidas)} quadra(s) renumerada(s)'
+    if atualizadas is not None:
+        mensagem += f', {atualizadas} linha(s) atualizada(s)'
+    if erro is not None:
+        mensagem = f'Erro: {erro}; {mensagem} e gravada(s) antes do erro, {pendentes} não renumerada(s)'
+    elif pendentes:
+        mensagem += f'; {pendentes} não renumerada(s) (cancelado)'
+    return {'success': erro is None, 'message': mensagem, 'quadras': concluidas,
+            'pendentes': pendentes, 'atualizadas': atualizadas, 'gravadas': gravadas}
+
+
+class TarefaCompactacao(QgsTask):
+    """
+    Renumera a novaordem em segundo plano, um grupo de quadras por transação
+
+    Cancelar interrompe entre os grupos; os já gravados ficam, assim como
+    se um grupo falhar. Emite concluida(resultado) com o dicionário de
+    compactar_novaordem, com as linhas de antes da renumeração dos grupos
+    gravados para o diário.
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, conexao, quadras=None):
+        super().__init__("Renumerar novaordem", QgsTask.CanCancel)
+        self.conexao = conexao
+        self.quadras = quadras
+        self.resultado = None
+
+    def run(self):
+        try:
+            self.resultado = compactar_novaordem(
+                self.conexao, self.quadras,
+                progresso=lambda concluidas, total: self.setProgress(100 * concluidas / total),
+                cancelada=self.isCanceled, ler_gravadas=True)
+            return True
+        except Exception as e:
+            self.resultado = {'success': False, 'message': f"Erro: {e}", 'quadras': [], 'pendentes': 0,
+                              'atualizadas': None, 'gravadas': []}
+            return False
+
+    def finished(self, resultado):
+        self.concluida.emit(self.resultado or {'success': False, 'message': 'Renumeração cancelada',
+                                               'quadras': [], 'pendentes': 0, 'atualizadas': None,
+                                               'gravadas': []})
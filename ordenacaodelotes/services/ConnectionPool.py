@@ -0,0 +1,222 @@
+"""
+Pool de conexões PostgreSQL compartilhado entre os plugins
+Arquivo: ConnectionPool.py
+
+Os pools são identificados pelo nome da conexão PostgreSQL configurada no
+QGIS. O gerenciador fica guardado como propriedade da aplicação, de modo que
+todos os plugins que trazem uma cópia deste arquivo usam os mesmos pools.
+"""
+
+import threading
+import time
+from contextlib import contextmanager
+
+from qgis.PyQt.QtCore import QCoreApplication, QSettings
+from qgis.core import QgsDataSourceUri, QgsProviderRegistry
+
+try:
+    import psycopg2
+    import psycopg2.extensions
+except ImportError:
+    psycopg2 = None
+
+
+_PROPRIEDADE_GERENCIADOR = 'organizaloteclick_pool_conexoes'
+
+TAMANHO_MAXIMO_PADRAO = 4
+TEMPO_ESPERA_PADRAO = 30
+# Conexões ociosas por mais tempo que isso são testadas antes de reutilizar
+TEMPO_TESTE_OCIOSA = 60
+
+
+def disponivel():
+    """Indica se o driver psycopg2 está disponível"""
+    return psycopg2 is not None
+
+
+def uri_da_conexao(nome_conexao):
+    """Retorna a QgsDataSourceUri da conexão PostgreSQL configurada no QGIS"""
+    metadata = QgsProviderRegistry.instance().providerMetadata('postgres')
+    conexoes = metadata.connections() if metadata else {}
+    if nome_conexao not in conexoes:
+        raise Exception(f"Conexão PostgreSQL '{nome_conexao}' não encontrada!")
+    return QgsDataSourceUri(conexoes[nome_conexao].uri())
+
+
+def consulta_cancelada(erro):
+    """Indica se o servidor interrompeu o comando a pedido (cancelamento ou statement_timeout)"""
+    return psycopg2 is not None and isinstance(erro, psycopg2.extensions.QueryCanceledError)
+
+
+def _erro_de_conexao(erro):
+    # QueryCanceled e TransactionRollback (deadlock, serialização) também são
+    # OperationalError, mas a conexão continua boa e repetir não é o esperado
+    if psycopg2 is None or isinstance(erro, (psycopg2.extensions.QueryCanceledError,
+                                             psycopg2.extensions.TransactionRollbackError)):
+        return False
+    return isinstance(erro, (psycopg2.OperationalError, psycopg2.InterfaceError))
+
+
+class PoolConexoes:
+    """Pool de conexões psycopg2 para uma conexão nomeada do QGIS"""
+
+    def __init__(self, nome_conexao, tamanho_maximo=TAMANHO_MAXIMO_PADRAO, tempo_espera=TEMPO_ESPERA_PADRAO):
+        if psycopg2 is None:
+            raise Exception("psycopg2 não está disponível nesta instalação do QGIS!")
+        self.nome_conexao = nome_conexao
+        self.tamanho_maximo = max(1, int(tamanho_maximo))
+        self.tempo_espera = tempo_espera
+        self._livres = []
+        self._abertas = 0
+        self._condicao = threading.Condition()
+
+    def _abrir(self):
+        # connectionInfo(True) resolve a configuração de autenticação (authcfg)
+        dsn = uri_da_conexao(self.nome_conexao).connectionInfo(True)
+        conn = psycopg2.connect(dsn)
+        conn.autocommit = False
+        return conn
+
+    def _valida(self, conn, ociosa_desde):
+        if conn.closed:
+            return False
+        if time.monotonic() - ociosa_desde < TEMPO_TESTE_OCIOSA:
+            return True
+        try:
+            with conn.cursor() as cur:
+                cur.execute('SELECT 1')
+            conn.rollback()
+            return True
+        except Exception:
+            return False
+
+    def obter(self):
+        """Retira uma conexão do pool, abrindo uma nova se houver espaço"""
+        limite = time.monotonic() + self.tempo_espera
+        with self._condicao:
+            while True:
+                while self._livres:
+                    conn, ociosa_desde = self._livres.pop()
+                    if self._valida(conn, ociosa_desde):
+                        return conn
+                    self._descartar(conn)
+                if self._abertas < self.tamanho_maximo:
+                    self._abertas += 1
+                    break
+                restante = limite - time.monotonic()
+                if restante <= 0:
+                    raise Exception(
+                        f"Tempo esgotado aguardando conexão livre em '{self.nome_conexao}'")
+                self._condicao.wait(restante)
+
+        try:
+            return self._abrir()
+        except Exception:
+            with self._condicao:
+                self._abertas -= 1
+                self._condicao.notify()
+            raise
+
+    def devolver(self, conn, descartar=False):
+        """Devolve a conexão ao pool (ou a fecha, se estiver com problema)"""
+        with self._condicao:
+            if descartar or conn.closed:
+                self._descartar(conn)
+            else:
+                self._livres.append((conn, time.monotonic()))
+            self._condicao.notify()
+
+    def _descartar(self, conn):
+        self._abertas -= 1
+        try:
+            conn.close()
+        except Exception:
+            pass
+
+    @contextmanager
+    def conexao(self):
+        """
+        Empresta uma conexão dentro de uma transação
+
+        Faz commit ao sair normalmente e rollback em caso de erro. Conexões
+        que falharam por problema de rede são descartadas.
+        """
+        conn = self.obter()
+        descartar = False
+        try:
+            yield conn
+            conn.commit()
+        except Exception as e:
+            descartar = _erro_de_conexao(e)
+            if not descartar:
+                try:
+                    conn.rollback()
+                except Exception:
+                    descartar = True
+            raise
+        finally:
+            self.devolver(conn, descartar)
+
+    def executar_transacao(self, funcao, tentativas=2):
+        """
+        Executa funcao(cursor) em uma transação, reconectando se a conexão cair
+
+        A transação inteira é repetida, portanto funcao deve apenas executar
+        comandos no cursor.
+        """
+        for tentativa in range(tentativas):
+            try:
+                with self.conexao() as conn:
+                    with conn.cursor() as cur:
+                        return funcao(cur)
+            except Exception as e:
+                if not _erro_de_conexao(e) or tentativa == tentativas - 1:
+                    raise
+
+    def fechar(self):
+        """Fecha todas as conexões livres"""
+        with self._condicao:
+            while self._livres:
+                conn, _ = self._livres.pop()
+                self._descartar(conn)
+
+
+class GerenciadorPools:
+    """Mantém um pool por nome de conexão"""
+
+    def __init__(self):
+        self._pools = {}
+        self._lock = threading.Lock()
+
+    def pool(self, nome_conexao):
+        with self._lock:
+            pool = self._pools.get(nome_conexao)
+            if pool is None:
+                tamanho = QSettings().value(
+                    'OrganizaLoteClick/pool/tamanho_maximo', TAMANHO_MAXIMO_PADRAO, type=int)
+                pool = PoolConexoes(nome_conexao, tamanho)
+                self._pools[nome_conexao] = pool
+            return pool
+
+    def fechar_todos(self):
+        with self._lock:
+            for pool in self._pools.values():
+                pool.fechar()
+            self._pools = {}
+
+
+def obter_gerenciador():
+    """Retorna o gerenciador de pools compartilhado pela aplicação"""
+    app = QCoreApplication.instance()
+    gerenciador = app.property(_PROPRIEDADE_GERENCIADOR) if app else None
+    if gerenciador is None:
+        gerenciador = GerenciadorPools()
+        if app:
+            app.setProperty(_PROPRIEDADE_GERENCIADOR, gerenciador)
+            app.aboutToQuit.connect(gerenciador.fechar_todos)
+    return gerenciador
+
+
+def obter_pool(nome_conexao):
+    """Retorna o pool da conexão PostgreSQL informada"""
+    return obter_gerenciador().pool(nome_conexao)
@@ -0,0 +1,132 @@
+"""
+Comandos preparados e validação das quadras
+Arquivo: Consultas.py
+
+Os comandos da novaordem executados pelo pool (psycopg2) são preparados no
+servidor (PREPARE) uma vez por conexão e depois executados com parâmetros
+(EXECUTE), de modo que o plano é reaproveitado entre as quadras e os lotes
+de uma operação. As quadras vão sempre como um array de inteiros; nos
+caminhos que ainda montam o SQL como texto (API de conexões do QGIS e
+processing), validar_quadras garante que só inteiros chegam ao banco, e o
+filtro da camada de lotes usado no cálculo no servidor passa por
+filtro_isolavel.
+"""
+
+import hashlib
+import threading
+import weakref
+
+
+# Faixa do tipo integer do PostgreSQL
+_MAXIMO_INTEGER = 2147483647
+
+# Comandos já preparados em cada conexão psycopg2; a entrada some junto com a conexão
+_preparados = weakref.WeakKeyDictionary()
+_lock = threading.Lock()
+
+
+def validar_quadra(valor):
+    """
+    Converte ins_quadra em inteiro, recusando qualquer outro valor
+
+    Aceita inteiros e textos só com dígitos (ex.: '101' ou 101.0 vindo de um
+    campo numérico). Levanta ValueError para o resto, inclusive booleanos,
+    negativos e valores fora do tipo integer.
+    """
+    if isinstance(valor, bool):
+        raise ValueError(f"Quadra inválida: {valor!r}")
+    if isinstance(valor, float):
+        if not valor.is_integer():
+            raise ValueError(f"Quadra inválida: {valor!r}")
+        valor = int(valor)
+    elif isinstance(valor, str):
+        texto = valor.strip()
+        if not texto.isdigit() or not texto.isascii():
+            raise ValueError(f"Quadra inválida: {valor!r}")
+        valor = int(texto)
+    elif not isinstance(valor, int):
+        raise ValueError(f"Quadra inválida: {valor!r}")
+    if not 0 <= valor <= _MAXIMO_INTEGER:
+        raise ValueError(f"Quadra fora da faixa: {valor!r}")
+    return valor
+
+
+def validar_quadras(quadras):
+    """Valida uma lista de quadras (ver validar_quadra)"""
+    return [validar_quadra(q) for q in quadras]
+
+
+def array_inteiros(valores):
+    """Literal ARRAY[...]::integer[] para os caminhos sem parâmetros (None vira NULL)"""
+    return 'ARRAY[' + ', '.join('NULL' if v is None else str(validar_quadra(v)) for v in valores) + ']::integer[]'
+
+
+def filtro_isolavel(filtro):
+    """
+    Indica se o filtro da camada pode ir entre parênteses em um comando maior
+
+    O filtro entra no WHERE de uma subconsulta do comando que grava a
+    novaordem; é recusado se tiver ';', comentário ou parêntese sem par fora
+    das strings e identificadores entre aspas, que o fariam escapar dos
+    parênteses. Barras invertidas são recusadas em qualquer lugar: em
+    strings E'...' elas mudam onde a string termina.
+    """
+    if '\\' in filtro:
+        return False
+    profundidade = 0
+    aspas = None
+    indice = 0
+    while indice < len(filtro):
+        caractere = filtro[indice]
+        if aspas:
+            if caractere == aspas:
+                if filtro[indice + 1:indice + 2] == aspas:
+                    indice += 1
+                else:
+                    aspas = None
+        elif caractere in ("'", '"'):
+            aspas = caractere
+        elif caractere == ';' or filtro[indice:indice + 2] in ('--', '/*'):
+            return False
+        elif caractere == '(':
+            profundidade += 1
+        elif caractere == ')':
+            profundidade -= 1
+            if profundidade < 0:
+                return False
+        indice += 1
+    return aspas is None and profundidade == 0
+
+
+def nome_comando(sql):
+    """Nome estável do comando preparado, derivado do texto do SQL"""
+    return 'organizalote_' + hashlib.md5(sql.encode('utf-8')).hexdigest()[:16]
+
+
+def executar_preparado(cur, sql, parametros=(), tipos=()):
+    """
+    Executa o SQL como comando preparado na conexão do cursor
+
+    Args:
+        cur: Cursor psycopg2
+        sql: Comando com os parâmetros como $1, $2...; não é formatado pelo
+            psycopg2, então pode conter '%'
+        parametros: Valores dos parâmetros
+        tipos: Tipos SQL dos parâmetros (ex.: ['integer[]'])
+
+    O PREPARE vale para a sessão e não é desfeito por rollback, por isso o
+    comando fica registrado assim que é preparado.
+    """
+    nome = nome_comando(sql)
+    conexao = cur.connection
+    with _lock:
+        preparado = nome in _preparados.get(conexao, ())
+    if not preparado:
+        declaracao = f" ({', '.join(tipos)})" if tipos else ''
+        cur.execute(f'PREPARE {nome}{declaracao} AS {sql}')
+        with _lock:
+            _preparados.setdefault(conexao, set()).add(nome)
+    if parametros:
+        cur.execute(f"EXECUTE {nome} ({', '.join(['%s'] * len(parametros))})", list(parametros))
+    else:
+        cur.execute(f'EXECUTE {nome}')
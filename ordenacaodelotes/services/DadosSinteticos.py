@@ -0,0 +1,109 @@
+"""
+Geração de camadas sintéticas de quadras e lotes
+Arquivo: DadosSinteticos.py
+
+Monta uma grade de quadras retangulares com os lotes dispostos em duas
+fileiras, numerados no sentido horário, com os mesmos campos usados pelo
+plugin (ins_quadra, matricula, ordem, nv_ordem). Serve para medir o
+desempenho do fluxo de ordenação em qualquer escala sem acesso ao banco.
+"""
+
+import math
+import os
+
+from qgis.core import (
+    QgsCoordinateTransformContext, QgsFeature, QgsGeometry, QgsPointXY,
+    QgsVectorFileWriter, QgsVectorLayer)
+
+
+SRID = 31984
+ORIGEM = (550000.0, 8600000.0)
+LARGURA_LOTE = 12.0
+PROFUNDIDADE_LOTE = 30.0
+LARGURA_RUA = 15.0
+
+
+def _retangulo(x, y, largura, altura):
+    return QgsGeometry.fromPolygonXY([[
+        QgsPointXY(x, y), QgsPointXY(x, y + altura), QgsPointXY(x + largura, y + altura),
+        QgsPointXY(x + largura, y), QgsPointXY(x, y)]])
+
+
+def gerar_camadas(total_lotes, lotes_por_quadra=20, quadra_inicial=101):
+    """
+    Gera as camadas em memória 'Quadra' e 'Lote'
+
+    Args:
+        total_lotes: Número total de lotes
+        lotes_por_quadra: Lotes de cada quadra (a última pode ter menos)
+        quadra_inicial: ins_quadra da primeira quadra
+
+    Returns:
+        Tupla (camada_quadras, camada_lotes)
+    """
+    lotes_por_quadra = max(2, int(lotes_por_quadra))
+    num_quadras = max(1, math.ceil(total_lotes / lotes_por_quadra))
+    colunas = max(1, math.ceil(math.sqrt(num_quadras)))
+
+    camada_quadras = QgsVectorLayer(
+        f"Polygon?crs=EPSG:{SRID}&field=ins_quadra:integer", "Quadra", "memory")
+    camada_lotes = QgsVectorLayer(
+        f"Polygon?crs=EPSG:{SRID}&field=ins_quadra:integer&field=matricula:integer"
+        "&field=ordem:integer&field=nv_ordem:integer", "Lote", "memory")
+
+    quadras = []
+    lotes = []
+    matricula = 1
+    restantes = total_lotes
+    for indice in range(num_quadras):
+        quantidade = min(lotes_por_quadra, restantes)
+        restantes -= quantidade
+        ins_quadra = quadra_inicial + indice
+        superior = math.ceil(quantidade / 2)
+        inferior = quantidade - superior
+
+        largura = max(superior, 1) * LARGURA_LOTE
+        x0 = ORIGEM[0] + (indice % colunas) * (largura + LARGURA_RUA)
+        y0 = ORIGEM[1] - (indice // colunas) * (2 * PROFUNDIDADE_LOTE + LARGURA_RUA)
+
+        quadra = QgsFeature(camada_quadras.fields())
+        quadra.setAttributes([ins_quadra])
+        quadra.setGeometry(_retangulo(x0, y0, largura, 2 * PROFUNDIDADE_LOTE))
+        quadras.append(quadra)
+
+        # Fileira de cima da esquerda para a direita, de baixo da direita para a esquerda
+        posicoes = [(x0 + i * LARGURA_LOTE, y0 + PROFUNDIDADE_LOTE) for i in range(superior)]
+        posicoes += [(x0 + (superior - 1 - i) * LARGURA_LOTE, y0) for i in range(inferior)]
+        for ordem, (x, y) in enumerate(posicoes, 1):
+            lote = QgsFeature(camada_lotes.fields())
+            lote.setAttributes([ins_quadra, matricula, ordem, ordem])
+            lote.setGeometry(_retangulo(x, y, LARGURA_LOTE, PROFUNDIDADE_LOTE))
+            lotes.append(lote)
+            matricula += 1
+
+    camada_quadras.dataProvider().addFeatures(quadras)
+    camada_lotes.dataProvider().addFeatures(lotes)
+    camada_quadras.updateExtents()
+    camada_lotes.updateExtents()
+    return camada_quadras, camada_lotes
+
+
+def salvar_geopackage(camada, caminho, nome_tabela):
+    """Grava a camada em uma tabela do GeoPackage e retorna a camada aberta do arquivo"""
+    opcoes = QgsVectorFileWriter.SaveVectorOptions()
+    opcoes.driverName = 'GPKG'
+    opcoes.layerName = nome_tabela
+    opcoes.actionOnExistingFile = (
+        QgsVectorFileWriter.CreateOrOverwriteLayer if os.path.exists(caminho)
+        else QgsVectorFileWriter.CreateOrOverwriteFile)
+
+    gravar = getattr(QgsVectorFileWriter, 'writeAsVectorFormatV3', None) \
+        or QgsVectorFileWriter.writeAsVectorFormatV2
+    resultado = gravar(camada, caminho, QgsCoordinateTransformContext(), opcoes)
+    if resultado[0] != QgsVectorFileWriter.NoError:
+        raise Exception(f"Erro ao gravar {nome_tabela} em {caminho}: {resultado[1]}")
+
+    aberta = QgsVectorLayer(f"{caminho}|layername={nome_tabela}", camada.name(), "ogr")
+    if not aberta.isValid():
+        raise Exception(f"Não foi possível abrir {nome_tabela} em {caminho}")
+    return aberta
@@ -0,0 +1,109 @@
+"""
+Diário de instantâneos da tabela novaordem
+Arquivo: Diario.py
+
+A cada gravação o plugin guarda, por quadra, o estado anterior da
+novaordem (matricula → n_ordem) e a ordem original dos lotes (campo
+'ordem'). A restauração e o desfazer reaplicam um instantâneo em uma única
+gravação, sem reler a camada de lotes. O diário é um arquivo SQLite local
+(o conteúdo de cada instantâneo é montado em Instantaneo.py); as
+configurações ficam em QSettings:
+
+    OrganizaLoteClick/diario/arquivo  arquivo do diário (padrão: pasta do perfil do QGIS)
+    OrganizaLoteClick/diario/niveis   instantâneos guardados por quadra (padrão: 20)
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsApplication
+
+
+CHAVE_ARQUIVO = 'OrganizaLoteClick/diario/arquivo'
+CHAVE_NIVEIS = 'OrganizaLoteClick/diario/niveis'
+ARQUIVO_PADRAO = 'organizaloteclick_diario.sqlite'
+NIVEIS_PADRAO = 20
+
+
+class DiarioNovaOrdem:
+    """Instantâneos por conexão e quadra, do mais recente para o mais antigo"""
+
+    def __init__(self, caminho=None, niveis=None):
+        settings = QSettings()
+        self.caminho = caminho or settings.value(CHAVE_ARQUIVO, '', type=str) or os.path.join(
+            QgsApplication.qgisSettingsDirPath(), ARQUIVO_PADRAO)
+        self.niveis = niveis or settings.value(CHAVE_NIVEIS, NIVEIS_PADRAO, type=int)
+
+    def _conectar(self):
+        # Uma conexão por chamada: o diário é usado pela thread principal e pelas tarefas
+        conexao = sqlite3.connect(self.caminho)
+        conexao.execute(
+            'CREATE TABLE IF NOT EXISTS instantaneos ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, conexao TEXT NOT NULL, ins_quadra INTEGER NOT NULL, '
+            'data TEXT NOT NULL, descricao TEXT, sem_matricula INTEGER NOT NULL, linhas TEXT NOT NULL)')
+        conexao.execute(
+            'CREATE INDEX IF NOT EXISTS instantaneos_quadra ON instantaneos (conexao, ins_quadra, id)')
+        return conexao
+
+    def registrar(self, conexao, instantaneo):
+        """Guarda o instantâneo e descarta os mais antigos que o limite de níveis"""
+        return self.registrar_varios(conexao, [instantaneo])[0]
+
+    def registrar_varios(self, conexao, instantaneos):
+        """Guarda os instantâneos em uma única transação do SQLite, retornando seus ids"""
+        data = datetime.now().isoformat(timespec='seconds')
+        ids = []
+        banco = self._conectar()
+        try:
+            with banco:
+                for instantaneo in instantaneos:
+                    cursor = banco.execute(
+                        'INSERT INTO instantaneos (conexao, ins_quadra, data, descricao, sem_matricula, linhas) '
+                        'VALUES (?, ?, ?, ?, ?, ?)',
+                        (conexao, instantaneo['ins_quadra'], data,
+                         instantaneo.get('descricao', ''), instantaneo['sem_matricula'],
+                         json.dumps(instantaneo['linhas'], default=str)))
+                    banco.execute(
+                        'DELETE FROM instantaneos WHERE conexao = ? AND ins_quadra = ? AND id NOT IN '
+                        '(SELECT id FROM instantaneos WHERE conexao = ? AND ins_quadra = ? ORDER BY id DESC LIMIT ?)',
+                        (conexao, instantaneo['ins_quadra'], conexao, instantaneo['ins_quadra'], self.niveis))
+                    ids.append(cursor.lastrowid)
+            return ids
+        finally:
+            banco.close()
+
+    def ultimo(self, conexao, ins_quadra):
+        """Instantâneo mais recente da quadra, com 'id' e 'data', ou None"""
+        banco = self._conectar()
+        try:
+            linha = banco.execute(
+                'SELECT id, data, descricao, sem_matricula, linhas FROM instantaneos '
+                'WHERE conexao = ? AND ins_quadra = ? ORDER BY id DESC LIMIT 1',
+                (conexao, int(ins_quadra))).fetchone()
+        finally:
+            banco.close()
+        if linha is None:
+            return None
+        return {'id': linha[0], 'data': linha[1], 'descricao': linha[2], 'sem_matricula': linha[3],
+                'ins_quadra': int(ins_quadra), 'linhas': json.loads(linha[4])}
+
+    def niveis_disponiveis(self, conexao, ins_quadra):
+        """Número de instantâneos guardados para a quadra"""
+        banco = self._conectar()
+        try:
+            return banco.execute('SELECT COUNT(*) FROM instantaneos WHERE conexao = ? AND ins_quadra = ?',
+                                 (conexao, int(ins_quadra))).fetchone()[0]
+        finally:
+            banco.close()
+
+    def remover(self, id_instantaneo):
+        """Remove um instantâneo já reaplicado"""
+        banco = self._conectar()
+        try:
+            with banco:
+                banco.execute('DELETE FROM instantaneos WHERE id = ?', (id_instantaneo,))
+        finally:
+            banco.close()
@@ -0,0 +1,261 @@
+"""
+Fila local das gravações feitas sem conexão com o servidor
+Arquivo: FilaOffline.py
+
+No modo offline as reorganizações e restaurações não vão para a novaordem:
+as linhas calculadas de cada quadra ficam em um arquivo SQLite local, junto
+com a versão da quadra no servidor conhecida quando a operação foi feita
+(ver Versoes.versao_linhas). As versões são guardadas ao ligar o modo
+offline, ainda com conexão, e a cada sincronização.
+
+A sincronização compacta a fila, ficando só com a última operação de cada
+quadra, lê as linhas gravadas de todas as quadras em uma única consulta e
+grava as quadras sem conflito em uma única transação (substituir_quadras,
+com as versões conferidas sob trava). Uma quadra está em conflito quando a
+versão no servidor não é mais a conhecida na primeira operação da fila, ou
+seja, outra sessão a gravou enquanto o operador estava offline; ela fica na
+fila até ser sobrescrita (forcar=True) ou descartada. Sem versão conhecida,
+a quadra só é gravada se o servidor não tiver linhas dela.
+
+Configurações em QSettings:
+
+    OrganizaLoteClick/offline/ativo    modo offline ligado (padrão: false)
+    OrganizaLoteClick/offline/arquivo  arquivo da fila (padrão: pasta do perfil do QGIS)
+"""
+
+import json
+import os
+import sqlite3
+from datetime import datetime
+
+from qgis.PyQt.QtCore import QSettings, pyqtSignal
+from qgis.core import QgsApplication, QgsTask
+
+from .CopyLoader import wkb_da_geometria
+from .ClassificacaoFila import classificar, compactar
+from .NovaOrdem import ConflitoVersao, linhas_gravadas, substituir_quadras
+from .Versoes import versoes_das_linhas
+
+
+CHAVE_ATIVO = 'OrganizaLoteClick/offline/ativo'
+CHAVE_ARQUIVO = 'OrganizaLoteClick/offline/arquivo'
+ARQUIVO_PADRAO = 'organizaloteclick_fila.sqlite'
+
+
+def modo_offline_configurado():
+    return QSettings().value(CHAVE_ATIVO, False, type=bool)
+
+
+def configurar_modo_offline(ativo):
+    QSettings().setValue(CHAVE_ATIVO, bool(ativo))
+
+
+def _linhas_para_json(linhas):
+    # A geometria vai como WKB hexadecimal; na gravação o WKB segue direto para o COPY
+    itens = []
+    for linha in linhas:
+        wkb = wkb_da_geometria(linha.get('geometria'))
+        itens.append([linha['matricula'], linha['n_ordem'], None if wkb is None else wkb.hex()])
+    return json.dumps(itens, default=str)
+
+
+def _linhas_do_json(ins_quadra, texto):
+    return [{'matricula': matricula, 'ins_quadra': ins_quadra, 'n_ordem': n_ordem,
+             'geometria': None if wkb is None else bytes.fromhex(wkb)}
+            for matricula, n_ordem, wkb in json.loads(texto)]
+
+
+class FilaOffline:
+    """Operações pendentes e versões conhecidas, por conexão e quadra"""
+
+    def __init__(self, caminho=None):
+        self.caminho = caminho or QSettings().value(CHAVE_ARQUIVO, '', type=str) or os.path.join(
+            QgsApplication.qgisSettingsDirPath(), ARQUIVO_PADRAO)
+
+    def _conectar(self):
+        # Uma conexão por chamada, como no diário: a fila é usada pela thread principal e pela sincronização
+        conexao = sqlite3.connect(self.caminho)
+        conexao.execute(
+            'CREATE TABLE IF NOT EXISTS operacoes ('
+            'id INTEGER PRIMARY KEY AUTOINCREMENT, conexao TEXT NOT NULL, ins_quadra INTEGER NOT NULL, '
+            'data TEXT NOT NULL, descricao TEXT, versao_base TEXT, linhas TEXT NOT NULL)')
+        conexao.execute(
+            'CREATE INDEX IF NOT EXISTS operacoes_quadra ON operacoes (conexao, ins_quadra, id)')
+        conexao.execute(
+            'CREATE TABLE IF NOT EXISTS versoes ('
+            'conexao TEXT NOT NULL, ins_quadra INTEGER NOT NULL, versao TEXT NOT NULL, '
+            'PRIMARY KEY (conexao, ins_quadra))')
+        return conexao
+
+    def lembrar_versoes(self, conexao, versoes, substituir=False):
+        """
+        Guarda {ins_quadra: versão} das quadras como estão no servidor
+
+        Com substituir=True as versões são as da tabela inteira e apagam as
+        guardadas antes para a conexão.
+        """
+        banco = self._conectar()
+        try:
+            with banco:
+                if substituir:
+                    banco.execute('DELETE FROM versoes WHERE conexao = ?', (conexao,))
+                banco.executemany(
+                    'INSERT OR REPLACE INTO versoes (conexao, ins_quadra, versao) VALUES (?, ?, ?)',
+                    [(conexao, int(q), versao) for q, versao in versoes.items()])
+        finally:
+            banco.close()
+
+    def registrar(self, conexao, descricao, quadras, linhas):
+        """
+        Guarda as linhas calculadas de cada quadra como uma operação pendente
+
+        Returns:
+            Número de operações registradas (uma por quadra)
+        """
+        por_quadra = {int(q): [] for q in quadras}
+        for linha in linhas:
+            por_quadra[int(linha['ins_quadra'])].append(linha)
+        data = datetime.now().isoformat(timespec='seconds')
+        banco = self._conectar()
+        try:
+            with banco:
+                for ins_quadra, linhas_quadra in por_quadra.items():
+                    banco.execute(
+                        'INSERT INTO operacoes (conexao, ins_quadra, data, descricao, versao_base, linhas) '
+                        'VALUES (?, ?, ?, ?, (SELECT versao FROM versoes WHERE conexao = ? AND ins_quadra = ?), ?)',
+                        (conexao, ins_quadra, data, descricao, conexao, ins_quadra, _linhas_para_json(linhas_quadra)))
+            return len(por_quadra)
+        finally:
+            banco.close()
+
+    def pendentes(self, conexao=None):
+        """Número de operações na fila (da conexão, ou de todas)"""
+        banco = self._conectar()
+        try:
+            if conexao is None:
+                return banco.execute('SELECT COUNT(*) FROM operacoes').fetchone()[0]
+            return banco.execute('SELECT COUNT(*) FROM operacoes WHERE conexao = ?', (conexao,)).fetchone()[0]
+        finally:
+            banco.close()
+
+    def compactadas(self, conexao, quadras=None):
+        """Última operação de cada quadra da conexão (ver compactar)"""
+        banco = self._conectar()
+        try:
+            registros = banco.execute(
+                'SELECT id, ins_quadra, data, descricao, versao_base, linhas FROM operacoes '
+                'WHERE conexao = ? ORDER BY id', (conexao,)).fetchall()
+        finally:
+            banco.close()
+        filtro = None if quadras is None else {int(q) for q in quadras}
+        operacoes = [{'id': id_operacao, 'ins_quadra': ins_quadra, 'data': data, 'descricao': descricao,
+                      'versao_base': versao_base, 'linhas': _linhas_do_json(ins_quadra, linhas)}
+                     for id_operacao, ins_quadra, data, descricao, versao_base, linhas in registros
+                     if filtro is None or ins_quadra in filtro]
+        return compactar(operacoes)
+
+    def remover(self, ids):
+        """Remove as operações já gravadas ou descartadas"""
+        banco = self._conectar()
+        try:
+            with banco:
+                banco.executemany('DELETE FROM operacoes WHERE id = ?', [(i,) for i in ids])
+        finally:
+            banco.close()
+
+    def descartar(self, conexao, quadras):
+        """Remove da fila todas as operações das quadras"""
+        banco = self._conectar()
+        try:
+            with banco:
+                banco.executemany('DELETE FROM operacoes WHERE conexao = ? AND ins_quadra = ?',
+                                  [(conexao, int(q)) for q in quadras])
+        finally:
+            banco.close()
+
+
+def _resultado(success, message, **valores):
+    resultado = {'success': success, 'message': message, 'sincronizadas': [], 'iguais': [], 'conflitos': [],
+                 'alteracoes': None, 'gravadas': []}
+    resultado.update(valores)
+    return resultado
+
+
+def sincronizar(fila, conexao, quadras=None, forcar=False):
+    """
+    Grava no servidor a última operação de cada quadra da fila
+
+    Args:
+        fila: FilaOffline
+        conexao: Nome da conexão PostgreSQL
+        quadras: Só estas quadras da fila (padrão: todas)
+        forcar: Se True, as quadras em conflito também são gravadas
+
+    Returns:
+        Dicionário com 'success', 'message', 'sincronizadas' (quadras
+        gravadas), 'iguais' (quadras que o servidor já tinha como na fila),
+        'conflitos', 'alteracoes' (contagem da gravação) e 'gravadas'
+        (linhas do servidor antes da gravação, para o diário)
+
+    As quadras gravadas entram em uma única transação; se outra sessão
+    gravar alguma delas entre a leitura e a gravação, nada é gravado e a
+    fila fica como estava.
+    """
+    compactadas = fila.compactadas(conexao, quadras)
+    if not compactadas:
+        return _resultado(True, 'A fila offline está vazia')
+
+    gravadas = linhas_gravadas(conexao, list(compactadas))
+    estado = classificar(compactadas, gravadas)
+    gravar = sorted(estado['gravar'] + estado['conflitos']) if forcar else estado['gravar']
+    conflitos = [] if forcar else estado['conflitos']
+
+    contagem = None
+    if gravar:
+        linhas = [linha for q in gravar for linha in compactadas[q]['linhas']]
+        try:
+            contagem = substituir_quadras(conexao, gravar, linhas, incremental=True,
+                                          versoes={q: estado['versoes'][q] for q in gravar})
+        except ConflitoVersao as e:
+            return _resultado(False, f"Erro: {e}", conflitos=e.quadras, gravadas=gravadas)
+
+    concluidas = sorted(gravar + estado['iguais'])
+    fila.remover([i for q in concluidas for i in compactadas[q]['ids']])
+    # As versões vêm do servidor, no formato em que ele devolve as matrículas
+    fila.lembrar_versoes(conexao, versoes_das_linhas(linhas_gravadas(conexao, concluidas), concluidas))
+
+    operacoes = sum(compactadas[q]['operacoes'] for q in concluidas)
+    mensagem = f"{len(concluidas)} quadra(s) sincronizada(s) ({operacoes} operação(ões) da fila)"
+    if conflitos:
+        mensagem += f"; {len(conflitos)} em conflito, mantida(s) na fila"
+    return _resultado(True, mensagem, sincronizadas=sorted(gravar), iguais=estado['iguais'], conflitos=conflitos,
+                      alteracoes=contagem, gravadas=gravadas)
+
+
+class TarefaSincronizacao(QgsTask):
+    """
+    Sincroniza a fila offline em segundo plano
+
+    Emite concluida(resultado) com o dicionário de sincronizar.
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, fila, conexao, quadras=None, forcar=False):
+        super().__init__("Sincronizar fila offline", QgsTask.CanCancel)
+        self.fila = fila
+        self.conexao = conexao
+        self.quadras = quadras
+        self.forcar = forcar
+        self.resultado = None
+
+    def run(self):
+        try:
+            self.resultado = sincronizar(self.fila, self.conexao, self.quadras, self.forcar)
+            return self.resultado['success']
+        except Exception as e:
+            self.resultado = _resultado(False, f"Erro: {e}")
+            return False
+
+    def finished(self, resultado):
+        self.concluida.emit(self.resultado or _resultado(False, 'Sincronização cancelada'))
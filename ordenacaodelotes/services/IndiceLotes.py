@@ -0,0 +1,212 @@
+"""
+Índice em memória dos lotes por quadra
+Arquivo: IndiceLotes.py
+"""
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.core import QgsFeatureRequest
+
+
+# nv_ordem não entra no índice: vem da novaordem, gravada pelo plugin e por
+# outras sessões sem que a camada emita sinal (ver ler_com_nv_ordem)
+CAMPOS_INDICE = ('matricula', 'ordem')
+
+
+def valor_ou_none(valor):
+    """Converte NULL do QGIS em None"""
+    if valor is None or (isinstance(valor, QVariant) and valor.isNull()):
+        return None
+    return valor
+
+
+def normalizar_quadra(valor):
+    """Normaliza ins_quadra para usar como chave do índice"""
+    valor = valor_ou_none(valor)
+    if valor is None:
+        return None
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        return str(valor)
+
+
+class IndiceLotes:
+    """
+    Índice dos lotes de uma camada agrupados por ins_quadra
+
+    Lê a camada uma única vez e se mantém atualizado pelos sinais de
+    feição adicionada, alterada e excluída, de modo que a consulta de uma
+    quadra custa apenas o tamanho da quadra. versao muda a cada alteração,
+    para quem guarda dados derivados do índice.
+    """
+
+    def __init__(self, camada):
+        self.camada = camada
+        self.versao = 0
+        self._lotes_por_quadra = {}
+        self._quadra_por_fid = {}
+        self._construido = False
+        self._conectar()
+
+    def _conectar(self):
+        self.camada.featureAdded.connect(self._ao_adicionar)
+        self.camada.featureDeleted.connect(self._ao_excluir)
+        self.camada.attributeValueChanged.connect(self._ao_alterar)
+        self.camada.afterCommitChanges.connect(self.invalidar)
+        self.camada.afterRollBack.connect(self.invalidar)
+        self.camada.dataSourceChanged.connect(self.invalidar)
+        self.camada.subsetStringChanged.connect(self.invalidar)
+
+    def desconectar(self):
+        """Desconecta o índice dos sinais da camada"""
+        sinais = (
+            (self.camada.featureAdded, self._ao_adicionar),
+            (self.camada.featureDeleted, self._ao_excluir),
+            (self.camada.attributeValueChanged, self._ao_alterar),
+            (self.camada.afterCommitChanges, self.invalidar),
+            (self.camada.afterRollBack, self.invalidar),
+            (self.camada.dataSourceChanged, self.invalidar),
+            (self.camada.subsetStringChanged, self.invalidar),
+        )
+        for sinal, slot in sinais:
+            try:
+                sinal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+
+    def invalidar(self):
+        """Descarta o índice; será reconstruído na próxima consulta"""
+        self.versao += 1
+        self._lotes_por_quadra = {}
+        self._quadra_por_fid = {}
+        self._construido = False
+
+    def construir(self):
+        """Lê a camada inteira uma vez e monta o índice"""
+        self.invalidar()
+        nomes = ['ins_quadra'] + [c for c in CAMPOS_INDICE if c in self.camada.fields().names()]
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(nomes, self.camada.fields())
+
+        for feature in self.camada.getFeatures(request):
+            self._inserir(feature)
+        self._construido = True
+
+    def _garantir_construido(self):
+        if not self._construido:
+            self.construir()
+
+    def _inserir(self, feature):
+        ins_quadra = normalizar_quadra(feature['ins_quadra'])
+        if ins_quadra is None:
+            return
+        nomes = feature.fields().names()
+        lote = {campo: (valor_ou_none(feature[campo]) if campo in nomes else None) for campo in CAMPOS_INDICE}
+        self._lotes_por_quadra.setdefault(ins_quadra, {})[feature.id()] = lote
+        self._quadra_por_fid[feature.id()] = ins_quadra
+
+    def _remover(self, fid):
+        ins_quadra = self._quadra_por_fid.pop(fid, None)
+        if ins_quadra is None:
+            return
+        lotes = self._lotes_por_quadra.get(ins_quadra)
+        if lotes is not None:
+            lotes.pop(fid, None)
+            if not lotes:
+                del self._lotes_por_quadra[ins_quadra]
+
+    def _ao_adicionar(self, fid):
+        self.versao += 1
+        if not self._construido:
+            return
+        feature = self.camada.getFeature(fid)
+        if feature.isValid():
+            self._inserir(feature)
+
+    def _ao_excluir(self, fid):
+        self.versao += 1
+        if self._construido:
+            self._remover(fid)
+
+    def _ao_alterar(self, fid, indice_campo, valor):
+        self.versao += 1
+        if not self._construido:
+            return
+        campo = self.camada.fields().at(indice_campo).name()
+        if campo == 'ins_quadra':
+            self._remover(fid)
+            feature = self.camada.getFeature(fid)
+            if feature.isValid():
+                self._inserir(feature)
+        elif campo in CAMPOS_INDICE:
+            ins_quadra = self._quadra_por_fid.get(fid)
+            if ins_quadra is not None:
+                self._lotes_por_quadra[ins_quadra][fid][campo] = valor_ou_none(valor)
+
+    def lotes_da_quadra(self, ins_quadra):
+        """Retorna {fid: {'matricula', 'ordem'}} dos lotes da quadra"""
+        self._garantir_construido()
+        return dict(self._lotes_por_quadra.get(normalizar_quadra(ins_quadra), {}))
+
+    def fids_das_quadras(self, quadras):
+        """Retorna os ids das feições de todas as quadras informadas"""
+        self._garantir_construido()
+        fids = []
+        for ins_quadra in quadras:
+            fids.extend(self._lotes_por_quadra.get(normalizar_quadra(ins_quadra), {}).keys())
+        return fids
+
+    def quadras(self):
+        """Retorna as quadras presentes no índice"""
+        self._garantir_construido()
+        return list(self._lotes_por_quadra.keys())
+
+    def ler_com_nv_ordem(self, quadras=None):
+        """
+        Lê da camada matricula, ordem e nv_ordem dos lotes, a cada chamada
+
+        Args:
+            quadras: Só estas quadras, pelas feições do índice (padrão: a
+                camada inteira)
+
+        Returns:
+            {ins_quadra: [{'matricula', 'ordem', 'nv_ordem'}]}
+        """
+        campos = self.camada.fields()
+        nomes = ['ins_quadra'] + [c for c in CAMPOS_INDICE + ('nv_ordem',) if c in campos.names()]
+        request = QgsFeatureRequest()
+        request.setFlags(QgsFeatureRequest.NoGeometry)
+        request.setSubsetOfAttributes(nomes, campos)
+        if quadras is not None:
+            request.setFilterFids(self.fids_das_quadras(quadras))
+
+        lotes_por_quadra = {}
+        for f in self.camada.getFeatures(request):
+            ins_quadra = normalizar_quadra(f['ins_quadra'])
+            if ins_quadra is None:
+                continue
+            lotes_por_quadra.setdefault(ins_quadra, []).append(
+                {campo: (valor_ou_none(f[campo]) if campo in nomes else None)
+                 for campo in CAMPOS_INDICE + ('nv_ordem',)})
+        return lotes_por_quadra
+
+    def ler_lotes(self, quadras):
+        """
+        Lê matricula, ordem e geometria dos lotes das quadras pelo índice
+
+        Returns:
+            {ins_quadra: [{'matricula', 'ordem', 'geometria'}]}
+        """
+        request = QgsFeatureRequest()
+        request.setFilterFids(self.fids_das_quadras(quadras))
+        request.setSubsetOfAttributes(['ins_quadra', 'matricula', 'ordem'], self.camada.fields())
+
+        lotes_por_quadra = {}
+        for f in self.camada.getFeatures(request):
+            lotes_por_quadra.setdefault(normalizar_quadra(f['ins_quadra']), []).append({
+                'matricula': valor_ou_none(f['matricula']),
+                'ordem': valor_ou_none(f['ordem']),
+                'geometria': f.geometry()
+            })
+        return lotes_por_quadra
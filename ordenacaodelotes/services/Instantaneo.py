@@ -0,0 +1,64 @@
+"""
+Instantâneos de quadra guardados no diário
+Arquivo: Instantaneo.py
+
+Funções puras, sem dependência do QGIS: montam o instantâneo de uma quadra
+(novaordem gravada e ordem original dos lotes) e extraem dele as linhas do
+desfazer e da restauração. O armazenamento fica em Diario.py.
+"""
+
+
+def montar_instantaneo(ins_quadra, gravadas, lotes, descricao=''):
+    """
+    Monta o instantâneo de uma quadra antes de uma gravação
+
+    Args:
+        ins_quadra: Quadra
+        gravadas: Tuplas (matricula, ins_quadra, n_ordem) gravadas em novaordem
+        lotes: Lotes da quadra com 'matricula' e 'ordem'
+        descricao: Operação que vai alterar a quadra
+
+    Returns:
+        Dicionário com 'ins_quadra', 'descricao', 'linhas' (lista de
+        [matricula, n_ordem gravado ou None, ordem original ou None, gravada])
+        e 'sem_matricula' (linhas gravadas e lotes sem matrícula, que não
+        podem ser reaplicados)
+    """
+    linhas = {}
+    sem_matricula = 0
+    for matricula, _, n_ordem in gravadas:
+        if matricula is None:
+            sem_matricula += 1
+        else:
+            linhas[matricula] = [matricula, n_ordem, None, True]
+    for lote in lotes:
+        matricula = lote['matricula']
+        if matricula is None or matricula == '':
+            sem_matricula += 1
+        else:
+            linhas.setdefault(matricula, [matricula, None, None, False])[2] = lote['ordem']
+    return {'ins_quadra': int(ins_quadra), 'descricao': descricao,
+            'linhas': list(linhas.values()), 'sem_matricula': sem_matricula}
+
+
+def linhas_desfazer(instantaneo):
+    """Linhas de novaordem que voltam a quadra ao estado do instantâneo"""
+    return [{'matricula': m, 'ins_quadra': instantaneo['ins_quadra'], 'n_ordem': n_ordem}
+            for m, n_ordem, _, gravada in instantaneo['linhas'] if gravada]
+
+
+def linhas_restauracao(instantaneo):
+    """Linhas de novaordem com a ordem original dos lotes do instantâneo"""
+    return [{'matricula': m, 'ins_quadra': instantaneo['ins_quadra'], 'n_ordem': ordem}
+            for m, _, ordem, _ in instantaneo['linhas'] if ordem is not None]
+
+
+def lotes_do_instantaneo(instantaneo):
+    """Lotes ('matricula', 'ordem') lidos da camada quando o instantâneo foi feito"""
+    return [{'matricula': m, 'ordem': ordem} for m, _, ordem, _ in instantaneo['linhas'] if ordem is not None]
+
+
+def restauravel(instantaneo):
+    """Indica se a ordem original pode ser restaurada só com o instantâneo"""
+    return (instantaneo is not None and instantaneo['sem_matricula'] == 0
+            and any(ordem is not None for _, _, ordem, _ in instantaneo['linhas']))
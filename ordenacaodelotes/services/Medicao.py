@@ -0,0 +1,175 @@
+"""
+Medição de tempo das etapas das operações
+Arquivo: Medicao.py
+
+Cada operação (reorganização, restauração) registra a duração de suas
+etapas, com o número de linhas envolvidas, em um arquivo JSON lines, uma
+linha por etapa e uma linha de fechamento por operação. Desligada por
+padrão; as configurações ficam em QSettings:
+
+    OrganizaLoteClick/medicao/ativa       liga a medição (padrão: false)
+    OrganizaLoteClick/medicao/arquivo     arquivo .jsonl (padrão: pasta do perfil do QGIS)
+    OrganizaLoteClick/medicao/resumo_log  resumo de cada operação no log (padrão: true)
+
+Com a medição desligada, iniciar_operacao retorna MEDICAO_NULA, cujas
+etapas não leem o relógio nem gravam nada.
+"""
+
+import json
+import os
+import threading
+import time
+import uuid
+from datetime import datetime
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsApplication, QgsMessageLog, Qgis
+
+
+CHAVE_ATIVA = 'OrganizaLoteClick/medicao/ativa'
+CHAVE_ARQUIVO = 'OrganizaLoteClick/medicao/arquivo'
+CHAVE_RESUMO = 'OrganizaLoteClick/medicao/resumo_log'
+ARQUIVO_PADRAO = 'organizaloteclick_medicao.jsonl'
+
+_trava_arquivo = threading.Lock()
+
+
+def medicao_ativa():
+    return QSettings().value(CHAVE_ATIVA, False, type=bool)
+
+
+def arquivo_medicao():
+    """Caminho do arquivo JSON lines configurado"""
+    arquivo = QSettings().value(CHAVE_ARQUIVO, '', type=str)
+    return arquivo or os.path.join(QgsApplication.qgisSettingsDirPath(), ARQUIVO_PADRAO)
+
+
+def gravar_registro(arquivo, registro):
+    """Acrescenta um registro ao arquivo JSON lines (seguro entre threads)"""
+    linha = json.dumps(registro, ensure_ascii=False, default=str) + '\n'
+    with _trava_arquivo:
+        with open(arquivo, 'a', encoding='utf-8') as saida:
+            saida.write(linha)
+
+
+class _MedicaoNula:
+    """Operação e etapa que não medem nada, usada com a medição desligada"""
+
+    id = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, *excecao):
+        return False
+
+    def etapa(self, nome, **dados):
+        return self
+
+    def registrar(self, **dados):
+        pass
+
+    def finalizar(self, sucesso=True, **dados):
+        pass
+
+
+MEDICAO_NULA = _MedicaoNula()
+
+
+class _Etapa:
+    """Mede uma etapa; registrar(...) acrescenta dados como contagens de linhas"""
+
+    def __init__(self, operacao, nome, dados):
+        self._operacao = operacao
+        self.nome = nome
+        self.dados = dados
+        self._inicio = None
+
+    def __enter__(self):
+        self._inicio = time.perf_counter()
+        return self
+
+    def registrar(self, **dados):
+        self.dados.update(dados)
+
+    def __exit__(self, tipo, erro, rastreio):
+        duracao_ms = (time.perf_counter() - self._inicio) * 1000
+        if erro is not None:
+            self.dados['erro'] = str(erro) or tipo.__name__
+        self._operacao._concluir_etapa(self, duracao_ms)
+        return False
+
+
+class Operacao:
+    """
+    Agrupa as etapas de uma operação sob um mesmo id
+
+    As etapas podem ser medidas na thread principal e na tarefa de gravação;
+    finalizar() grava o registro de fechamento e, se configurado, o resumo
+    no log do QGIS.
+    """
+
+    def __init__(self, nome, arquivo, resumo_log=True, **dados):
+        self.id = uuid.uuid4().hex[:12]
+        self.nome = nome
+        self.arquivo = arquivo
+        self.resumo_log = resumo_log
+        self.dados = dados
+        self.etapas = []
+        self._inicio = time.perf_counter()
+        self._trava = threading.Lock()
+        self._finalizada = False
+
+    def etapa(self, nome, **dados):
+        return _Etapa(self, nome, dados)
+
+    def registrar(self, **dados):
+        self.dados.update(dados)
+
+    def _gravar(self, registro):
+        registro = dict({'data': datetime.now().isoformat(timespec='milliseconds'),
+                         'operacao': self.id, 'nome_operacao': self.nome}, **registro)
+        try:
+            gravar_registro(self.arquivo, registro)
+        except OSError as e:
+            QgsMessageLog.logMessage(f"Medição: erro ao gravar {self.arquivo}: {e}",
+                                     'OrganizadorDeLotes', Qgis.Warning)
+
+    def _concluir_etapa(self, etapa, duracao_ms):
+        with self._trava:
+            self.etapas.append((etapa.nome, duracao_ms, etapa.dados))
+        self._gravar(dict({'tipo': 'etapa', 'etapa': etapa.nome, 'duracao_ms': round(duracao_ms, 3),
+                           'thread': threading.current_thread().name}, **etapa.dados))
+
+    def finalizar(self, sucesso=True, **dados):
+        """Fecha a operação; chamadas repetidas são ignoradas"""
+        with self._trava:
+            if self._finalizada:
+                return
+            self._finalizada = True
+            etapas = list(self.etapas)
+        self.dados.update(dados)
+
+        total_ms = (time.perf_counter() - self._inicio) * 1000
+        soma = {}
+        for nome, duracao_ms, _ in etapas:
+            soma[nome] = soma.get(nome, 0) + duracao_ms
+        self._gravar(dict({'tipo': 'operacao', 'sucesso': sucesso, 'duracao_ms': round(total_ms, 3),
+                           'etapas_ms': {n: round(d, 3) for n, d in soma.items()}}, **self.dados))
+
+        if self.resumo_log:
+            partes = []
+            for nome, duracao_ms, dados_etapa in etapas:
+                linhas = dados_etapa.get('linhas')
+                partes.append(f"{nome} {duracao_ms:.0f} ms" + (f" ({linhas} linhas)" if linhas is not None else ""))
+            QgsMessageLog.logMessage(
+                f"Medição {self.id} '{self.nome}': {total_ms:.0f} ms — " + ', '.join(partes),
+                'OrganizadorDeLotes', Qgis.Info)
+
+
+def iniciar_operacao(nome, **dados):
+    """Inicia a medição de uma operação, ou retorna MEDICAO_NULA se desligada"""
+    if not medicao_ativa():
+        return MEDICAO_NULA
+    resumo_log = QSettings().value(CHAVE_RESUMO, True, type=bool)
+    return Operacao(nome, arquivo_medicao(), resumo_log, **dados)
@@ -0,0 +1,539 @@
+"""
+Gravação da tabela comercial_umc.novaordem
+Arquivo: NovaOrdem.py
+
+Monta e executa os comandos SQL que substituem as linhas de uma ou mais
+quadras em uma única transação, sobre uma única conexão do pool.
+
+Os comandos são modelos com o marcador {quadras}: no pool ele vira o
+parâmetro $1 (integer[]) de um comando preparado (ver Consultas.py); na API
+de conexões do QGIS, um ARRAY de inteiros validados.
+
+Operadores simultâneos: toda transação que grava quadras começa travando
+cada uma com pg_advisory_xact_lock, em ordem crescente (sem impasse entre
+lotes de quadras que se sobrepõem); as travas caem no commit ou rollback.
+Quem gravar a partir de uma pré-visualização informa a versão das linhas
+que viu (Versoes.versao_linhas); se outra sessão gravou a quadra nesse meio tempo,
+a transação é desfeita com ConflitoVersao.
+"""
+
+import threading
+
+from qgis.core import QgsProviderRegistry
+
+from .Consultas import array_inteiros, executar_preparado, validar_quadra, validar_quadras
+from .ConnectionPool import disponivel as pool_disponivel, obter_pool
+from .CopyLoader import copiar_linhas, ewkb_hex
+from .Medicao import MEDICAO_NULA
+from .Ordenacao import calcular_diferencas
+from .Versoes import VERSAO_VAZIA
+
+
+TABELA_NOVAORDEM = 'comercial_umc.novaordem'
+COLUNA_GEOMETRIA = 'geom'
+SRID = 31984
+
+# Primeira chave de pg_advisory_xact_lock(int, int), reservada ao plugin; a segunda é ins_quadra
+CHAVE_TRAVA = 20573
+
+
+class ConflitoVersao(Exception):
+    """Outra sessão gravou as quadras depois da pré-visualização"""
+
+    def __init__(self, quadras):
+        self.quadras = sorted(quadras)
+        super().__init__(
+            f"Quadra(s) {', '.join(str(q) for q in self.quadras)} alterada(s) por outra sessão "
+            f"desde a pré-visualização. Refaça a operação.")
+
+
+def literal_sql(valor):
+    """Converte um valor Python em literal SQL"""
+    if valor is None:
+        return 'NULL'
+    if isinstance(valor, bool):
+        return 'TRUE' if valor else 'FALSE'
+    if isinstance(valor, (int, float)):
+        return str(valor)
+    return "'" + str(valor).replace("'", "''") + "'"
+
+
+def _sql_geometria(geometria):
+    ewkb = ewkb_hex(geometria, SRID)
+    return 'NULL' if ewkb is None else f"'{ewkb}'::geometry"
+
+
+def _valores_linha(linha):
+    return (linha['matricula'], linha['ins_quadra'], linha['n_ordem'], linha.get('geometria'))
+
+
+def _sql_valores(linhas):
+    return ',\n'.join(
+        f"({literal_sql(l['matricula'])}, {literal_sql(l['ins_quadra'])}, "
+        f"{literal_sql(l['n_ordem'])}, {_sql_geometria(l.get('geometria'))})"
+        for l in linhas
+    )
+
+
+def _com_quadras(modelo, quadras):
+    """Troca o marcador {quadras} do modelo pelo ARRAY literal das quadras"""
+    return modelo.replace('{quadras}', array_inteiros(quadras))
+
+
+# As linhas novas passam sempre por esta tabela temporária, preenchida com
+# COPY (pool) ou VALUES (API de conexões do QGIS). No pool ela é criada uma
+# vez por conexão e esvaziada a cada commit, para que os comandos preparados
+# que a usam não precisem ser replanejados.
+SQL_CRIAR_ENTRADA = (
+    'CREATE TEMP TABLE novaordem_entrada '
+    '(matricula integer, ins_quadra integer, n_ordem bigint, geom geometry) ON COMMIT DROP'
+)
+SQL_CRIAR_ENTRADA_SESSAO = (
+    'CREATE TEMP TABLE IF NOT EXISTS novaordem_entrada '
+    '(matricula integer, ins_quadra integer, n_ordem bigint, geom geometry) ON COMMIT DELETE ROWS'
+)
+COLUNAS_ENTRADA = ['matricula', 'ins_quadra', 'n_ordem', 'geom']
+
+SQL_EXISTENTES = f'SELECT DISTINCT ins_quadra FROM {TABELA_NOVAORDEM} WHERE ins_quadra = ANY({{quadras}})'
+SQL_EXCLUIR = f'DELETE FROM {TABELA_NOVAORDEM} WHERE ins_quadra = ANY({{quadras}})'
+SQL_LINHAS_GRAVADAS = (f'SELECT matricula, ins_quadra, n_ordem FROM {TABELA_NOVAORDEM} '
+                       f'WHERE ins_quadra = ANY({{quadras}})')
+
+MODELOS_SUBSTITUICAO = [
+    ('excluidas', SQL_EXCLUIR),
+    ('inseridas', f'''
+        INSERT INTO {TABELA_NOVAORDEM} (matricula, ins_quadra, n_ordem, {COLUNA_GEOMETRIA})
+        SELECT matricula, ins_quadra, n_ordem, ST_Multi(geom) FROM novaordem_entrada'''),
+]
+
+# As linhas são casadas por matricula: atualiza as que mudaram de ordem ou
+# de quadra, insere as novas e apaga as que não existem mais
+MODELOS_UPSERT = [
+    ('excluidas', f'''
+        DELETE FROM {TABELA_NOVAORDEM} n
+        WHERE n.ins_quadra = ANY({{quadras}})
+          AND (n.matricula IS NULL
+               OR NOT EXISTS (SELECT 1 FROM novaordem_entrada e
+                              WHERE e.matricula = n.matricula))'''),
+    ('atualizadas', f'''
+        UPDATE {TABELA_NOVAORDEM} n
+        SET n_ordem = e.n_ordem, ins_quadra = e.ins_quadra
+        FROM novaordem_entrada e
+        WHERE e.matricula = n.matricula
+          AND n.ins_quadra = ANY({{quadras}})
+          AND (n.n_ordem IS DISTINCT FROM e.n_ordem OR n.ins_quadra IS DISTINCT FROM e.ins_quadra)'''),
+    ('inseridas', f'''
+        INSERT INTO {TABELA_NOVAORDEM} (matricula, ins_quadra, n_ordem, {COLUNA_GEOMETRIA})
+        SELECT e.matricula, e.ins_quadra, e.n_ordem, ST_Multi(e.geom)
+        FROM novaordem_entrada e
+        WHERE e.matricula IS NULL
+           OR NOT EXISTS (SELECT 1 FROM {TABELA_NOVAORDEM} n
+                          WHERE n.matricula = e.matricula AND n.ins_quadra = ANY({{quadras}}))'''),
+]
+
+# Reaplicação de um instantâneo do diário: a tabela de entrada não traz
+# geometria, então só atualiza e apaga
+MODELOS_REAPLICACAO = [(chave, sql) for chave, sql in MODELOS_UPSERT if chave != 'inseridas']
+
+
+def comandos_substituicao(quadras):
+    """Comandos (chave da contagem, SQL) que apagam as quadras e inserem a tabela de entrada"""
+    return [(chave, _com_quadras(sql, quadras)) for chave, sql in MODELOS_SUBSTITUICAO]
+
+
+def comandos_upsert(quadras):
+    """
+    Comandos (chave da contagem, SQL) que gravam apenas as diferenças
+
+    As linhas são casadas por matricula: atualiza as que mudaram de ordem ou
+    de quadra, insere as novas e apaga as que não existem mais. Lotes sem
+    matrícula não podem ser casados e são sempre regravados. Não exige
+    restrição de unicidade na tabela.
+    """
+    return [(chave, _com_quadras(sql, quadras)) for chave, sql in MODELOS_UPSERT]
+
+
+def comandos_reaplicacao(quadras):
+    """
+    Comandos (chave da contagem, SQL) que reaplicam um instantâneo do diário
+
+    Só atualizam n_ordem e apagam as linhas que não estavam no instantâneo;
+    a tabela de entrada não traz geometria, então nada é inserido.
+    """
+    return [(chave, _com_quadras(sql, quadras)) for chave, sql in MODELOS_REAPLICACAO]
+
+
+def _modelos_aplicar(incremental, reaplicar=False):
+    if reaplicar:
+        return MODELOS_REAPLICACAO
+    return MODELOS_UPSERT if incremental else MODELOS_SUBSTITUICAO
+
+
+def _comandos_aplicar(quadras, incremental, reaplicar=False):
+    return [(chave, _com_quadras(sql, quadras)) for chave, sql in _modelos_aplicar(incremental, reaplicar)]
+
+
+def executar_modelo(cur, modelo, quadras):
+    """Executa um modelo de comando como comando preparado, com as quadras em $1"""
+    executar_preparado(cur, modelo.replace('{quadras}', '$1'), [validar_quadras(quadras)], ['integer[]'])
+
+
+SQL_TRAVAR = f'SELECT pg_advisory_xact_lock({CHAVE_TRAVA}, q) FROM unnest({{quadras}}) AS q'
+
+# Versão das linhas gravadas de cada quadra: quantidade e md5 das linhas
+# "matricula:n_ordem" em ordem de bytes (igual a Versoes.versao_linhas)
+SQL_VERSOES = f'''
+    SELECT ins_quadra, count(*) || ':' || md5(string_agg(linha, ',' ORDER BY linha COLLATE "C"))
+    FROM (SELECT ins_quadra, coalesce(matricula::text, '') || ':' || coalesce(n_ordem::text, '') AS linha
+          FROM {TABELA_NOVAORDEM} WHERE ins_quadra = ANY({{quadras}})) AS v
+    GROUP BY ins_quadra'''
+
+
+def ordem_das_travas(quadras):
+    """Quadras sem repetição e em ordem crescente, a ordem em que são travadas"""
+    return sorted(set(validar_quadras(quadras)))
+
+
+def travar_quadras(cur, quadras):
+    """Trava as quadras até o fim da transação do cursor"""
+    executar_modelo(cur, SQL_TRAVAR, ordem_das_travas(quadras))
+
+
+def sql_travar_quadras(quadras):
+    """SQL que trava as quadras, para os scripts da API de conexões do QGIS"""
+    return _com_quadras(SQL_TRAVAR, ordem_das_travas(quadras)) + ';'
+
+
+def verificar_versoes(cur, versoes):
+    """Levanta ConflitoVersao se alguma quadra não está mais na versão esperada"""
+    executar_modelo(cur, SQL_VERSOES, list(versoes))
+    atuais = {int(q): versao for q, versao in cur.fetchall()}
+    conflitos = [q for q, versao in versoes.items() if atuais.get(int(q), VERSAO_VAZIA) != versao]
+    if conflitos:
+        raise ConflitoVersao(conflitos)
+
+
+def sql_verificar_versoes(versoes):
+    """Bloco que aborta o script com CONFLITO_VERSAO, para a API de conexões do QGIS"""
+    esperadas = ', '.join(f'({validar_quadra(q)}, {literal_sql(v)})' for q, v in versoes.items())
+    atuais = _com_quadras(SQL_VERSOES, list(versoes))
+    return f'''
+    DO $verificar$ BEGIN
+        IF EXISTS (SELECT 1 FROM (VALUES {esperadas}) AS e(ins_quadra, versao)
+                   LEFT JOIN ({atuais}) AS a(ins_quadra, versao) USING (ins_quadra)
+                   WHERE coalesce(a.versao, '{VERSAO_VAZIA}') <> e.versao) THEN
+            RAISE EXCEPTION 'CONFLITO_VERSAO';
+        END IF;
+    END $verificar$;'''
+
+
+def sql_aplicar_substituicao(quadras):
+    """SQL que apaga as linhas das quadras e insere as da tabela de entrada"""
+    return ';\n'.join(sql for _, sql in comandos_substituicao(quadras)) + ';'
+
+
+def sql_aplicar_upsert(quadras):
+    """SQL que grava apenas as diferenças entre a tabela de entrada e as quadras"""
+    return ';\n'.join(sql for _, sql in comandos_upsert(quadras)) + ';'
+
+
+def _sql_aplicar(quadras, incremental, reaplicar=False):
+    if reaplicar:
+        return ';\n'.join(sql for _, sql in comandos_reaplicacao(quadras)) + ';'
+    return sql_aplicar_upsert(quadras) if incremental else sql_aplicar_substituicao(quadras)
+
+
+def sql_substituir_quadras(quadras, linhas, incremental=False, reaplicar=False, versoes=None):
+    """
+    Monta o SQL completo, com as linhas em VALUES, para quem não tem psycopg2
+
+    Args:
+        quadras: Quadras cujas linhas serão substituídas
+        linhas: Linhas de novaordem (ver Ordenacao.montar_linhas)
+        incremental: Se True, grava apenas as diferenças
+        reaplicar: Se True, só atualiza e apaga (ver comandos_reaplicacao)
+        versoes: {ins_quadra: versão} esperada das quadras (ver Versoes.versao_linhas)
+    """
+    sql = [sql_travar_quadras(list(quadras) + list(versoes or {}))]
+    if versoes:
+        sql.append(sql_verificar_versoes(versoes))
+    sql.append(SQL_CRIAR_ENTRADA + ';')
+    if linhas:
+        sql.append(f'INSERT INTO novaordem_entrada VALUES {_sql_valores(linhas)};')
+    sql.append(_sql_aplicar(quadras, incremental, reaplicar))
+    return '\n'.join(sql)
+
+
+def _conexao_qgis(conexao):
+    metadata = QgsProviderRegistry.instance().providerMetadata('postgres')
+    return metadata.createConnection(conexao)
+
+
+def suporta_transacao():
+    """Indica se há psycopg2 ou a API de conexões do QGIS (QGIS >= 3.10)"""
+    if pool_disponivel():
+        return True
+    metadata = QgsProviderRegistry.instance().providerMetadata('postgres')
+    return metadata is not None and hasattr(metadata, 'createConnection')
+
+
+def executar_script_qgis(conexao, sql):
+    """
+    Executa um script pela API de conexões do QGIS, desfazendo a transação se falhar
+
+    A conexão do QGIS pode ser compartilhada com as camadas: um erro no meio
+    de um BEGIN ... COMMIT a deixaria em uma transação abortada, recusando
+    todo comando seguinte.
+
+    Returns:
+        Linhas retornadas pelo script
+    """
+    conn = _conexao_qgis(conexao)
+    try:
+        return conn.executeSql(sql)
+    except Exception:
+        try:
+            conn.executeSql('ROLLBACK;')
+        except Exception:
+            pass
+        raise
+
+
+def executar_sql(conexao, sql):
+    """Executa o SQL em uma única transação sobre uma única conexão"""
+    if pool_disponivel():
+        obter_pool(conexao).executar_transacao(lambda cur: cur.execute(sql))
+    else:
+        executar_script_qgis(conexao, f'BEGIN;\n{sql}\nCOMMIT;')
+
+
+def consultar(conexao, sql):
+    """Executa uma consulta e retorna a lista de linhas"""
+    if pool_disponivel():
+        def _consultar(cur):
+            cur.execute(sql)
+            return cur.fetchall()
+        return obter_pool(conexao).executar_transacao(_consultar)
+    return _conexao_qgis(conexao).executeSql(sql)
+
+
+def consultar_quadras(conexao, modelo, quadras):
+    """Executa um modelo de consulta com o marcador {quadras} e retorna a lista de linhas"""
+    if pool_disponivel():
+        def _consultar(cur):
+            executar_modelo(cur, modelo, quadras)
+            return cur.fetchall()
+        return obter_pool(conexao).executar_transacao(_consultar)
+    return _conexao_qgis(conexao).executeSql(_com_quadras(modelo, quadras))
+
+
+def executar_quadras(conexao, modelo, quadras):
+    """Executa um modelo de comando com o marcador {quadras} em uma única transação, com as quadras travadas"""
+    if pool_disponivel():
+        def _executar(cur):
+            travar_quadras(cur, quadras)
+            executar_modelo(cur, modelo, quadras)
+        obter_pool(conexao).executar_transacao(_executar)
+    else:
+        executar_sql(conexao, sql_travar_quadras(quadras) + '\n' + _com_quadras(modelo, quadras) + ';')
+
+
+class CacheExistencia:
+    """
+    Guarda se a tabela novaordem tem linhas de cada quadra
+
+    As quadras ainda desconhecidas são consultadas todas juntas em um único
+    SELECT. Toda gravação ou exclusão feita pelo plugin invalida as quadras
+    envolvidas.
+    """
+
+    def __init__(self):
+        self._existe = {}
+        self._lock = threading.Lock()
+
+    def verificar(self, conexao, quadras):
+        """Retorna {ins_quadra: bool} para as quadras informadas"""
+        quadras = validar_quadras(quadras)
+        with self._lock:
+            faltantes = [q for q in quadras if (conexao, q) not in self._existe]
+
+        if faltantes:
+            encontradas = {int(linha[0]) for linha in consultar_quadras(conexao, SQL_EXISTENTES, faltantes)}
+            with self._lock:
+                for q in faltantes:
+                    self._existe[(conexao, q)] = q in encontradas
+
+        with self._lock:
+            return {q: self._existe.get((conexao, q), False) for q in quadras}
+
+    def invalidar(self, conexao=None, quadras=None):
+        """Descarta o cache da conexão/quadras informadas (ou todo o cache)"""
+        with self._lock:
+            if conexao is None:
+                self._existe = {}
+            elif quadras is None:
+                self._existe = {k: v for k, v in self._existe.items() if k[0] != conexao}
+            else:
+                for q in quadras:
+                    self._existe.pop((conexao, int(q)), None)
+
+
+_cache_existencia = CacheExistencia()
+
+
+def quadras_existem(conexao, quadras):
+    """Indica, para cada quadra, se a tabela novaordem tem linhas dela"""
+    return _cache_existencia.verificar(conexao, quadras)
+
+
+def quadra_existe(conexao, ins_quadra):
+    """Indica se a tabela novaordem tem linhas da quadra"""
+    return quadras_existem(conexao, [ins_quadra])[validar_quadra(ins_quadra)]
+
+
+# Funções (conexao, quadras) avisadas a cada gravação ou exclusão, como os caches do plugin
+_observadores = []
+
+
+def observar_gravacoes(funcao):
+    """Registra funcao(conexao, quadras), chamada após gravar ou excluir quadras"""
+    if funcao not in _observadores:
+        _observadores.append(funcao)
+
+
+def deixar_de_observar_gravacoes(funcao):
+    if funcao in _observadores:
+        _observadores.remove(funcao)
+
+
+def invalidar_existencia(conexao=None, quadras=None):
+    """Invalida o cache de existência após gravar ou excluir quadras"""
+    _cache_existencia.invalidar(conexao, quadras)
+    for funcao in list(_observadores):
+        funcao(conexao, quadras)
+
+
+def excluir_quadras(conexao, quadras):
+    """Exclui as linhas das quadras da tabela novaordem"""
+    try:
+        executar_quadras(conexao, SQL_EXCLUIR, quadras)
+    finally:
+        invalidar_existencia(conexao, quadras)
+
+
+def linhas_gravadas(conexao, quadras):
+    """Retorna as tuplas (matricula, ins_quadra, n_ordem) gravadas para as quadras"""
+    return [tuple(linha) for linha in consultar_quadras(conexao, SQL_LINHAS_GRAVADAS, quadras)]
+
+
+def linhas_gravadas_por_quadra(conexao):
+    """Retorna {ins_quadra: [(matricula, ins_quadra, n_ordem)]} de toda a tabela, em uma única consulta"""
+    por_quadra = {}
+    for linha in consultar(conexao, f'SELECT matricula, ins_quadra, n_ordem FROM {TABELA_NOVAORDEM}'):
+        if linha[1] is not None:
+            por_quadra.setdefault(int(linha[1]), []).append(tuple(linha))
+    return por_quadra
+
+
+def diferenca_quadras(conexao, quadras, linhas):
+    """
+    Pré-visualiza a gravação incremental sem alterar a tabela
+
+    Returns:
+        Resultado de Ordenacao.calcular_diferencas entre as linhas gravadas
+        das quadras e as linhas calculadas
+    """
+    return calcular_diferencas(linhas_gravadas(conexao, quadras), linhas)
+
+
+def _contagem(atualizadas=0, inseridas=0, excluidas=0):
+    return {'atualizadas': atualizadas, 'inseridas': inseridas, 'excluidas': excluidas}
+
+
+def substituir_quadras(conexao, quadras, linhas, incremental=False, tamanho_lote=None, medicao=MEDICAO_NULA,
+                       reaplicar=False, versoes=None, verificar_cancelamento=None):
+    """
+    Substitui as linhas de novaordem das quadras em uma única transação
+
+    Com psycopg2 as linhas são enviadas com COPY; sem ele, em VALUES pela
+    API de conexões do QGIS.
+
+    Args:
+        conexao: Nome da conexão PostgreSQL
+        quadras: Quadras cujas linhas serão substituídas
+        linhas: Novas linhas das quadras
+        incremental: Se True, grava apenas as linhas que mudaram (upsert)
+        tamanho_lote: Linhas por comando COPY
+        medicao: Operação que recebe o tempo de cada comando (ver Medicao.py)
+        reaplicar: Se True, reaplica um instantâneo do diário: atualiza e
+            apaga, sem inserir (ver comandos_reaplicacao)
+        versoes: {ins_quadra: versão} das linhas vistas na pré-visualização;
+            se alguma quadra mudou desde então, levanta ConflitoVersao sem gravar
+        verificar_cancelamento: Função sem argumentos que levanta exceção para
+            interromper; com psycopg2, chamada antes e depois de cada COPY; sem
+            ele, antes da comparação e antes do script
+
+    Returns:
+        Dicionário com o número de linhas 'atualizadas', 'inseridas' e 'excluidas'
+    """
+    quadras = validar_quadras(quadras)
+    verificar_cancelamento = verificar_cancelamento or (lambda: None)
+
+    def _gravar(cur):
+        with medicao.etapa('travar', quadras=len(quadras)):
+            travar_quadras(cur, quadras + list(versoes or {}))
+            if versoes:
+                verificar_versoes(cur, versoes)
+        cur.execute(SQL_CRIAR_ENTRADA_SESSAO)
+        with medicao.etapa('copy') as etapa:
+            etapa.registrar(linhas=copiar_linhas(
+                cur, 'novaordem_entrada', COLUNAS_ENTRADA,
+                (_valores_linha(l) for l in linhas), ['geom'], SRID, tamanho_lote, verificar_cancelamento))
+        contagem = _contagem()
+        for chave, modelo in _modelos_aplicar(incremental, reaplicar):
+            with medicao.etapa(chave) as etapa:
+                executar_modelo(cur, modelo, quadras)
+                contagem[chave] = max(cur.rowcount, 0)
+                etapa.registrar(linhas=contagem[chave])
+        return contagem
+
+    try:
+        if pool_disponivel():
+            return obter_pool(conexao).executar_transacao(_gravar)
+
+        # As linhas são lidas uma única vez: a comparação e o script usam o
+        # mesmo conjunto, completo, ou nada é gravado
+        linhas = list(linhas)
+        verificar_cancelamento()
+
+        # A API do QGIS não informa as linhas afetadas: a contagem vem da
+        # comparação com o estado gravado antes da transação
+        with medicao.etapa('diferenca') as etapa:
+            if incremental or reaplicar:
+                diferencas = diferenca_quadras(conexao, quadras, linhas)
+                contagem = _contagem(len(diferencas['atualizar']),
+                                     0 if reaplicar else len(diferencas['inserir']),
+                                     len(diferencas['excluir']))
+            else:
+                contagem = _contagem(0, len(linhas), len(linhas_gravadas(conexao, quadras)))
+            etapa.registrar(**contagem)
+        verificar_cancelamento()
+        with medicao.etapa('executar_sql', linhas=len(linhas)):
+            try:
+                executar_sql(conexao, sql_substituir_quadras(quadras, linhas, incremental, reaplicar, versoes))
+            except Exception as e:
+                if 'CONFLITO_VERSAO' in str(e):
+                    raise ConflitoVersao(list(versoes)) from e
+                raise
+        return contagem
+    finally:
+        invalidar_existencia(conexao, quadras)
+
+
+def descrever_contagem(contagem):
+    """Texto curto com as linhas alteradas por uma gravação"""
+    if not contagem:
+        return ''
+    return (f"{contagem.get('atualizadas', 0)} atualizada(s), "
+            f"{contagem.get('inseridas', 0)} inserida(s), "
+            f"{contagem.get('excluidas', 0)} excluída(s)")
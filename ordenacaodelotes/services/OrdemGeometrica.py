@@ -0,0 +1,192 @@
+"""
+Ordem dos lotes calculada pela geometria
+Arquivo: OrdemGeometrica.py
+
+Associa os lotes às quadras com um índice espacial (centroide do lote dentro
+da quadra) e calcula n_ordem percorrendo o contorno de cada quadra no
+sentido horário (ver Perimetro.py).
+"""
+
+from qgis.core import (
+    QgsCoordinateTransform, QgsFeature, QgsFeatureRequest, QgsGeometry, QgsPointXY,
+    QgsProject, QgsRectangle, QgsSpatialIndex)
+
+from .IndiceLotes import normalizar_quadra, valor_ou_none
+from .Perimetro import area_assinada, ordem_pelo_perimetro
+
+
+def anel_externo(geometria):
+    """Maior anel externo da geometria da quadra, como lista de (x, y)"""
+    poligonos = geometria.asMultiPolygon() if geometria.isMultipart() else [geometria.asPolygon()]
+    maior = None
+    for poligono in poligonos:
+        if not poligono:
+            continue
+        anel = [(p.x(), p.y()) for p in poligono[0]]
+        if maior is None or abs(area_assinada(anel)) > abs(area_assinada(maior)):
+            maior = anel
+    return maior or []
+
+
+def _transformacao(origem, destino):
+    if origem.crs() == destino.crs():
+        return None
+    return QgsCoordinateTransform(origem.crs(), destino.crs(), QgsProject.instance())
+
+
+def ponto_do_lote(geometria_lote, camada_lotes, camada_quadras):
+    """Centroide do lote no SRC da camada de quadras, como (x, y)"""
+    ponto = geometria_lote.centroid().asPoint()
+    transformacao = _transformacao(camada_lotes, camada_quadras)
+    if transformacao:
+        ponto = transformacao.transform(ponto)
+    return (ponto.x(), ponto.y())
+
+
+def ler_quadras(camada_quadras, quadras):
+    """Retorna {ins_quadra: QgsGeometry} das quadras informadas"""
+    lista = ', '.join(str(int(q)) for q in quadras)
+    request = QgsFeatureRequest()
+    request.setFilterExpression(f'"ins_quadra" IN ({lista})')
+    request.setSubsetOfAttributes(['ins_quadra'], camada_quadras.fields())
+
+    geometrias = {}
+    for f in camada_quadras.getFeatures(request):
+        ins_quadra = normalizar_quadra(f['ins_quadra'])
+        if ins_quadra is not None and f.hasGeometry():
+            geometrias[ins_quadra] = QgsGeometry(f.geometry())
+    return geometrias
+
+
+def associar_lotes_quadras(camada_quadras, camada_lotes, geometrias_quadras):
+    """
+    Associa os lotes às quadras pela posição do centroide
+
+    Os lotes são lidos apenas na extensão das quadras e cada centroide é
+    testado só contra as quadras que o índice espacial aponta. Se o
+    centroide cair fora de todas (lote côncavo), usa o ponto na superfície.
+
+    Returns:
+        {ins_quadra: [{'matricula', 'ordem', 'geometria', 'ponto'}]}
+    """
+    indice = QgsSpatialIndex()
+    quadras_por_id = {}
+    motores = {}
+    extensao = QgsRectangle()
+    extensao.setMinimal()
+    for fid, (ins_quadra, geometria) in enumerate(geometrias_quadras.items()):
+        feature = QgsFeature(fid)
+        feature.setGeometry(geometria)
+        indice.addFeature(feature)
+        quadras_por_id[fid] = ins_quadra
+        motor = QgsGeometry.createGeometryEngine(geometria.constGet())
+        motor.prepareGeometry()
+        motores[fid] = motor
+        extensao.combineExtentWith(geometria.boundingBox())
+
+    if extensao.isNull() or not quadras_por_id:
+        return {}
+
+    para_quadras = _transformacao(camada_lotes, camada_quadras)
+    para_lotes = _transformacao(camada_quadras, camada_lotes)
+    if para_lotes:
+        extensao = para_lotes.transformBoundingBox(extensao)
+
+    request = QgsFeatureRequest()
+    request.setFilterRect(extensao)
+    request.setSubsetOfAttributes(['matricula', 'ordem'], camada_lotes.fields())
+
+    def _quadra_do_ponto(ponto):
+        for fid in indice.intersects(QgsRectangle(ponto.x(), ponto.y(), ponto.x(), ponto.y())):
+            if motores[fid].contains(QgsGeometry.fromPointXY(ponto).constGet()):
+                return fid
+        return None
+
+    lotes_por_quadra = {}
+    for f in camada_lotes.getFeatures(request):
+        if not f.hasGeometry():
+            continue
+        geometria = f.geometry()
+        fid_quadra = None
+        for candidato in (geometria.centroid(), geometria.pointOnSurface()):
+            ponto = QgsPointXY(candidato.asPoint())
+            if para_quadras:
+                ponto = para_quadras.transform(ponto)
+            fid_quadra = _quadra_do_ponto(ponto)
+            if fid_quadra is not None:
+                break
+        if fid_quadra is None:
+            continue
+
+        lotes_por_quadra.setdefault(quadras_por_id[fid_quadra], []).append({
+            'matricula': valor_ou_none(f['matricula']),
+            'ordem': valor_ou_none(f['ordem']),
+            'geometria': geometria,
+            'ponto': (ponto.x(), ponto.y())
+        })
+    return lotes_por_quadra
+
+
+def percorrer_quadras(camada_quadras, camada_lotes, quadras, inicio='noroeste'):
+    """
+    Ordena os lotes de cada quadra percorrendo seu contorno no sentido horário
+
+    Args:
+        camada_quadras: Camada Quadra (com ins_quadra)
+        camada_lotes: Camada de lotes (com matricula e ordem)
+        quadras: Quadras a ordenar
+        inicio: Canto de partida (ver Perimetro.CANTOS) ou ponto (x, y) no
+            SRC das quadras, como o centroide do lote clicado
+
+    Returns:
+        Tupla (percursos, relatorio): percursos é {ins_quadra: lotes na
+        ordem do percurso, com 'matricula', 'geometria', 'ponto' (no SRC
+        das quadras) e 'n_ordem'}, só das quadras ordenadas; relatorio tem
+        uma entrada por quadra com 'ins_quadra', 'num_lotes', 'success' e
+        'message'
+    """
+    geometrias = ler_quadras(camada_quadras, quadras)
+    lotes_por_quadra = associar_lotes_quadras(camada_quadras, camada_lotes, geometrias)
+
+    percursos = {}
+    relatorio = []
+    for ins_quadra in (normalizar_quadra(q) for q in quadras):
+        lotes = lotes_por_quadra.get(ins_quadra, [])
+        anel = anel_externo(geometrias[ins_quadra]) if ins_quadra in geometrias else []
+        if len(anel) < 3:
+            mensagem = "Quadra não encontrada na camada Quadra"
+        elif not lotes:
+            mensagem = "Nenhum lote encontrado dentro da quadra"
+        else:
+            ordens = ordem_pelo_perimetro(anel, [lote['ponto'] for lote in lotes], inicio)
+            for lote, n_ordem in zip(lotes, ordens):
+                lote['n_ordem'] = n_ordem
+            percursos[ins_quadra] = sorted(lotes, key=lambda lote: lote['n_ordem'])
+            mensagem = f"{len(lotes)} lote(s) ordenado(s) pelo perímetro"
+        relatorio.append({'ins_quadra': ins_quadra, 'num_lotes': len(lotes),
+                          'success': ins_quadra in percursos, 'message': mensagem})
+    return percursos, relatorio
+
+
+def calcular_linhas_geometricas(camada_quadras, camada_lotes, quadras, inicio='noroeste'):
+    """
+    Calcula as linhas de novaordem das quadras pela geometria
+
+    Args:
+        camada_quadras: Camada Quadra (com ins_quadra)
+        camada_lotes: Camada de lotes (com matricula e ordem)
+        quadras: Quadras a ordenar
+        inicio: Canto de partida (ver Perimetro.CANTOS) ou ponto (x, y) no
+            SRC das quadras, como o centroide do lote clicado
+
+    Returns:
+        Tupla (linhas, relatorio) com as linhas prontas para gravação e uma
+        entrada por quadra com 'ins_quadra', 'num_lotes', 'success' e 'message'
+    """
+    percursos, relatorio = percorrer_quadras(camada_quadras, camada_lotes, quadras, inicio)
+    linhas = []
+    for ins_quadra, lotes in percursos.items():
+        for lote in lotes:
+            linhas.append({'matricula': lote['matricula'], 'ins_quadra': ins_quadra,
+                           'n_ordem': lote['n_ordem'], 'geometria': lote['geometria']})
+    return linhas, relatorio
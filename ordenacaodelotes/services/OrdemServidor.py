@@ -0,0 +1,200 @@
+"""
+Reorganização calculada no servidor
+Arquivo: OrdemServidor.py
+
+Quando a camada de lotes é uma tabela do mesmo banco da novaordem, a nova
+ordem pode ser calculada e gravada por um único comando: as quadras e as
+ordens iniciais vão como dois arrays, a rotação é feita com funções de
+janela e o resultado é gravado direto na novaordem, sem trazer as feições
+para o cliente. A regra é a mesma de Ordenacao.calcular_nova_ordem.
+
+Configuração: OrganizaLoteClick/servidor/ativo (padrão: false) liga esse
+modo no plugin quando a camada permite. Como na gravação pelo cliente, as
+versões vistas na pré-visualização são conferidas antes do comando (ver
+NovaOrdem.ConflitoVersao).
+"""
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsDataSourceUri
+
+from .ConnectionPool import disponivel as pool_disponivel, obter_pool, uri_da_conexao
+from .Consultas import array_inteiros, executar_preparado, filtro_isolavel, validar_quadras
+from .NovaOrdem import (
+    COLUNA_GEOMETRIA, TABELA_NOVAORDEM, ConflitoVersao, executar_script_qgis, invalidar_existencia, sql_travar_quadras,
+    sql_verificar_versoes, travar_quadras, verificar_versoes)
+
+
+CHAVE_ATIVO = 'OrganizaLoteClick/servidor/ativo'
+
+
+def modo_servidor_configurado():
+    return QSettings().value(CHAVE_ATIVO, False, type=bool)
+
+
+def _mesmo_banco(uri_a, uri_b):
+    return (uri_a.service() or '', uri_a.host() or '', uri_a.port() or '5432', uri_a.database()) == \
+           (uri_b.service() or '', uri_b.host() or '', uri_b.port() or '5432', uri_b.database())
+
+
+def origem_no_servidor(camada_lotes, conexao):
+    """
+    Tabela da camada de lotes no banco da conexão, se houver
+
+    Returns:
+        Dicionário com 'tabela' (nome qualificado e entre aspas), 'geometria'
+        e 'filtro' (filtro da camada), ou None se a camada não for do
+        provedor postgres ou estiver em outro banco
+
+    Raises:
+        ValueError: se o filtro da camada não puder ser isolado entre
+            parênteses (ver Consultas.filtro_isolavel)
+    """
+    if camada_lotes is None or camada_lotes.providerType() != 'postgres':
+        return None
+    uri = QgsDataSourceUri(camada_lotes.source())
+    if not uri.table() or uri.table().startswith('('):
+        return None
+    try:
+        if not _mesmo_banco(uri, uri_da_conexao(conexao)):
+            return None
+    except Exception:
+        return None
+    filtro = camada_lotes.subsetString().strip()
+    if filtro and not filtro_isolavel(filtro):
+        raise ValueError("O filtro da camada de lotes tem ';', comentário ou parênteses sem par e não pode "
+                         "ser usado no cálculo no servidor: remova o filtro ou use o cálculo no cliente")
+    return {'tabela': uri.quotedTablename(),
+            'geometria': uri.geometryColumn() or COLUNA_GEOMETRIA,
+            'filtro': filtro}
+
+
+def _sql_calculadas(origem):
+    # O filtro da camada (do provedor postgres, conferido por origem_no_servidor) é
+    # aplicado entre parênteses em uma subconsulta, onde seus nomes de coluna não são ambíguos
+    lotes = origem['tabela']
+    if origem.get('filtro'):
+        lotes = f"(SELECT * FROM {origem['tabela']} WHERE ({origem['filtro']}))"
+    return f'''
+    pares AS (
+        SELECT * FROM unnest({{quadras}}::integer[], {{ordens}}::integer[]) AS p(ins_quadra, ordem_primeira)
+    ),
+    calculadas AS (
+        SELECT l.matricula, l.ins_quadra, l."{origem['geometria']}" AS geom,
+               CASE
+                   WHEN l.ordem IS NULL THEN NULL
+                   WHEN p.ordem_primeira IS NULL THEN l.ordem
+                   WHEN l.ordem >= p.ordem_primeira THEN l.ordem - (p.ordem_primeira - 1)
+                   ELSE l.ordem + COUNT(*) FILTER (WHERE l.ordem >= p.ordem_primeira)
+                                  OVER (PARTITION BY l.ins_quadra)
+               END AS n_ordem
+        FROM {lotes} l
+        JOIN pares p ON p.ins_quadra = l.ins_quadra
+    )'''
+
+
+def sql_reordenar(origem, incremental=True):
+    """
+    Comando único que calcula e grava a nova ordem das quadras
+
+    Os marcadores {quadras} e {ordens} recebem os arrays de ins_quadra e de
+    ordem inicial (NULL restaura a ordem original). O comando retorna uma
+    linha com as linhas atualizadas, inseridas e excluídas.
+    """
+    calculadas = _sql_calculadas(origem)
+    if not incremental:
+        return f'''
+    WITH {calculadas},
+    excluidas AS (
+        DELETE FROM {TABELA_NOVAORDEM} n USING pares p WHERE n.ins_quadra = p.ins_quadra RETURNING 1
+    ),
+    inseridas AS (
+        INSERT INTO {TABELA_NOVAORDEM} (matricula, ins_quadra, n_ordem, {COLUNA_GEOMETRIA})
+        SELECT matricula, ins_quadra, n_ordem, ST_Multi(geom) FROM calculadas
+        RETURNING 1
+    )
+    SELECT 0, (SELECT COUNT(*) FROM inseridas), (SELECT COUNT(*) FROM excluidas)'''
+
+    # Os comandos enxergam o mesmo estado da tabela: a exclusão e a
+    # atualização atingem linhas diferentes (casadas ou não por matricula)
+    return f'''
+    WITH {calculadas},
+    excluidas AS (
+        DELETE FROM {TABELA_NOVAORDEM} n
+        USING pares p
+        WHERE n.ins_quadra = p.ins_quadra
+          AND (n.matricula IS NULL
+               OR NOT EXISTS (SELECT 1 FROM calculadas c WHERE c.matricula = n.matricula))
+        RETURNING 1
+    ),
+    atualizadas AS (
+        UPDATE {TABELA_NOVAORDEM} n
+        SET n_ordem = c.n_ordem, ins_quadra = c.ins_quadra
+        FROM calculadas c
+        WHERE c.matricula = n.matricula
+          AND n.ins_quadra IN (SELECT ins_quadra FROM pares)
+          AND (n.n_ordem IS DISTINCT FROM c.n_ordem OR n.ins_quadra IS DISTINCT FROM c.ins_quadra)
+        RETURNING 1
+    ),
+    inseridas AS (
+        INSERT INTO {TABELA_NOVAORDEM} (matricula, ins_quadra, n_ordem, {COLUNA_GEOMETRIA})
+        SELECT c.matricula, c.ins_quadra, c.n_ordem, ST_Multi(c.geom)
+        FROM calculadas c
+        WHERE c.matricula IS NULL
+           OR NOT EXISTS (SELECT 1 FROM {TABELA_NOVAORDEM} n
+                          WHERE n.matricula = c.matricula
+                            AND n.ins_quadra IN (SELECT ins_quadra FROM pares))
+        RETURNING 1
+    )
+    SELECT (SELECT COUNT(*) FROM atualizadas), (SELECT COUNT(*) FROM inseridas),
+           (SELECT COUNT(*) FROM excluidas)'''
+
+
+def reordenar_no_servidor(conexao, origem, quadras_e_ordens, incremental=True, versoes=None):
+    """
+    Reorganiza ou restaura as quadras com um único comando no servidor
+
+    Args:
+        conexao: Nome da conexão PostgreSQL
+        origem: Resultado de origem_no_servidor
+        quadras_e_ordens: Lista de tuplas (ins_quadra, ordem_primeira);
+            ordem_primeira None restaura a ordem original
+        incremental: Se True, grava apenas as linhas que mudaram
+        versoes: {ins_quadra: versão} das linhas vistas na pré-visualização;
+            se alguma quadra mudou desde então, levanta ConflitoVersao sem gravar
+
+    Returns:
+        Dicionário com o número de linhas 'atualizadas', 'inseridas' e 'excluidas'
+
+    As quadras ficam travadas durante o comando (ver NovaOrdem.travar_quadras).
+    """
+    quadras = validar_quadras([q for q, _ in quadras_e_ordens])
+    ordens = [None if o is None else int(o) for _, o in quadras_e_ordens]
+    sql = sql_reordenar(origem, incremental)
+    try:
+        if pool_disponivel():
+            # Comando preparado: o plano é reaproveitado entre os grupos de quadras
+            sql_parametros = sql.replace('{quadras}', '$1').replace('{ordens}', '$2')
+
+            def _executar(cur):
+                travar_quadras(cur, quadras + list(versoes or {}))
+                if versoes:
+                    verificar_versoes(cur, versoes)
+                executar_preparado(cur, sql_parametros, [quadras, ordens], ['integer[]', 'integer[]'])
+                return cur.fetchone()
+            linha = obter_pool(conexao).executar_transacao(_executar)
+        else:
+            # Sem psycopg2 os arrays vão como literais, montados só com inteiros validados. Os
+            # comandos vão juntos, em uma única transação implícita: a trava vale até o fim
+            verificacao = sql_verificar_versoes(versoes) + '\n' if versoes else ''
+            try:
+                resultado = executar_script_qgis(
+                    conexao, sql_travar_quadras(quadras + list(versoes or {})) + '\n' + verificacao
+                    + sql.replace('{quadras}', array_inteiros(quadras)).replace('{ordens}', array_inteiros(ordens)))
+            except Exception as e:
+                if 'CONFLITO_VERSAO' in str(e):
+                    raise ConflitoVersao(list(versoes)) from e
+                raise
+            linha = resultado[0] if resultado else (0, 0, 0)
+        return {'atualizadas': int(linha[0]), 'inseridas': int(linha[1]), 'excluidas': int(linha[2])}
+    finally:
+        invalidar_existencia(conexao, quadras)
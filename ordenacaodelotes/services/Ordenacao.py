@@ -0,0 +1,374 @@
+"""
+Funções puras de ordenação de lotes
+Arquivo: Ordenacao.py
+
+Não depende do QGIS, para poder ser usado tanto pelo plugin quanto em scripts.
+"""
+
+import re
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .Consultas import validar_quadra
+
+
+_PADRAO_ITEM_QUADRA = re.compile(r'^(\d+)(?:-(\d+))?(?::(\d+))?$')
+
+# Abaixo deste tamanho a conversão para array custa mais do que o cálculo
+LIMITE_NUMPY = 256
+
+# Maior intervalo aceito em um item da lista de quadras ("101-120")
+MAXIMO_QUADRAS_INTERVALO = 10000
+
+
+def interpretar_lista_quadras(texto, ordem_padrao=1, maximo_intervalo=MAXIMO_QUADRAS_INTERVALO):
+    """
+    Interpreta uma lista de quadras com suas ordens iniciais
+
+    Args:
+        texto: Quadras separadas por vírgula, ponto e vírgula ou quebra de linha.
+            Cada item pode ser uma quadra ("101"), um intervalo ("101-120")
+            e, opcionalmente, a ordem inicial após dois pontos ("101-120:3").
+        ordem_padrao: Ordem inicial usada quando o item não informa uma
+        maximo_intervalo: Maior número de quadras de um intervalo; os
+            maiores são recusados antes de expandidos
+
+    Returns:
+        Lista de tuplas (ins_quadra, ordem_primeira) na ordem informada.
+        Se uma quadra aparecer mais de uma vez, vale a última ocorrência.
+
+    Exemplo:
+        interpretar_lista_quadras("101-103:2; 110", 1)
+        -> [(101, 2), (102, 2), (103, 2), (110, 1)]
+    """
+    quadras = {}
+    for item in re.split(r'[,;\s]+', texto or ''):
+        if not item:
+            continue
+
+        correspondencia = _PADRAO_ITEM_QUADRA.match(item)
+        if not correspondencia:
+            raise ValueError(f"Item inválido na lista de quadras: '{item}'")
+
+        inicio, fim, ordem = correspondencia.groups()
+        inicio = validar_quadra(inicio)
+        fim = validar_quadra(fim) if fim else inicio
+        ordem = int(ordem) if ordem else int(ordem_padrao)
+
+        if fim < inicio:
+            raise ValueError(f"Intervalo de quadras inválido: '{item}'")
+        if fim - inicio + 1 > maximo_intervalo:
+            raise ValueError(f"Intervalo de quadras grande demais: '{item}' "
+                             f"(máximo de {maximo_intervalo} quadras por intervalo)")
+
+        for ins_quadra in range(inicio, fim + 1):
+            quadras.pop(ins_quadra, None)
+            quadras[ins_quadra] = ordem
+
+    return list(quadras.items())
+
+
+def calcular_nova_ordem(ordens, ordem_primeira):
+    """
+    Calcula a nova ordem de uma quadra girando a sequência original
+
+    O lote com ordem igual a ordem_primeira passa a ser o primeiro; os lotes
+    anteriores a ele vão para o final, mantendo a sequência.
+
+    Args:
+        ordens: Sequência com a ordem original de cada lote (None para nulo)
+        ordem_primeira: Ordem original do lote que passa a ser o primeiro
+
+    Returns:
+        Lista com a nova ordem de cada lote, na mesma posição da entrada.
+        Lotes sem ordem continuam sem ordem.
+
+    Exemplo:
+        calcular_nova_ordem([1, 2, 3, 4, 5], 3) -> [4, 5, 1, 2, 3]
+    """
+    ordens = list(ordens)
+    ordem_primeira = int(ordem_primeira)
+
+    if np is not None and len(ordens) >= LIMITE_NUMPY:
+        nulos = np.fromiter((o is None for o in ordens), dtype=bool, count=len(ordens))
+        valores = np.fromiter((0 if o is None else o for o in ordens), dtype=np.int64, count=len(ordens))
+        depois = valores >= ordem_primeira
+        offset = int(np.count_nonzero(depois & ~nulos))
+        novas = np.where(depois, valores - (ordem_primeira - 1), valores + offset)
+        return [None if nulo else int(n) for n, nulo in zip(novas.tolist(), nulos.tolist())]
+
+    offset = sum(1 for o in ordens if o is not None and o >= ordem_primeira)
+    return [
+        None if o is None
+        else o - (ordem_primeira - 1) if o >= ordem_primeira
+        else o + offset
+        for o in ordens
+    ]
+
+
+def ordem_pela_sequencia(ordens, sequencia):
+    """
+    Calcula a nova ordem de uma quadra a partir dos lotes clicados
+
+    Args:
+        ordens: Sequência com a ordem original de cada lote (None para nulo)
+        sequencia: Posições (em ordens) dos lotes, na ordem em que foram clicados
+
+    Returns:
+        Lista com a nova ordem de cada lote, na mesma posição da entrada. Os
+        lotes clicados recebem 1, 2, 3...; os demais seguem depois deles, na
+        ordem original. Lotes sem ordem e não clicados continuam sem ordem.
+
+    Exemplo:
+        ordem_pela_sequencia([1, 2, 3, 4, 5], [3, 1]) -> [3, 2, 4, 1, 5]
+    """
+    ordens = list(ordens)
+    novas = [None] * len(ordens)
+    for n_ordem, posicao in enumerate(sequencia, 1):
+        if not 0 <= posicao < len(ordens) or novas[posicao] is not None:
+            raise ValueError(f"Posição inválida ou repetida na sequência: {posicao}")
+        novas[posicao] = n_ordem
+
+    restantes = sorted((o, p) for p, o in enumerate(ordens) if novas[p] is None and o is not None)
+    for n_ordem, (_, posicao) in enumerate(restantes, len(sequencia) + 1):
+        novas[posicao] = n_ordem
+    return novas
+
+
+def montar_linhas(ins_quadra, lotes, ordem_primeira=None, sequencia=None):
+    """
+    Monta as linhas da tabela novaordem para os lotes de uma quadra
+
+    Args:
+        ins_quadra: Quadra dos lotes
+        lotes: Lista de dicionários com ao menos 'matricula' e 'ordem'.
+            As demais chaves (ex.: 'geometria') são repassadas para a linha.
+        ordem_primeira: Ordem do lote que passa a ser o primeiro.
+            None mantém a ordem original (restauração).
+        sequencia: Posições dos lotes na ordem clicada (ver
+            ordem_pela_sequencia); se informada, ordem_primeira é ignorada.
+
+    Returns:
+        Lista de dicionários com 'matricula', 'ins_quadra' e 'n_ordem'
+        prontos para gravação.
+    """
+    lotes = list(lotes)
+    ordens = [lote['ordem'] for lote in lotes]
+    if sequencia is not None:
+        ordens = ordem_pela_sequencia(ordens, sequencia)
+    elif ordem_primeira is not None:
+        ordens = calcular_nova_ordem(ordens, ordem_primeira)
+
+    linhas = []
+    for lote, n_ordem in zip(lotes, ordens):
+        linha = {chave: valor for chave, valor in lote.items() if chave not in ('ordem', 'nv_ordem')}
+        linha['ins_quadra'] = ins_quadra
+        linha['n_ordem'] = n_ordem
+        linhas.append(linha)
+    return linhas
+
+
+def calcular_diferencas(armazenadas, linhas):
+    """
+    Compara as linhas calculadas com as gravadas em novaordem
+
+    As linhas são casadas por matricula, como na gravação incremental:
+    linhas gravadas sem matrícula são sempre apagadas e as calculadas sem
+    matrícula, sempre inseridas.
+
+    Args:
+        armazenadas: Iterável de tuplas (matricula, ins_quadra, n_ordem) gravadas
+        linhas: Linhas calculadas (ver montar_linhas)
+
+    Returns:
+        Dicionário com:
+            'atualizar': lista de (matricula, n_ordem_atual, n_ordem_nova)
+            'inserir': linhas calculadas sem correspondente gravado
+            'excluir': lista de (matricula, n_ordem) gravados sem correspondente
+            'inalteradas': número de linhas que não mudam
+    """
+    gravadas = {}
+    excluir = []
+    for matricula, ins_quadra, n_ordem in armazenadas:
+        if matricula is None:
+            excluir.append((matricula, n_ordem))
+        else:
+            gravadas[matricula] = (ins_quadra, n_ordem)
+
+    atualizar = []
+    inserir = []
+    inalteradas = 0
+    calculadas = set()
+    for linha in linhas:
+        matricula = linha['matricula']
+        if matricula is None or matricula not in gravadas:
+            inserir.append(linha)
+            continue
+        calculadas.add(matricula)
+        ins_quadra, n_ordem = gravadas[matricula]
+        if n_ordem != linha['n_ordem'] or ins_quadra != linha['ins_quadra']:
+            atualizar.append((matricula, n_ordem, linha['n_ordem']))
+        else:
+            inalteradas += 1
+
+    excluir.extend((m, v[1]) for m, v in gravadas.items() if m not in calculadas)
+
+    return {
+        'atualizar': atualizar,
+        'inserir': inserir,
+        'excluir': excluir,
+        'inalteradas': inalteradas
+    }
+
+
+def contar_com_matricula(lotes):
+    """Conta os lotes que têm matrícula"""
+    return sum(1 for lote in lotes if lote['matricula'] is not None and lote['matricula'] != '')
+
+
+def validar_ordem_quadra(ins_quadra, ordem_primeira, num_lotes):
+    """
+    Valida a reorganização de uma quadra
+
+    Returns:
+        Mensagem com o motivo da recusa, ou None se a quadra pode ser reorganizada
+    """
+    if ins_quadra == 99 or ordem_primeira < 1:
+        return "Quadra ou ordem inválida"
+    if num_lotes == 0:
+        return "Nenhum lote encontrado"
+    if ordem_primeira > num_lotes:
+        return f"Ordem inicial ({ordem_primeira}) maior que número de lotes ({num_lotes})"
+    return None
+
+
+def verificar_consistencia(lotes, armazenadas):
+    """
+    Confere as linhas gravadas de uma quadra contra os lotes da camada
+
+    Args:
+        lotes: Lotes da quadra com ao menos 'matricula'
+        armazenadas: Tuplas (matricula, ins_quadra, n_ordem) gravadas da quadra
+
+    Returns:
+        Dicionário com 'faltantes' (matrículas da camada sem linha gravada),
+        'excedentes' (matrículas gravadas que não estão na camada),
+        'ordens_duplicadas', 'ordens_nulas' e 'consistente'
+    """
+    matriculas_camada = {l['matricula'] for l in lotes if l['matricula'] not in (None, '')}
+    matriculas_gravadas = {m for m, _, _ in armazenadas if m is not None}
+
+    vistas = set()
+    duplicadas = set()
+    nulas = 0
+    for _, _, n_ordem in armazenadas:
+        if n_ordem is None:
+            nulas += 1
+        elif n_ordem in vistas:
+            duplicadas.add(n_ordem)
+        else:
+            vistas.add(n_ordem)
+
+    faltantes = sorted(matriculas_camada - matriculas_gravadas, key=str)
+    excedentes = sorted(matriculas_gravadas - matriculas_camada, key=str)
+    return {
+        'faltantes': faltantes,
+        'excedentes': excedentes,
+        'ordens_duplicadas': sorted(duplicadas),
+        'ordens_nulas': nulas,
+        'consistente': not (faltantes or excedentes or duplicadas or nulas)
+    }
+
+
+def analisar_sequencia(valores):
+    """
+    Confere se os valores formam a sequência 1..N, sem repetição
+
+    Args:
+        valores: Ordens de uma quadra (None para nulo); N é o número de não nulos
+
+    Returns:
+        Dicionário com 'nulas' (quantidade), 'duplicadas', 'lacunas' (números
+        de 1 a N que faltam) e 'fora_da_faixa' (menores que 1 ou maiores que N)
+    """
+    contagem = {}
+    nulas = 0
+    for valor in valores:
+        if valor is None:
+            nulas += 1
+        else:
+            contagem[valor] = contagem.get(valor, 0) + 1
+    total = len(valores) - nulas
+    return {
+        'nulas': nulas,
+        'duplicadas': sorted(v for v, n in contagem.items() if n > 1),
+        'lacunas': [n for n in range(1, total + 1) if n not in contagem],
+        'fora_da_faixa': sorted(v for v in contagem if v < 1 or v > total)
+    }
+
+
+_PROBLEMAS_SEQUENCIA = (
+    ('duplicadas', 'duplicada'), ('nulas', 'nula'), ('lacunas', 'lacuna'), ('fora_da_faixa', 'fora_da_faixa'))
+
+
+def diagnosticar_quadra(lotes, armazenadas=None):
+    """
+    Procura os problemas de ordenação de uma quadra
+
+    Args:
+        lotes: Lotes da quadra com 'matricula', 'ordem' e 'nv_ordem'
+        armazenadas: Tuplas (matricula, ins_quadra, n_ordem) gravadas da
+            quadra em novaordem, ou None para não conferir a tabela
+
+    Returns:
+        Dicionário com 'lotes', 'sem_matricula', as análises 'ordem',
+        'nv_ordem' e 'n_ordem' (ver analisar_sequencia; None se a quadra não
+        foi reorganizada), 'faltantes', 'excedentes', 'parcial' (só parte dos
+        lotes reorganizada) e 'problemas' (códigos, vazio se a quadra está
+        correta)
+    """
+    lotes = list(lotes)
+    com_matricula = [l for l in lotes if l['matricula'] is not None and l['matricula'] != '']
+    diagnostico = {
+        'lotes': len(lotes),
+        'sem_matricula': len(lotes) - len(com_matricula),
+        'ordem': analisar_sequencia([l['ordem'] for l in lotes]),
+        'nv_ordem': None,
+        'n_ordem': None,
+        'faltantes': [],
+        'excedentes': [],
+        'parcial': False
+    }
+
+    nv_ordens = [l.get('nv_ordem') for l in com_matricula]
+    reorganizados = sum(1 for n in nv_ordens if n is not None)
+    if reorganizados:
+        diagnostico['nv_ordem'] = analisar_sequencia([n for n in nv_ordens if n is not None])
+        diagnostico['parcial'] = reorganizados < len(com_matricula)
+
+    if armazenadas:
+        consistencia = verificar_consistencia(lotes, armazenadas)
+        diagnostico['n_ordem'] = analisar_sequencia([n for _, _, n in armazenadas])
+        diagnostico['faltantes'] = consistencia['faltantes']
+        diagnostico['excedentes'] = consistencia['excedentes']
+        if consistencia['faltantes'] and len(consistencia['faltantes']) < len(com_matricula):
+            diagnostico['parcial'] = True
+
+    problemas = []
+    for campo in ('ordem', 'nv_ordem', 'n_ordem'):
+        analise = diagnostico[campo]
+        if analise:
+            problemas.extend(f'{campo}_{codigo}' for chave, codigo in _PROBLEMAS_SEQUENCIA if analise[chave])
+    if diagnostico['sem_matricula']:
+        problemas.append('sem_matricula')
+    if diagnostico['parcial']:
+        problemas.append('parcial')
+    if diagnostico['faltantes']:
+        problemas.append('novaordem_faltantes')
+    if diagnostico['excedentes']:
+        problemas.append('novaordem_excedentes')
+    diagnostico['problemas'] = problemas
+    return diagnostico
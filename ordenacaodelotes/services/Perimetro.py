@@ -0,0 +1,151 @@
+"""
+Ordenação de lotes pelo perímetro da quadra
+Arquivo: Perimetro.py
+
+Funções puras, sem dependência do QGIS: cada lote é representado por um
+ponto (centroide) projetado no contorno da quadra, e a ordem é a posição
+dessa projeção percorrendo o contorno no sentido horário a partir de um
+ponto inicial. Usa NumPy, quando disponível, para projetar todos os lotes
+da quadra de uma só vez.
+"""
+
+import math
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from .Ordenacao import LIMITE_NUMPY
+
+
+# Canto da caixa envolvente usado como início do percurso
+CANTOS = ('noroeste', 'nordeste', 'sudeste', 'sudoeste')
+
+
+def area_assinada(anel):
+    """Área com sinal do anel (positiva quando anti-horário)"""
+    area = 0.0
+    for (x1, y1), (x2, y2) in zip(anel, anel[1:] + anel[:1]):
+        area += x1 * y2 - x2 * y1
+    return area / 2.0
+
+
+def orientar_horario(anel):
+    """Retorna o anel fechado e no sentido horário"""
+    anel = [tuple(p[:2]) for p in anel]
+    if len(anel) > 1 and anel[0] == anel[-1]:
+        anel = anel[:-1]
+    if area_assinada(anel) > 0:
+        anel.reverse()
+    return anel + anel[:1]
+
+
+def ponto_do_canto(anel, canto):
+    """Vértice do anel mais próximo do canto informado da caixa envolvente"""
+    if canto not in CANTOS:
+        raise ValueError(f"Canto inválido: '{canto}'")
+    xs = [p[0] for p in anel]
+    ys = [p[1] for p in anel]
+    alvo = (
+        min(xs) if canto in ('noroeste', 'sudoeste') else max(xs),
+        max(ys) if canto in ('noroeste', 'nordeste') else min(ys),
+    )
+    return min(anel, key=lambda p: (p[0] - alvo[0]) ** 2 + (p[1] - alvo[1]) ** 2)
+
+
+def _posicoes_python(anel, pontos):
+    segmentos = []
+    acumulado = 0.0
+    for (ax, ay), (bx, by) in zip(anel, anel[1:]):
+        comprimento = math.hypot(bx - ax, by - ay)
+        segmentos.append((ax, ay, bx - ax, by - ay, comprimento, acumulado))
+        acumulado += comprimento
+
+    posicoes = []
+    for px, py in pontos:
+        melhor = None
+        for ax, ay, dx, dy, comprimento, inicio in segmentos:
+            if comprimento == 0:
+                continue
+            t = ((px - ax) * dx + (py - ay) * dy) / (comprimento * comprimento)
+            t = min(max(t, 0.0), 1.0)
+            distancia = (ax + t * dx - px) ** 2 + (ay + t * dy - py) ** 2
+            if melhor is None or distancia < melhor[0]:
+                melhor = (distancia, inicio + t * comprimento)
+        posicoes.append(melhor[1] if melhor else 0.0)
+    return posicoes, acumulado
+
+
+def _posicoes_numpy(anel, pontos):
+    vertices = np.asarray(anel, dtype=float)
+    a = vertices[:-1]
+    d = vertices[1:] - a
+    comprimentos = np.hypot(d[:, 0], d[:, 1])
+    inicios = np.concatenate(([0.0], np.cumsum(comprimentos)[:-1]))
+    quadrados = np.where(comprimentos > 0, comprimentos ** 2, np.inf)
+
+    p = np.asarray(pontos, dtype=float)
+    # Matriz pontos x segmentos com o parâmetro da projeção de cada ponto
+    relativo = p[:, None, :] - a[None, :, :]
+    t = np.clip((relativo * d[None, :, :]).sum(axis=2) / quadrados[None, :], 0.0, 1.0)
+    proximos = a[None, :, :] + t[:, :, None] * d[None, :, :]
+    distancias = ((proximos - p[:, None, :]) ** 2).sum(axis=2)
+    distancias[:, comprimentos == 0] = np.inf
+
+    segmento = distancias.argmin(axis=1)
+    linhas = np.arange(len(p))
+    posicoes = inicios[segmento] + t[linhas, segmento] * comprimentos[segmento]
+    return posicoes.tolist(), float(comprimentos.sum())
+
+
+def posicoes_no_perimetro(anel, pontos):
+    """
+    Distância, ao longo do anel, da projeção de cada ponto
+
+    Args:
+        anel: Vértices do contorno, fechado (primeiro == último)
+        pontos: Lista de (x, y)
+
+    Returns:
+        Tupla (posições na ordem dos pontos, perímetro)
+    """
+    pontos = [tuple(p[:2]) for p in pontos]
+    if not pontos:
+        return [], 0.0
+    if np is not None and len(pontos) * len(anel) >= LIMITE_NUMPY:
+        return _posicoes_numpy(anel, pontos)
+    return _posicoes_python(anel, pontos)
+
+
+def ordem_pelo_perimetro(anel, pontos, inicio='noroeste'):
+    """
+    Calcula a ordem dos lotes percorrendo a quadra no sentido horário
+
+    Args:
+        anel: Vértices do contorno da quadra (qualquer orientação)
+        pontos: Centroides dos lotes, (x, y)
+        inicio: Nome do canto de partida (ver CANTOS) ou ponto (x, y), por
+            exemplo o centroide do lote clicado
+
+    Returns:
+        Lista com a ordem (1..n) de cada lote, na mesma posição da entrada
+
+    Exemplo:
+        quadrado = [(0, 0), (0, 10), (10, 10), (10, 0)]
+        ordem_pelo_perimetro(quadrado, [(8, 9), (2, 9), (5, 1)], 'noroeste') -> [2, 1, 3]
+    """
+    anel = orientar_horario(anel)
+    ponto_inicial = ponto_do_canto(anel, inicio) if isinstance(inicio, str) else tuple(inicio[:2])
+
+    posicoes, perimetro = posicoes_no_perimetro(anel, list(pontos) + [ponto_inicial])
+    origem = posicoes.pop()
+    if perimetro <= 0:
+        return list(range(1, len(posicoes) + 1))
+
+    relativas = [(p - origem) % perimetro for p in posicoes]
+    ordenados = sorted(range(len(relativas)), key=lambda i: relativas[i])
+    ordem = [0] * len(relativas)
+    for posicao, indice in enumerate(ordenados, 1):
+        ordem[indice] = posicao
+    return ordem
@@ -0,0 +1,129 @@
+"""
+Pré-busca da quadra selecionada
+Arquivo: PreBusca.py
+
+Ao clicar em uma quadra, os lotes (com geometria) e as linhas gravadas em
+novaordem são lidos em segundo plano e guardados em um cache LRU pequeno.
+A pré-visualização e a gravação usam o cache, se ainda válido, em vez de
+reler a camada e o banco. Uma entrada deixa de valer quando o índice de
+lotes muda, quando a quadra é gravada ou após TEMPO_VALIDADE segundos.
+"""
+
+import threading
+import time
+from collections import OrderedDict
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsFeatureRequest, QgsTask, QgsVectorLayerFeatureSource
+
+from .IndiceLotes import valor_ou_none
+from .NovaOrdem import linhas_gravadas
+
+
+CAPACIDADE_PADRAO = 16
+TEMPO_VALIDADE = 60
+
+
+def ordem_original(lotes):
+    """Indica se a quadra está na ordem original (mesma regra de contar_lotes_na_quadra)"""
+    for lote in lotes:
+        if lote['matricula'] is not None and lote['matricula'] != '':
+            return lote['ordem'] == lote['nv_ordem']
+    return True
+
+
+class CachePreBusca:
+    """Cache LRU de pré-buscas por (conexão, quadra), seguro entre threads"""
+
+    def __init__(self, capacidade=CAPACIDADE_PADRAO, validade=TEMPO_VALIDADE):
+        self.capacidade = capacidade
+        self.validade = validade
+        self._entradas = OrderedDict()
+        self._lock = threading.Lock()
+        # Muda a cada invalidação: pré-buscas iniciadas antes dela são descartadas
+        self.geracao = 0
+
+    def obter(self, conexao, ins_quadra, versao):
+        """Entrada da quadra, se existir e ainda valer para a versão do índice de lotes"""
+        chave = (conexao, int(ins_quadra))
+        with self._lock:
+            entrada = self._entradas.get(chave)
+            if entrada is None:
+                return None
+            if entrada['versao'] != versao or time.monotonic() - entrada['instante'] > self.validade:
+                del self._entradas[chave]
+                return None
+            self._entradas.move_to_end(chave)
+            return entrada
+
+    def guardar(self, entrada):
+        """Guarda a entrada, a menos que o cache tenha sido invalidado desde o início da pré-busca"""
+        chave = (entrada['conexao'], entrada['ins_quadra'])
+        with self._lock:
+            if entrada.get('geracao', self.geracao) != self.geracao:
+                return
+            self._entradas[chave] = entrada
+            self._entradas.move_to_end(chave)
+            while len(self._entradas) > self.capacidade:
+                self._entradas.popitem(last=False)
+
+    def invalidar(self, conexao=None, quadras=None):
+        """Descarta as entradas da conexão/quadras informadas (ou todas)"""
+        with self._lock:
+            self.geracao += 1
+            if conexao is None and quadras is None:
+                self._entradas.clear()
+                return
+            quadras = None if quadras is None else {int(q) for q in quadras}
+            for chave in list(self._entradas):
+                if (conexao is None or chave[0] == conexao) and (quadras is None or chave[1] in quadras):
+                    del self._entradas[chave]
+
+
+class TarefaPreBusca(QgsTask):
+    """
+    Lê em segundo plano os lotes de uma quadra e suas linhas em novaordem
+
+    A camada é lida por um QgsVectorLayerFeatureSource criado na thread
+    principal. Emite concluida(entrada) com 'conexao', 'ins_quadra',
+    'versao', 'geracao', 'lotes', 'gravadas', 'num_lotes', 'ordem_original'
+    e 'instante', ou concluida com 'erro' se a leitura falhar.
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, conexao, ins_quadra, camada_lotes, fids, resumo, versao):
+        super().__init__(f"Pré-busca da quadra {ins_quadra}", QgsTask.CanCancel)
+        self.fonte = QgsVectorLayerFeatureSource(camada_lotes)
+        self.campos = camada_lotes.fields()
+        self.fids = list(fids)
+        self.entrada = dict(resumo, conexao=conexao, ins_quadra=int(ins_quadra), versao=versao)
+        self.erro = None
+
+    def run(self):
+        try:
+            request = QgsFeatureRequest()
+            request.setFilterFids(self.fids)
+            request.setSubsetOfAttributes(['matricula', 'ordem'], self.campos)
+            lotes = []
+            for f in self.fonte.getFeatures(request):
+                if self.isCanceled():
+                    return False
+                lotes.append({'matricula': valor_ou_none(f['matricula']),
+                              'ordem': valor_ou_none(f['ordem']),
+                              'geometria': f.geometry()})
+            self.setProgress(50)
+            self.entrada['lotes'] = lotes
+            self.entrada['gravadas'] = linhas_gravadas(self.entrada['conexao'], [self.entrada['ins_quadra']])
+            self.entrada['instante'] = time.monotonic()
+            return True
+        except Exception as e:
+            self.erro = e
+            return False
+
+    def finished(self, resultado):
+        if resultado:
+            self.concluida.emit(self.entrada)
+        else:
+            self.concluida.emit({'conexao': self.entrada['conexao'], 'ins_quadra': self.entrada['ins_quadra'],
+                                 'erro': str(self.erro) if self.erro else 'cancelada'})
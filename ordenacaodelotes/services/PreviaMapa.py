@@ -0,0 +1,154 @@
+"""
+Prévia da nova ordem no mapa
+Arquivo: PreviaMapa.py
+
+Mostra o n_ordem calculado de cada lote da quadra como rótulo de uma camada
+de pontos em memória, sem gravar na novaordem. Os pontos são criados uma vez
+por quadra; ao mudar a ordem inicial só os valores de n_ordem são trocados,
+o que mantém cada atualização bem abaixo de 50 ms mesmo com centenas de
+lotes.
+"""
+
+from qgis.PyQt.QtCore import QVariant
+from qgis.PyQt.QtGui import QColor, QFont
+from qgis.core import (
+    QgsFeature, QgsField, QgsMarkerSymbol, QgsPalLayerSettings, QgsProject, QgsSingleSymbolRenderer,
+    QgsTextBufferSettings, QgsTextFormat, QgsVectorLayer, QgsVectorLayerSimpleLabeling)
+
+from .Ordenacao import calcular_nova_ordem, contar_com_matricula
+
+
+NOME_CAMADA = 'Prévia da nova ordem'
+
+
+def _rotulagem():
+    formato = QgsTextFormat()
+    formato.setFont(QFont("Segoe UI", 10, QFont.Bold))
+    formato.setSize(10)
+    formato.setColor(QColor('#c0392b'))
+    contorno = QgsTextBufferSettings()
+    contorno.setEnabled(True)
+    contorno.setSize(1)
+    contorno.setColor(QColor('white'))
+    formato.setBuffer(contorno)
+
+    rotulo = QgsPalLayerSettings()
+    rotulo.fieldName = 'n_ordem'
+    rotulo.placement = QgsPalLayerSettings.OverPoint
+    rotulo.setFormat(formato)
+    return QgsVectorLayerSimpleLabeling(rotulo)
+
+
+class PreviaMapa:
+    """Camada de prévia de uma quadra por vez, removida ao limpar"""
+
+    def __init__(self, projeto=None):
+        self.projeto = projeto or QgsProject.instance()
+        self.camada = None
+        self.ins_quadra = None
+        self.versao = None
+        self.num_lotes = 0
+        self._fids = []
+        self._fid_por_posicao = {}
+        self._ordens = []
+
+    def _criar_camada(self, camada_lotes):
+        camada = QgsVectorLayer(f"Point?crs={camada_lotes.crs().authid()}", NOME_CAMADA, "memory")
+        camada.dataProvider().addAttributes([QgsField('matricula', QVariant.String),
+                                             QgsField('n_ordem', QVariant.Int)])
+        camada.updateFields()
+        camada.setRenderer(QgsSingleSymbolRenderer(
+            QgsMarkerSymbol.createSimple({'name': 'circle', 'size': '1.2', 'color': '#c0392b'})))
+        camada.setLabeling(_rotulagem())
+        camada.setLabelsEnabled(True)
+        self.projeto.addMapLayer(camada, False)
+        self.projeto.layerTreeRoot().insertLayer(0, camada)
+        self.camada = camada
+        self.camada.willBeDeleted.connect(self._ao_remover_camada)
+
+    def _ao_remover_camada(self):
+        # Camada removida pelo usuário
+        self.camada = None
+        self.ins_quadra = None
+
+    def carregar(self, camada_lotes, ins_quadra, lotes, versao=None):
+        """
+        Cria os pontos da quadra na camada de prévia
+
+        Args:
+            camada_lotes: Camada de lotes (define o SRC da prévia)
+            ins_quadra: Quadra
+            lotes: Lotes com 'matricula', 'ordem' e 'geometria'
+            versao: Versão do índice de lotes de onde vieram os lotes
+        """
+        if self.camada is None:
+            self._criar_camada(camada_lotes)
+        provedor = self.camada.dataProvider()
+        provedor.truncate()
+
+        # A nova ordem é calculada com todos os lotes; só os que têm geometria viram pontos
+        features = []
+        posicoes = []
+        for posicao, lote in enumerate(lotes):
+            if lote.get('geometria') is None or lote['geometria'].isEmpty():
+                continue
+            feature = QgsFeature(self.camada.fields())
+            feature.setAttributes([None if lote['matricula'] is None else str(lote['matricula']), None])
+            feature.setGeometry(lote['geometria'].pointOnSurface())
+            features.append(feature)
+            posicoes.append(posicao)
+        _, adicionadas = provedor.addFeatures(features)
+
+        self._fids = [(f.id(), posicao) for f, posicao in zip(adicionadas, posicoes)]
+        self._fid_por_posicao = {posicao: fid for fid, posicao in self._fids}
+        self._ordens = [lote['ordem'] for lote in lotes]
+        self.ins_quadra = int(ins_quadra)
+        self.versao = versao
+        self.num_lotes = contar_com_matricula(lotes)
+        self.camada.updateExtents()
+
+    def atualizar(self, ordem_primeira):
+        """
+        Troca os rótulos pela nova ordem calculada
+
+        Args:
+            ordem_primeira: Ordem inicial; None mostra a ordem original
+        """
+        if self.camada is None:
+            return
+        novas = self._ordens if ordem_primeira is None else calcular_nova_ordem(self._ordens, ordem_primeira)
+        indice = self.camada.fields().indexOf('n_ordem')
+        self.camada.dataProvider().changeAttributeValues(
+            {fid: {indice: novas[posicao]} for fid, posicao in self._fids})
+        self.camada.triggerRepaint()
+
+    def mostrar_ordens(self, ordens_por_posicao):
+        """
+        Troca só os rótulos dos lotes informados
+
+        Args:
+            ordens_por_posicao: {posição do lote em carregar: n_ordem ou None}
+        """
+        if self.camada is None:
+            return
+        indice = self.camada.fields().indexOf('n_ordem')
+        self.camada.dataProvider().changeAttributeValues(
+            {self._fid_por_posicao[posicao]: {indice: n_ordem} for posicao, n_ordem in ordens_por_posicao.items()
+             if posicao in self._fid_por_posicao})
+        self.camada.triggerRepaint()
+
+    def limpar(self):
+        """Remove a camada de prévia do projeto"""
+        if self.camada is not None:
+            camada, self.camada = self.camada, None
+            try:
+                camada.willBeDeleted.disconnect(self._ao_remover_camada)
+                self.projeto.removeMapLayer(camada.id())
+            except RuntimeError:
+                pass
+        self.ins_quadra = None
+        self.versao = None
+        self.num_lotes = 0
+        self._fids = []
+        self._fid_por_posicao = {}
+        self._ordens = []
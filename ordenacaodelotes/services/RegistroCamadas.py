@@ -0,0 +1,151 @@
+"""
+Registro das camadas usadas pelos plugins
+Arquivo: RegistroCamadas.py
+
+Resolve as camadas Quadra, Lote e Linhas_corte uma única vez e se mantém
+atualizado pelos sinais do projeto, evitando varrer todas as camadas a cada
+clique no mapa.
+
+Cada papel pode ser configurado, nesta ordem de prioridade, por:
+    1. propriedade personalizada da camada 'organizaloteclick/papel' = papel
+    2. id da camada em OrganizaLoteClick/camadas/<papel>/id
+    3. nome da camada em OrganizaLoteClick/camadas/<papel>/nome
+    4. fonte de dados: esquema e tabela do papel (apenas papéis que definem 'fonte')
+    5. nome padrão do papel
+    6. trecho do nome (apenas papéis que definem 'contem')
+
+Os critérios por nome (5 e 6) ignoram camadas cuja fonte é a tabela de
+outro papel: a camada v_lote do poligonizador também se chama Lote.
+"""
+
+from qgis.PyQt.QtCore import QSettings
+from qgis.core import QgsDataSourceUri, QgsProject
+
+
+PROPRIEDADE_PAPEL = 'organizaloteclick/papel'
+
+PAPEIS = {
+    'quadra': {'nome': 'Quadra'},
+    'lote': {'nome': 'Lote', 'fonte': ('comercial_umc', 'gis_boletim_lote'), 'contem': ('gis_boletim_lote', 'lote')},
+    'v_lote': {'nome': 'Lote', 'fonte': ('comercial_umc', 'v_lote')},
+    'linhas_corte': {'nome': 'Linhas_corte'},
+}
+
+
+def fonte_da_camada(camada):
+    """(esquema, tabela) de uma camada do provedor postgres, ou None"""
+    if camada.providerType() != 'postgres':
+        return None
+    uri = QgsDataSourceUri(camada.source())
+    return (uri.schema(), uri.table())
+
+
+class RegistroCamadas:
+    """Mantém o id da camada de cada papel, resolvido sob demanda"""
+
+    def __init__(self, projeto=None):
+        self.projeto = projeto or QgsProject.instance()
+        self._ids = {}
+        self._resolvido = False
+        self._camadas_conectadas = {}
+
+        self.projeto.layersAdded.connect(self._ao_adicionar_camadas)
+        self.projeto.layersRemoved.connect(self._ao_remover_camadas)
+        self.projeto.cleared.connect(self.invalidar)
+        self._ao_adicionar_camadas(self.projeto.mapLayers().values())
+
+    def desconectar(self):
+        """Desconecta o registro dos sinais do projeto e das camadas"""
+        for sinal, slot in (
+            (self.projeto.layersAdded, self._ao_adicionar_camadas),
+            (self.projeto.layersRemoved, self._ao_remover_camadas),
+            (self.projeto.cleared, self.invalidar),
+        ):
+            try:
+                sinal.disconnect(slot)
+            except (TypeError, RuntimeError):
+                pass
+        for camada in self._camadas_conectadas.values():
+            for sinal, slot in self._sinais_da_camada(camada):
+                try:
+                    sinal.disconnect(slot)
+                except (TypeError, RuntimeError):
+                    pass
+        self._camadas_conectadas = {}
+
+    def invalidar(self):
+        """Força nova resolução na próxima consulta"""
+        self._resolvido = False
+
+    def _sinais_da_camada(self, camada):
+        """
+        Sinais da camada que invalidam a resolução
+
+        dataSourceChanged (QGIS 3.6) e customPropertyChanged (QGIS 3.18) não
+        existem nas versões mais antigas: nelas, trocar a fonte ou o papel de
+        uma camada só vale depois de outra mudança no projeto.
+        """
+        sinais = [(camada.nameChanged, self.invalidar)]
+        if hasattr(camada, 'dataSourceChanged'):
+            sinais.append((camada.dataSourceChanged, self.invalidar))
+        if hasattr(camada, 'customPropertyChanged'):
+            sinais.append((camada.customPropertyChanged, self._ao_mudar_propriedade))
+        return sinais
+
+    def _ao_adicionar_camadas(self, camadas):
+        for camada in camadas:
+            if camada.id() in self._camadas_conectadas:
+                continue
+            for sinal, slot in self._sinais_da_camada(camada):
+                sinal.connect(slot)
+            self._camadas_conectadas[camada.id()] = camada
+        self.invalidar()
+
+    def _ao_remover_camadas(self, ids):
+        for id_camada in ids:
+            self._camadas_conectadas.pop(id_camada, None)
+        if set(ids) & set(self._ids.values()):
+            self.invalidar()
+
+    def _ao_mudar_propriedade(self, chave):
+        if chave == PROPRIEDADE_PAPEL:
+            self.invalidar()
+
+    def _resolver(self):
+        settings = QSettings()
+        camadas = list(self.projeto.mapLayers().values())
+        fontes = {id(c): fonte_da_camada(c) for c in camadas}
+        self._ids = {}
+
+        for papel, definicao in PAPEIS.items():
+            outras_fontes = {d['fonte'] for p, d in PAPEIS.items() if p != papel and 'fonte' in d}
+
+            def por_nome(c):
+                return fontes[id(c)] not in outras_fontes
+
+            id_configurado = settings.value(f'OrganizaLoteClick/camadas/{papel}/id', '')
+            nome_configurado = settings.value(f'OrganizaLoteClick/camadas/{papel}/nome', '')
+            criterios = [
+                lambda c: c.customProperty(PROPRIEDADE_PAPEL) == papel,
+                lambda c: bool(id_configurado) and c.id() == id_configurado,
+                lambda c: bool(nome_configurado) and c.name() == nome_configurado,
+                lambda c: 'fonte' in definicao and fontes[id(c)] == definicao['fonte'],
+                lambda c: por_nome(c) and c.name() == definicao['nome'],
+            ]
+            for trecho in definicao.get('contem', ()):
+                criterios.append(lambda c, trecho=trecho: por_nome(c) and trecho in c.name().lower())
+
+            for criterio in criterios:
+                camada = next((c for c in camadas if criterio(c)), None)
+                if camada is not None:
+                    self._ids[papel] = camada.id()
+                    break
+
+        self._resolvido = True
+
+    def camada(self, papel):
+        """Retorna a camada do papel ('quadra', 'lote', 'v_lote', 'linhas_corte') ou None"""
+        if not self._resolvido:
+            self._resolver()
+        id_camada = self._ids.get(papel)
+        return self.projeto.mapLayer(id_camada) if id_camada else None
@@ -0,0 +1,355 @@
+"""
+Sequência de leitura entre quadras
+Arquivo: Rota.py
+
+Funções puras, sem dependência do QGIS. Cada quadra entra na rota como um
+trecho já ordenado (a ordem do perímetro), com um ponto de entrada (primeiro
+lote) e um de saída (último lote), e pode ser percorrida nos dois sentidos.
+A rota é um caminho aberto que passa uma vez por cada quadra, montado pelo
+vizinho mais próximo e melhorado por 2-opt e Or-opt. As melhorias só testam
+as quadras cujas pontas estão entre as VIZINHOS mais próximas, o que mantém
+milhares de quadras em poucos segundos.
+"""
+
+import math
+import time
+from collections import deque
+
+
+VIZINHOS = 8
+TAMANHO_MAXIMO_OR = 3
+
+
+def _distancia(a, b):
+    if a is None or b is None:
+        return 0.0
+    return math.hypot(a[0] - b[0], a[1] - b[1])
+
+
+class GradePontos:
+    """Grade regular para buscar os pontos mais próximos, com remoção"""
+
+    def __init__(self, pontos):
+        self.pontos = pontos
+        xs = [p[0] for p in pontos] or [0.0]
+        ys = [p[1] for p in pontos] or [0.0]
+        self.x0, self.y0 = min(xs), min(ys)
+        extensao = max(max(xs) - self.x0, max(ys) - self.y0)
+        # Cerca de dois pontos por célula
+        self.celula = extensao / math.sqrt(max(len(pontos) / 2.0, 1.0)) or 1.0
+        self.restantes = len(pontos)
+        self._celulas = {}
+        for indice, ponto in enumerate(pontos):
+            self._celulas.setdefault(self._chave(ponto), set()).add(indice)
+        self._ultima = self._chave((self.x0 + extensao, self.y0 + extensao))
+
+    def _chave(self, ponto):
+        return (int((ponto[0] - self.x0) // self.celula), int((ponto[1] - self.y0) // self.celula))
+
+    def remover(self, indice):
+        celula = self._celulas.get(self._chave(self.pontos[indice]))
+        if celula is not None and indice in celula:
+            celula.discard(indice)
+            self.restantes -= 1
+
+    def _anel(self, cx, cy, raio):
+        if raio == 0:
+            yield (cx, cy)
+            return
+        for dx in range(-raio, raio + 1):
+            yield (cx + dx, cy - raio)
+            yield (cx + dx, cy + raio)
+        for dy in range(-raio + 1, raio):
+            yield (cx - raio, cy + dy)
+            yield (cx + raio, cy + dy)
+
+    def mais_proximos(self, ponto, quantidade=1, ignorar=None):
+        """
+        Índices dos pontos mais próximos, do mais perto ao mais longe
+
+        Args:
+            ponto: (x, y)
+            quantidade: Quantos pontos retornar (no máximo)
+            ignorar: Função que recebe o índice e descarta o ponto se True
+        """
+        cx, cy = self._chave(ponto)
+        encontrados = []
+        raio = 0
+        # Anel a partir do qual nenhuma célula ocupada resta
+        limite = max(abs(cx), abs(cy), abs(self._ultima[0] - cx), abs(self._ultima[1] - cy))
+        while raio <= limite and self.restantes:
+            for chave in self._anel(cx, cy, raio):
+                for indice in self._celulas.get(chave, ()):
+                    if ignorar is None or not ignorar(indice):
+                        encontrados.append((_distancia(ponto, self.pontos[indice]), indice))
+            # Os pontos das células do próximo anel estão a pelo menos raio * celula
+            if len(encontrados) >= quantidade:
+                encontrados.sort()
+                if encontrados[quantidade - 1][0] <= raio * self.celula:
+                    break
+            raio += 1
+        encontrados.sort()
+        return [indice for _, indice in encontrados[:quantidade]]
+
+
+def _vizinho_mais_proximo(extremos, inicio, vizinhos):
+    """
+    Rota inicial: sempre a ponta livre mais próxima da saída da quadra anterior
+
+    Procura primeiro na lista de vizinhos da saída; a grade só é percorrida
+    quando todos eles já estão na rota.
+    """
+    pontas = [p for entrada, saida in extremos for p in (entrada, saida)]
+    grade = GradePontos(pontas)
+    visitada = [False] * len(extremos)
+    ordem = []
+    invertida = [False] * len(extremos)
+    atual, ponta_atual = inicio, None
+    while grade.restantes:
+        livres = [p for p in vizinhos[ponta_atual] if not visitada[p // 2]] if ponta_atual is not None else []
+        proximos = livres[:1] or grade.mais_proximos(atual, 1)
+        if not proximos:
+            break
+        ponta = proximos[0]
+        quadra = ponta // 2
+        visitada[quadra] = True
+        invertida[quadra] = bool(ponta % 2)
+        ordem.append(quadra)
+        grade.remover(2 * quadra)
+        grade.remover(2 * quadra + 1)
+        ponta_atual = 2 * quadra + (0 if invertida[quadra] else 1)
+        atual = pontas[ponta_atual]
+    return ordem, invertida
+
+
+class _Rota:
+    """Rota aberta com a posição e o sentido de cada quadra"""
+
+    def __init__(self, extremos, ordem, invertida):
+        self.extremos = extremos
+        self.ordem = ordem
+        self.invertida = invertida
+        self.posicao = [0] * len(extremos)
+        for posicao, quadra in enumerate(ordem):
+            self.posicao[quadra] = posicao
+
+    def entrada(self, quadra):
+        return self.extremos[quadra][1 if self.invertida[quadra] else 0]
+
+    def saida(self, quadra):
+        return self.extremos[quadra][0 if self.invertida[quadra] else 1]
+
+    # A lacuna g fica entre as posições g - 1 e g (0 antes da primeira, n depois da última)
+    def esquerda(self, lacuna):
+        return self.saida(self.ordem[lacuna - 1]) if lacuna > 0 else None
+
+    def direita(self, lacuna):
+        return self.entrada(self.ordem[lacuna]) if lacuna < len(self.ordem) else None
+
+    def custo_lacuna(self, lacuna):
+        return _distancia(self.esquerda(lacuna), self.direita(lacuna))
+
+    def comprimento(self):
+        return sum(self.custo_lacuna(g) for g in range(1, len(self.ordem)))
+
+    def inverter(self, i, j):
+        """Percorre as quadras das posições i..j na ordem e no sentido inversos"""
+        trecho = self.ordem[i:j + 1]
+        trecho.reverse()
+        self.ordem[i:j + 1] = trecho
+        for posicao, quadra in enumerate(trecho, i):
+            self.posicao[quadra] = posicao
+            self.invertida[quadra] = not self.invertida[quadra]
+
+    def mover(self, i, tamanho, lacuna, inverter):
+        """Leva as quadras das posições i..i+tamanho-1 para a lacuna informada"""
+        trecho = self.ordem[i:i + tamanho]
+        if inverter:
+            trecho.reverse()
+            for quadra in trecho:
+                self.invertida[quadra] = not self.invertida[quadra]
+        if lacuna > i:
+            self.ordem[i:lacuna] = self.ordem[i + tamanho:lacuna] + trecho
+            inicio, fim = i, lacuna
+        else:
+            self.ordem[lacuna:i + tamanho] = trecho + self.ordem[lacuna:i]
+            inicio, fim = lacuna, i + tamanho
+        for posicao in range(inicio, fim):
+            self.posicao[self.ordem[posicao]] = posicao
+
+    def ponta_da_esquerda(self, lacuna):
+        quadra = self.ordem[lacuna - 1]
+        return 2 * quadra + (0 if self.invertida[quadra] else 1)
+
+    def ponta_da_direita(self, lacuna):
+        quadra = self.ordem[lacuna]
+        return 2 * quadra + (1 if self.invertida[quadra] else 0)
+
+    def e_saida(self, ponta):
+        """Indica se a ponta é, no sentido atual, a saída da sua quadra"""
+        return bool(ponta % 2) != self.invertida[ponta // 2]
+
+    def lacuna_da_ponta(self, ponta):
+        """Lacuna de que a ponta é um dos lados: depois da quadra (saída) ou antes (entrada)"""
+        posicao = self.posicao[ponta // 2]
+        return posicao + 1 if self.e_saida(ponta) else posicao
+
+
+def _ganho_2opt(rota, g, h):
+    if g > h:
+        g, h = h, g
+    if h - g < 1:
+        return 0.0
+    antes = rota.custo_lacuna(g) + rota.custo_lacuna(h)
+    depois = _distancia(rota.esquerda(g), rota.esquerda(h)) + _distancia(rota.direita(g), rota.direita(h))
+    return antes - depois
+
+
+def _tentar_2opt(rota, quadra, vizinhos):
+    """
+    Procura uma inversão que encurte a rota em uma das lacunas da quadra
+
+    A nova ligação une a ponta da lacuna a uma de suas vizinhas; retorna as
+    quadras junto das lacunas alteradas, ou None se nada melhorou.
+    """
+    n = len(rota.ordem)
+    posicao = rota.posicao[quadra]
+    for g in (posicao, posicao + 1):
+        lados = []
+        if g > 0:
+            lados.append((True, rota.ponta_da_esquerda(g)))
+        if g < n:
+            lados.append((False, rota.ponta_da_direita(g)))
+        for esquerda, ponta_g in lados:
+            candidatas = [0, n]
+            for ponta in vizinhos[ponta_g]:
+                # Esquerda liga com esquerda (saídas) e direita com direita (entradas)
+                if rota.e_saida(ponta) == esquerda:
+                    candidatas.append(rota.lacuna_da_ponta(ponta))
+            for h in candidatas:
+                if h != g and _ganho_2opt(rota, g, h) > 1e-9:
+                    i, j = min(g, h), max(g, h) - 1
+                    rota.inverter(i, j)
+                    return [rota.ordem[k] for k in (i - 1, i, j, j + 1) if 0 <= k < n]
+    return None
+
+
+def _ganho_or(rota, i, tamanho, lacuna, inverter):
+    fim = i + tamanho
+    if i <= lacuna <= fim:
+        return 0.0
+    primeira, ultima = rota.entrada(rota.ordem[i]), rota.saida(rota.ordem[fim - 1])
+    if inverter:
+        primeira, ultima = ultima, primeira
+    antes = rota.custo_lacuna(i) + rota.custo_lacuna(fim) + rota.custo_lacuna(lacuna)
+    # Sem quadra de um dos lados (início ou fim da rota), a retirada não cria ligação
+    fechamento = _distancia(rota.esquerda(i), rota.direita(fim))
+    insercao = _distancia(rota.esquerda(lacuna), primeira) + _distancia(ultima, rota.direita(lacuna))
+    return antes - fechamento - insercao
+
+
+def _tentar_or_opt(rota, quadra, vizinhos):
+    """
+    Procura um trecho de até TAMANHO_MAXIMO_OR quadras, começando ou
+    terminando na quadra, que encurte a rota se levado para outra lacuna
+
+    Retorna as quadras junto das lacunas alteradas, ou None.
+    """
+    n = len(rota.ordem)
+    posicao = rota.posicao[quadra]
+    for tamanho in range(1, TAMANHO_MAXIMO_OR + 1):
+        for i in {posicao, posicao - tamanho + 1}:
+            fim = i + tamanho
+            if i < 0 or fim > n:
+                continue
+            candidatas = {0, n}
+            for ponta_trecho in (rota.ponta_da_direita(i), rota.ponta_da_esquerda(fim)):
+                for ponta in vizinhos[ponta_trecho]:
+                    candidatas.add(rota.lacuna_da_ponta(ponta))
+            for lacuna in candidatas:
+                for inverter in (False, True):
+                    if _ganho_or(rota, i, tamanho, lacuna, inverter) > 1e-9:
+                        vizinhas = [rota.ordem[k] for k in (i - 1, fim, lacuna - 1, lacuna) if 0 <= k < n]
+                        trecho = rota.ordem[i:fim]
+                        rota.mover(i, tamanho, lacuna, inverter)
+                        return vizinhas + trecho
+    return None
+
+
+def _melhorar(rota, vizinhos, prazo):
+    """
+    Aplica 2-opt e Or-opt até nenhuma quadra melhorar a rota
+
+    Cada quadra é examinada uma vez; depois de uma melhoria, só as quadras
+    junto das ligações alteradas voltam para a fila.
+    """
+    fila = deque(rota.ordem)
+    na_fila = [True] * len(rota.ordem)
+    while fila:
+        if prazo and time.monotonic() > prazo:
+            break
+        quadra = fila.popleft()
+        na_fila[quadra] = False
+        alteradas = _tentar_2opt(rota, quadra, vizinhos) or _tentar_or_opt(rota, quadra, vizinhos)
+        for outra in alteradas or ():
+            if not na_fila[outra]:
+                na_fila[outra] = True
+                fila.append(outra)
+
+
+def _listas_de_vizinhos(extremos, quantidade):
+    """Para cada ponta, as pontas mais próximas de outras quadras"""
+    pontas = [p for entrada, saida in extremos for p in (entrada, saida)]
+    grade = GradePontos(pontas)
+    vizinhos = []
+    for indice, ponto in enumerate(pontas):
+        quadra = indice // 2
+        vizinhos.append(grade.mais_proximos(ponto, quantidade, lambda outro: outro // 2 == quadra))
+    return vizinhos
+
+
+def comprimento_rota(extremos, ordem, invertida):
+    """Soma das distâncias entre a saída de cada quadra e a entrada da seguinte"""
+    return _Rota(extremos, list(ordem), list(invertida)).comprimento()
+
+
+def planejar_rota(extremos, inicio=None, tempo_limite=None, vizinhos=VIZINHOS):
+    """
+    Calcula a sequência de leitura de um conjunto de quadras
+
+    Args:
+        extremos: Lista com (entrada, saída) de cada quadra, pontos (x, y)
+            do primeiro e do último lote na ordem da quadra
+        inicio: Ponto (x, y) de partida; padrão: canto noroeste das quadras
+        tempo_limite: Segundos para as melhorias (None: até não melhorar)
+        vizinhos: Pontas mais próximas consideradas em cada melhoria
+
+    Returns:
+        Dicionário com 'ordem' (índices das quadras na sequência),
+        'invertida' (por quadra, se é percorrida do último lote para o
+        primeiro), 'comprimento' e 'comprimento_inicial' (vizinho mais
+        próximo, antes das melhorias)
+
+    Exemplo:
+        planejar_rota([((0, 0), (0, 1)), ((5, 1), (5, 0)), ((1, 1), (1, 0))])
+        -> ordem [0, 2, 1], invertida [True, False, True], comprimento 5.0
+    """
+    extremos = [(tuple(entrada[:2]), tuple(saida[:2])) for entrada, saida in extremos]
+    if not extremos:
+        return {'ordem': [], 'invertida': [], 'comprimento': 0.0, 'comprimento_inicial': 0.0}
+    if inicio is None:
+        xs = [p[0] for par in extremos for p in par]
+        ys = [p[1] for par in extremos for p in par]
+        inicio = (min(xs), max(ys))
+
+    prazo = time.monotonic() + tempo_limite if tempo_limite else None
+    listas = _listas_de_vizinhos(extremos, vizinhos)
+    ordem, invertida = _vizinho_mais_proximo(extremos, tuple(inicio[:2]), listas)
+    rota = _Rota(extremos, ordem, invertida)
+    comprimento_inicial = rota.comprimento()
+
+    if len(extremos) > 1:
+        _melhorar(rota, listas, prazo)
+
+    return {'ordem': list(rota.ordem), 'invertida': list(rota.invertida),
+            'comprimento': rota.comprimento(), 'comprimento_inicial': comprimento_inicial}
@@ -0,0 +1,204 @@
+"""
+Rota de leitura dos hidrômetros por setor
+Arquivo: RotaLeitura.py
+
+Encadeia as quadras de um setor em uma única sequência de leitura: cada
+quadra é percorrida na ordem do perímetro (OrdemGeometrica.percorrer_quadras)
+e a ordem entre as quadras vem de Rota.planejar_rota, pelo primeiro e pelo
+último lote de cada uma. O resultado vai para a tabela rota_leitura, uma
+linha por lote com matrícula, com a posição da quadra na rota (ordem_quadra)
+e a posição do lote na leitura do setor (ordem_rota). O setor inteiro é
+regravado de uma vez, em uma única transação e um único INSERT.
+
+Configuração: o setor de cada quadra vem do campo CAMPO_SETOR da camada
+Quadra.
+"""
+
+from qgis.PyQt.QtCore import pyqtSignal
+from qgis.core import QgsFeatureRequest, QgsTask
+
+from .ConnectionPool import disponivel as pool_disponivel, obter_pool
+from .Consultas import array_inteiros, executar_preparado
+from .IndiceLotes import normalizar_quadra, valor_ou_none
+from .NovaOrdem import executar_sql, literal_sql
+from .Rota import planejar_rota
+
+
+TABELA_ROTA = 'comercial_umc.rota_leitura'
+CAMPO_SETOR = 'setor'
+
+# Primeira chave de pg_advisory_xact_lock(int, int) para as rotas; a segunda é hashtext(setor)
+CHAVE_TRAVA_ROTA = 20574
+
+SQL_CRIAR_TABELA = (
+    f'CREATE TABLE IF NOT EXISTS {TABELA_ROTA} ('
+    'setor text NOT NULL, ins_quadra integer NOT NULL, matricula bigint NOT NULL, '
+    'ordem_quadra integer NOT NULL, ordem_rota integer NOT NULL, PRIMARY KEY (setor, ordem_rota))')
+
+SQL_TRAVAR_SETOR = f'SELECT pg_advisory_xact_lock({CHAVE_TRAVA_ROTA}, hashtext({{setor}}))'
+SQL_EXCLUIR_SETOR = f'DELETE FROM {TABELA_ROTA} WHERE setor = {{setor}}'
+SQL_INSERIR_SETOR = (
+    f'INSERT INTO {TABELA_ROTA} (setor, ins_quadra, matricula, ordem_quadra, ordem_rota) '
+    'SELECT {setor}, * FROM unnest({quadras}, {matriculas}, {ordens_quadra}, {ordens_rota})')
+
+TIPOS_INSERIR = ['text', 'integer[]', 'bigint[]', 'integer[]', 'integer[]']
+
+
+def ler_setores(camada_quadras, quadras=None, campo_setor=CAMPO_SETOR):
+    """
+    Agrupa as quadras por setor
+
+    Args:
+        camada_quadras: Camada Quadra (com ins_quadra e o campo do setor)
+        quadras: Se informadas, só estas quadras entram nos setores
+
+    Returns:
+        {setor (texto): [ins_quadra]}
+    """
+    if campo_setor not in camada_quadras.fields().names():
+        raise Exception(f"Campo '{campo_setor}' não encontrado na camada Quadra")
+    filtro = None if quadras is None else {normalizar_quadra(q) for q in quadras}
+    request = QgsFeatureRequest()
+    request.setFlags(QgsFeatureRequest.NoGeometry)
+    request.setSubsetOfAttributes(['ins_quadra', campo_setor], camada_quadras.fields())
+
+    setores = {}
+    for f in camada_quadras.getFeatures(request):
+        ins_quadra = normalizar_quadra(f['ins_quadra'])
+        setor = valor_ou_none(f[campo_setor])
+        if not isinstance(ins_quadra, int) or ins_quadra == 99 or setor is None:
+            continue
+        if filtro is None or ins_quadra in filtro:
+            setores.setdefault(str(setor), []).append(ins_quadra)
+    return {setor: sorted(set(quadras_setor)) for setor, quadras_setor in setores.items()}
+
+
+def _matricula(valor):
+    try:
+        return int(valor)
+    except (TypeError, ValueError):
+        raise ValueError(f"Matrícula não numérica: {valor!r}")
+
+
+def calcular_rota_setor(percursos, inicio=None, tempo_limite=None):
+    """
+    Sequência de leitura das quadras de um setor
+
+    Args:
+        percursos: {ins_quadra: lotes na ordem do percurso}, como em
+            OrdemGeometrica.percorrer_quadras
+        inicio: Ponto (x, y) de partida (padrão: canto noroeste do setor)
+        tempo_limite: Segundos para as melhorias da rota
+
+    Returns:
+        Dicionário com 'linhas' (uma por lote com matrícula, com
+        'ins_quadra', 'matricula', 'ordem_quadra' e 'ordem_rota'),
+        'quadras', 'comprimento' e 'comprimento_inicial'
+    """
+    quadras = [q for q in sorted(percursos) if percursos[q]]
+    extremos = [(percursos[q][0]['ponto'], percursos[q][-1]['ponto']) for q in quadras]
+    rota = planejar_rota(extremos, inicio, tempo_limite)
+
+    linhas = []
+    for ordem_quadra, indice in enumerate(rota['ordem'], 1):
+        lotes = percursos[quadras[indice]]
+        if rota['invertida'][indice]:
+            lotes = lotes[::-1]
+        for lote in lotes:
+            if lote['matricula'] is None or lote['matricula'] == '':
+                continue
+            linhas.append({'ins_quadra': quadras[indice], 'matricula': _matricula(lote['matricula']),
+                           'ordem_quadra': ordem_quadra, 'ordem_rota': len(linhas) + 1})
+    return {'linhas': linhas, 'quadras': len(quadras), 'comprimento': rota['comprimento'],
+            'comprimento_inicial': rota['comprimento_inicial']}
+
+
+def _colunas(linhas):
+    return ([l['ins_quadra'] for l in linhas], [l['matricula'] for l in linhas],
+            [l['ordem_quadra'] for l in linhas], [l['ordem_rota'] for l in linhas])
+
+
+def sql_gravar_rota(setor, linhas):
+    """Script da gravação do setor para a API de conexões do QGIS (sem parâmetros)"""
+    quadras, matriculas, ordens_quadra, ordens_rota = _colunas(linhas)
+    marcadores = {
+        'setor': literal_sql(str(setor)),
+        'quadras': array_inteiros(quadras),
+        'matriculas': 'ARRAY[' + ', '.join(str(int(m)) for m in matriculas) + ']::bigint[]',
+        'ordens_quadra': 'ARRAY[' + ', '.join(str(int(o)) for o in ordens_quadra) + ']::integer[]',
+        'ordens_rota': 'ARRAY[' + ', '.join(str(int(o)) for o in ordens_rota) + ']::integer[]',
+    }
+    return ';\n'.join([SQL_CRIAR_TABELA,
+                       SQL_TRAVAR_SETOR.format(**marcadores),
+                       SQL_EXCLUIR_SETOR.format(**marcadores),
+                       SQL_INSERIR_SETOR.format(**marcadores)]) + ';'
+
+
+def gravar_rota(conexao, setor, linhas):
+    """
+    Substitui a rota do setor em rota_leitura, em uma única transação
+
+    O setor fica travado (pg_advisory_xact_lock) até o fim da transação,
+    para que duas gravações do mesmo setor não se misturem.
+
+    Returns:
+        Número de linhas gravadas
+    """
+    setor = str(setor)
+    if pool_disponivel():
+        sql_inserir = SQL_INSERIR_SETOR.format(setor='$1', quadras='$2', matriculas='$3',
+                                               ordens_quadra='$4', ordens_rota='$5')
+
+        def _gravar(cur):
+            cur.execute(SQL_CRIAR_TABELA)
+            cur.execute(SQL_TRAVAR_SETOR.format(setor='%s'), [setor])
+            cur.execute(SQL_EXCLUIR_SETOR.format(setor='%s'), [setor])
+            executar_preparado(cur, sql_inserir, [setor, *_colunas(linhas)], TIPOS_INSERIR)
+        obter_pool(conexao).executar_transacao(_gravar)
+    else:
+        executar_sql(conexao, sql_gravar_rota(setor, linhas))
+    return len(linhas)
+
+
+class TarefaRota(QgsTask):
+    """
+    Calcula e grava em segundo plano a rota de leitura de cada setor
+
+    Os percursos das quadras são lidos na thread principal; a tarefa faz a
+    sequência entre as quadras e a gravação, um setor por transação. Emite
+    concluida(resultado) com 'success', 'message' e 'relatorio' (um item
+    por setor).
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, conexao, percursos_por_setor, tempo_limite=None):
+        super().__init__("Rota de leitura dos setores", QgsTask.CanCancel)
+        self.conexao = conexao
+        self.percursos_por_setor = percursos_por_setor
+        self.tempo_limite = tempo_limite
+        self.resultado = None
+
+    def run(self):
+        relatorio = []
+        try:
+            for indice, setor in enumerate(sorted(self.percursos_por_setor), 1):
+                if self.isCanceled():
+                    return False
+                rota = calcular_rota_setor(self.percursos_por_setor[setor], tempo_limite=self.tempo_limite)
+                gravadas = gravar_rota(self.conexao, setor, rota['linhas'])
+                relatorio.append({'setor': setor, 'quadras': rota['quadras'], 'lotes': gravadas,
+                                  'comprimento': round(rota['comprimento'], 1),
+                                  'comprimento_inicial': round(rota['comprimento_inicial'], 1)})
+                self.setProgress(100 * indice / len(self.percursos_por_setor))
+            self.resultado = {'success': True,
+                              'message': f'Rota de leitura gravada para {len(relatorio)} setor(es)',
+                              'relatorio': relatorio}
+            return True
+        except Exception as e:
+            self.resultado = {'success': False, 'message': f"Erro: {e}", 'relatorio': relatorio}
+            return False
+
+    def finished(self, resultado):
+        self.concluida.emit(self.resultado or {'success': False, 'message': 'Rota de leitura cancelada',
+                                               'relatorio': []})
@@ -0,0 +1,152 @@
+"""
+Ordem dos lotes definida por cliques no mapa
+Arquivo: SequenciaClique.py
+
+O operador clica nos lotes da quadra na ordem desejada e cada clique recebe
+o próximo n_ordem. O lote clicado é achado em um índice espacial dos lotes
+da quadra, montado uma vez ao ativar a ferramenta, em vez de uma consulta
+ao provedor por clique: cada clique custa só os poucos lotes que o índice
+aponta. Nada é gravado durante os cliques; a sequência é gravada de uma vez
+ao concluir (ver Ordenacao.ordem_pela_sequencia).
+
+Botão esquerdo: próximo lote. Botão direito ou Backspace: desfaz o último.
+Enter: conclui. Esc: cancela.
+"""
+
+from qgis.PyQt.QtCore import Qt, pyqtSignal
+from qgis.core import QgsFeature, QgsGeometry, QgsPointXY, QgsRectangle, QgsSpatialIndex
+from qgis.gui import QgsMapTool
+
+
+class IndiceCliqueLotes:
+    """Índice espacial dos lotes de uma quadra, por posição na lista de lotes"""
+
+    def __init__(self, lotes):
+        self._indice = QgsSpatialIndex()
+        self._geometrias = {}
+        self._motores = {}
+        for posicao, lote in enumerate(lotes):
+            geometria = lote.get('geometria')
+            if geometria is None or geometria.isEmpty():
+                continue
+            feature = QgsFeature(posicao)
+            feature.setGeometry(geometria)
+            self._indice.addFeature(feature)
+            self._geometrias[posicao] = geometria
+
+    def __len__(self):
+        return len(self._geometrias)
+
+    def _motor(self, posicao):
+        # Preparado só para os lotes que o índice aponta em algum clique
+        motor = self._motores.get(posicao)
+        if motor is None:
+            motor = QgsGeometry.createGeometryEngine(self._geometrias[posicao].constGet())
+            motor.prepareGeometry()
+            self._motores[posicao] = motor
+        return motor
+
+    def lote_no_ponto(self, ponto, tolerancia=0):
+        """
+        Posição do lote que contém o ponto, ou do mais próximo dentro da tolerância
+
+        Args:
+            ponto: QgsPointXY no SRC da camada de lotes
+            tolerancia: Distância máxima, em unidades da camada, para um
+                clique fora de todos os lotes (ex.: sobre a divisa)
+
+        Returns:
+            Posição do lote, ou None se nenhum estiver perto
+        """
+        x, y = ponto.x(), ponto.y()
+        candidatos = self._indice.intersects(QgsRectangle(x - tolerancia, y - tolerancia,
+                                                          x + tolerancia, y + tolerancia))
+        if not candidatos:
+            return None
+        geometria_ponto = QgsGeometry.fromPointXY(QgsPointXY(x, y))
+        for posicao in candidatos:
+            if self._motor(posicao).contains(geometria_ponto.constGet()):
+                return posicao
+
+        distancias = [(self._geometrias[p].distance(geometria_ponto), p) for p in candidatos]
+        distancia, posicao = min(distancias)
+        return posicao if distancia <= tolerancia else None
+
+
+class FerramentaSequencia(QgsMapTool):
+    """
+    Ferramenta de mapa que monta a sequência dos lotes clicados
+
+    Emite alterada(posicao, n_ordem) a cada lote incluído (n_ordem = None
+    quando o lote é retirado), concluida(sequencia) com as posições dos
+    lotes na ordem clicada e cancelada() no Esc ou quando outra ferramenta
+    assume o mapa antes da conclusão. A sequência é concluída sozinha quando
+    todos os lotes da quadra já foram clicados.
+    """
+
+    alterada = pyqtSignal(int, object)
+    concluida = pyqtSignal(list)
+    cancelada = pyqtSignal()
+
+    def __init__(self, canvas, camada_lotes, lotes):
+        super().__init__(canvas)
+        self.camada_lotes = camada_lotes
+        self.indice = IndiceCliqueLotes(lotes)
+        self.sequencia = []
+        self._clicados = set()
+        self._encerrada = False
+        self.setCursor(Qt.CrossCursor)
+
+    def _tolerancia(self, ponto_mapa):
+        raio = QgsMapTool.searchRadiusMU(self.canvas())
+        area = QgsRectangle(ponto_mapa.x() - raio, ponto_mapa.y() - raio,
+                            ponto_mapa.x() + raio, ponto_mapa.y() + raio)
+        return self.toLayerCoordinates(self.camada_lotes, area).width() / 2
+
+    def canvasReleaseEvent(self, evento):
+        if evento.button() == Qt.RightButton:
+            self.desfazer()
+            return
+        if evento.button() != Qt.LeftButton:
+            return
+        ponto_mapa = evento.mapPoint()
+        ponto = self.toLayerCoordinates(self.camada_lotes, ponto_mapa)
+        posicao = self.indice.lote_no_ponto(ponto, self._tolerancia(ponto_mapa))
+        if posicao is None or posicao in self._clicados:
+            return
+        self.sequencia.append(posicao)
+        self._clicados.add(posicao)
+        self.alterada.emit(posicao, len(self.sequencia))
+        if len(self._clicados) == len(self.indice):
+            self.concluir()
+
+    def keyPressEvent(self, evento):
+        if evento.key() in (Qt.Key_Return, Qt.Key_Enter):
+            self.concluir()
+        elif evento.key() == Qt.Key_Backspace:
+            self.desfazer()
+        elif evento.key() == Qt.Key_Escape:
+            self.cancelar()
+        else:
+            evento.ignore()
+
+    def desfazer(self):
+        """Retira o último lote da sequência"""
+        if self.sequencia and not self._encerrada:
+            posicao = self.sequencia.pop()
+            self._clicados.discard(posicao)
+            self.alterada.emit(posicao, None)
+
+    def concluir(self):
+        if not self._encerrada:
+            self._encerrada = True
+            self.concluida.emit(list(self.sequencia))
+
+    def cancelar(self):
+        if not self._encerrada:
+            self._encerrada = True
+            self.cancelada.emit()
+
+    def deactivate(self):
+        super().deactivate()
+        self.cancelar()
@@ -0,0 +1,212 @@
+"""
+Gravação da novaordem em segundo plano
+Arquivo: Tarefas.py
+
+As linhas de cada operação são lidas da camada de lotes na thread principal
+e gravadas por uma QgsTask, mantendo o QGIS e o diálogo responsivos. As
+tarefas passam por uma fila que as executa uma de cada vez, na ordem em que
+foram pedidas, para que duas operações sobre a mesma quadra não se cruzem.
+"""
+
+from qgis.PyQt.QtCore import QObject, pyqtSignal
+from qgis.core import QgsApplication, QgsMessageLog, QgsTask, Qgis
+
+from .ConnectionPool import consulta_cancelada
+from .Medicao import MEDICAO_NULA
+from .NovaOrdem import descrever_contagem, substituir_quadras
+from .OrdemServidor import reordenar_no_servidor
+
+
+class TarefaCancelada(Exception):
+    """Interrompe a gravação quando o usuário cancela a tarefa"""
+
+
+class _LinhasMonitoradas:
+    """
+    Linhas entregues à gravação, informando o progresso
+
+    Pode ser percorrida mais de uma vez, já que a transação é repetida se
+    a conexão cair. Com a tarefa cancelada levanta TarefaCancelada: terminar
+    o fluxo em silêncio entregaria só parte das linhas, e a gravação
+    apagaria as que faltaram. A exceção não chega dentro do COPY:
+    copiar_linhas separa as linhas em lotes antes de cada copy_expert.
+    """
+
+    def __init__(self, tarefa, linhas):
+        self._tarefa = tarefa
+        self._linhas = linhas
+
+    def __len__(self):
+        return len(self._linhas)
+
+    def __iter__(self):
+        total = max(len(self._linhas), 1)
+        for indice, linha in enumerate(self._linhas, 1):
+            if self._tarefa.isCanceled():
+                raise TarefaCancelada()
+            if indice % 200 == 0:
+                self._tarefa.setProgress(10 + 80 * indice / total)
+            yield linha
+
+
+class TarefaNovaOrdem(QgsTask):
+    """
+    Grava as linhas de novaordem de uma ou mais quadras
+
+    Emite concluida(resultado) na thread principal, com 'success', 'message',
+    'quadras', 'alteracoes' (linhas atualizadas, inseridas e excluídas) e
+    'cancelada'. O cancelamento desfaz a transação em andamento. A medição
+    da operação, se houver, é finalizada junto com a tarefa. Com versoes, a
+    gravação falha sem alterar nada se outra sessão gravou as quadras depois
+    da pré-visualização (ver NovaOrdem.ConflitoVersao).
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, descricao, conexao, quadras, linhas, incremental=True,
+                 mensagem_sucesso='Nova ordem atualizada com sucesso!', medicao=MEDICAO_NULA,
+                 reaplicar=False, versoes=None):
+        super().__init__(descricao, QgsTask.CanCancel)
+        self.conexao = conexao
+        self.quadras = list(quadras)
+        self.linhas = list(linhas)
+        self.incremental = incremental
+        self.mensagem_sucesso = mensagem_sucesso
+        self.medicao = medicao
+        self.reaplicar = reaplicar
+        self.versoes = versoes
+        self.erro = None
+        self.contagem = None
+
+    def verificar_cancelamento(self):
+        """Levanta TarefaCancelada se o usuário cancelou a tarefa"""
+        if self.isCanceled():
+            raise TarefaCancelada()
+
+    def run(self):
+        try:
+            self.setProgress(5)
+            if self.isCanceled():
+                return False
+            with self.medicao.etapa('gravar', linhas=len(self.linhas)):
+                self.contagem = substituir_quadras(self.conexao, self.quadras,
+                                                   _LinhasMonitoradas(self, self.linhas), self.incremental,
+                                                   medicao=self.medicao, reaplicar=self.reaplicar,
+                                                   versoes=self.versoes,
+                                                   verificar_cancelamento=self.verificar_cancelamento)
+            self.setProgress(100)
+            return True
+        except TarefaCancelada:
+            return False
+        except Exception as e:
+            # Cancelamento que chegou ao servidor no meio de um comando
+            if self.isCanceled() or consulta_cancelada(e):
+                return False
+            self.erro = e
+            return False
+
+    def finished(self, resultado):
+        if resultado:
+            mensagem = self.mensagem_sucesso
+            if self.contagem:
+                mensagem += f"\n{descrever_contagem(self.contagem)}"
+        elif self.erro is not None:
+            mensagem = f"Erro: {self.erro}"
+            QgsMessageLog.logMessage(
+                f"Erro na tarefa '{self.description()}': {self.erro}", 'OrganizadorDeLotes', Qgis.Critical)
+        else:
+            mensagem = 'Operação cancelada.'
+
+        cancelada = not resultado and self.erro is None
+        self.medicao.finalizar(bool(resultado), cancelada=cancelada, alteracoes=self.contagem)
+        self.concluida.emit({
+            'success': bool(resultado),
+            'message': mensagem,
+            'quadras': self.quadras,
+            'alteracoes': self.contagem,
+            'cancelada': cancelada
+        })
+
+
+class TarefaOrdemServidor(TarefaNovaOrdem):
+    """
+    Reorganiza ou restaura as quadras com um único comando no servidor
+
+    Mesmo resultado e sinal de TarefaNovaOrdem, mas as linhas são
+    calculadas no banco (ver OrdemServidor.py). As versões vistas na
+    pré-visualização são conferidas da mesma forma.
+    """
+
+    def __init__(self, descricao, conexao, origem, quadras_e_ordens, incremental=True,
+                 mensagem_sucesso='Nova ordem atualizada com sucesso!', medicao=MEDICAO_NULA, versoes=None):
+        super().__init__(descricao, conexao, [q for q, _ in quadras_e_ordens], [], incremental,
+                         mensagem_sucesso, medicao, versoes=versoes)
+        self.origem = origem
+        self.quadras_e_ordens = list(quadras_e_ordens)
+
+    def run(self):
+        try:
+            self.setProgress(5)
+            if self.isCanceled():
+                return False
+            with self.medicao.etapa('reordenar_servidor', quadras=len(self.quadras)):
+                self.contagem = reordenar_no_servidor(self.conexao, self.origem, self.quadras_e_ordens,
+                                                      self.incremental, versoes=self.versoes)
+            self.setProgress(100)
+            return True
+        except Exception as e:
+            if self.isCanceled() or consulta_cancelada(e):
+                return False
+            self.erro = e
+            return False
+
+
+class FilaTarefas(QObject):
+    """
+    Executa as tarefas no gerenciador de tarefas do QGIS, uma de cada vez
+
+    Sinais:
+        alterada(pendentes): número de tarefas na fila, incluindo a atual
+        progresso(descricao, percentual): progresso da tarefa atual
+    """
+
+    alterada = pyqtSignal(int)
+    progresso = pyqtSignal(str, float)
+
+    def __init__(self, parent=None):
+        super().__init__(parent)
+        self._pendentes = []
+        # Mantém a referência Python da tarefa enquanto ela executa
+        self._atual = None
+
+    def pendentes(self):
+        return len(self._pendentes) + (1 if self._atual else 0)
+
+    def adicionar(self, tarefa):
+        """Coloca a tarefa na fila e a inicia se nenhuma estiver em execução"""
+        self._pendentes.append(tarefa)
+        self._iniciar_proxima()
+        self.alterada.emit(self.pendentes())
+        return tarefa
+
+    def cancelar_todas(self):
+        """Descarta as tarefas pendentes e cancela a que está em execução"""
+        self._pendentes = []
+        if self._atual:
+            self._atual.cancel()
+        self.alterada.emit(self.pendentes())
+
+    def _iniciar_proxima(self):
+        if self._atual or not self._pendentes:
+            return
+        tarefa = self._pendentes.pop(0)
+        self._atual = tarefa
+        tarefa.progressChanged.connect(
+            lambda valor, t=tarefa: self.progresso.emit(t.description(), valor))
+        tarefa.concluida.connect(self._ao_concluir)
+        QgsApplication.taskManager().addTask(tarefa)
+
+    def _ao_concluir(self, resultado):
+        self._atual = None
+        self._iniciar_proxima()
+        self.alterada.emit(self.pendentes())
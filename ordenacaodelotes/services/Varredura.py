@@ -0,0 +1,154 @@
+"""
+Verificação da ordenação de todas as quadras
+Arquivo: Varredura.py
+
+Confere todas as quadras de uma vez: os lotes vêm de uma leitura da camada
+(com o nv_ordem atual) e a novaordem, de uma única consulta. Cada quadra é
+diagnosticada por Ordenacao.diagnosticar_quadra (ordens repetidas, nulas,
+com lacunas ou fora da faixa, lotes sem matrícula, quadras reorganizadas
+só em parte). As quadras com problema vão para um CSV e para uma camada de
+relatório com a geometria da quadra.
+"""
+
+import csv
+
+from qgis.PyQt.QtCore import QVariant, pyqtSignal
+from qgis.core import QgsFeature, QgsField, QgsTask, QgsVectorLayer, QgsWkbTypes
+
+from .NovaOrdem import linhas_gravadas_por_quadra
+from .OrdemGeometrica import ler_quadras
+from .Ordenacao import diagnosticar_quadra
+
+
+NOME_CAMADA = 'Verificação da ordenação'
+
+# Colunas do CSV e da camada de relatório
+CAMPOS_RELATORIO = (
+    ('ins_quadra', QVariant.Int), ('lotes', QVariant.Int), ('sem_matricula', QVariant.Int),
+    ('problemas', QVariant.String),
+    ('ordem_duplicadas', QVariant.String), ('ordem_nulas', QVariant.Int),
+    ('ordem_lacunas', QVariant.String), ('ordem_fora_da_faixa', QVariant.String),
+    ('nv_ordem_duplicadas', QVariant.String), ('nv_ordem_nulas', QVariant.Int),
+    ('nv_ordem_lacunas', QVariant.String), ('nv_ordem_fora_da_faixa', QVariant.String),
+    ('n_ordem_duplicadas', QVariant.String), ('n_ordem_nulas', QVariant.Int),
+    ('n_ordem_lacunas', QVariant.String), ('n_ordem_fora_da_faixa', QVariant.String),
+    ('faltantes', QVariant.String), ('excedentes', QVariant.String),
+)
+
+
+def _texto(valores):
+    return ' '.join(str(v) for v in valores)
+
+
+def varrer_quadras(lotes_por_quadra, gravadas_por_quadra=None, cancelada=None):
+    """
+    Diagnostica as quadras e retorna só as que têm problema
+
+    Args:
+        lotes_por_quadra: {ins_quadra: [{'matricula', 'ordem', 'nv_ordem'}]}
+        gravadas_por_quadra: Resultado de linhas_gravadas_por_quadra, ou
+            None para não conferir a novaordem
+        cancelada: Função sem argumentos que interrompe a varredura se True
+
+    Returns:
+        Lista de linhas de relatório (ver CAMPOS_RELATORIO), por quadra
+    """
+    relatorio = []
+    for ins_quadra in sorted(lotes_por_quadra):
+        if cancelada and cancelada():
+            break
+        armazenadas = None if gravadas_por_quadra is None else gravadas_por_quadra.get(ins_quadra, [])
+        diagnostico = diagnosticar_quadra(lotes_por_quadra[ins_quadra], armazenadas)
+        if diagnostico['problemas']:
+            relatorio.append(linha_relatorio(ins_quadra, diagnostico))
+    return relatorio
+
+
+def linha_relatorio(ins_quadra, diagnostico):
+    """Achata o diagnóstico de uma quadra nas colunas de CAMPOS_RELATORIO"""
+    linha = {'ins_quadra': int(ins_quadra), 'lotes': diagnostico['lotes'],
+             'sem_matricula': diagnostico['sem_matricula'], 'problemas': _texto(diagnostico['problemas']),
+             'faltantes': _texto(diagnostico['faltantes']), 'excedentes': _texto(diagnostico['excedentes'])}
+    for campo in ('ordem', 'nv_ordem', 'n_ordem'):
+        analise = diagnostico[campo] or {'nulas': None, 'duplicadas': [], 'lacunas': [], 'fora_da_faixa': []}
+        linha[f'{campo}_duplicadas'] = _texto(analise['duplicadas'])
+        linha[f'{campo}_nulas'] = analise['nulas']
+        linha[f'{campo}_lacunas'] = _texto(analise['lacunas'])
+        linha[f'{campo}_fora_da_faixa'] = _texto(analise['fora_da_faixa'])
+    return linha
+
+
+def gravar_csv(relatorio, caminho):
+    """Grava o relatório em CSV (UTF-8, separado por vírgula)"""
+    with open(caminho, 'w', encoding='utf-8', newline='') as arquivo:
+        escritor = csv.DictWriter(arquivo, fieldnames=[nome for nome, _ in CAMPOS_RELATORIO])
+        escritor.writeheader()
+        escritor.writerows(relatorio)
+
+
+def criar_camada_relatorio(relatorio, camada_quadras=None):
+    """
+    Camada em memória com as quadras com problema
+
+    Com a camada de quadras, cada linha leva o polígono da quadra; sem ela,
+    a camada é só uma tabela.
+    """
+    geometrias = {}
+    if camada_quadras is not None and relatorio:
+        geometrias = ler_quadras(camada_quadras, [linha['ins_quadra'] for linha in relatorio])
+        tipo = f"{QgsWkbTypes.displayString(camada_quadras.wkbType())}?crs={camada_quadras.crs().authid()}"
+    else:
+        tipo = "None"
+
+    camada = QgsVectorLayer(tipo, NOME_CAMADA, "memory")
+    camada.dataProvider().addAttributes([QgsField(nome, tipo_campo) for nome, tipo_campo in CAMPOS_RELATORIO])
+    camada.updateFields()
+
+    features = []
+    for linha in relatorio:
+        feature = QgsFeature(camada.fields())
+        feature.setAttributes([linha[nome] for nome, _ in CAMPOS_RELATORIO])
+        if linha['ins_quadra'] in geometrias:
+            feature.setGeometry(geometrias[linha['ins_quadra']])
+        features.append(feature)
+    camada.dataProvider().addFeatures(features)
+    camada.updateExtents()
+    return camada
+
+
+class TarefaVarredura(QgsTask):
+    """
+    Diagnostica as quadras em segundo plano
+
+    Os lotes são copiados do índice na thread principal; a tarefa faz a
+    consulta da novaordem (se houver conexão) e o diagnóstico. Emite
+    concluida(resultado) com 'success', 'message', 'relatorio' e 'quadras'.
+    """
+
+    concluida = pyqtSignal(dict)
+
+    def __init__(self, conexao, lotes_por_quadra):
+        super().__init__("Verificação da ordenação das quadras", QgsTask.CanCancel)
+        self.conexao = conexao
+        self.lotes_por_quadra = lotes_por_quadra
+        self.resultado = None
+
+    def run(self):
+        try:
+            gravadas = linhas_gravadas_por_quadra(self.conexao) if self.conexao else None
+            self.setProgress(30)
+            relatorio = varrer_quadras(self.lotes_por_quadra, gravadas, self.isCanceled)
+            if self.isCanceled():
+                return False
+            self.resultado = {'success': True,
+                              'message': f'{len(relatorio)} de {len(self.lotes_por_quadra)} quadra(s) com problema',
+                              'relatorio': relatorio, 'quadras': len(self.lotes_por_quadra)}
+            return True
+        except Exception as e:
+            self.resultado = {'success': False, 'message': f"Erro: {e}", 'relatorio': [],
+                              'quadras': len(self.lotes_por_quadra)}
+            return False
+
+    def finished(self, resultado):
+        self.concluida.emit(self.resultado or {'success': False, 'message': 'Verificação cancelada',
+                                               'relatorio': [], 'quadras': len(self.lotes_por_quadra)})
@@ -0,0 +1,31 @@
+"""
+Versão das linhas gravadas de uma quadra
+Arquivo: Versoes.py
+
+Funções puras, sem dependência do QGIS. A versão de uma quadra é a
+quantidade e o md5 das linhas "matricula:n_ordem" em ordem de bytes, a
+mesma calculada no servidor por NovaOrdem.SQL_VERSOES; quem grava a partir
+de uma pré-visualização ou da fila offline a compara com a do servidor.
+"""
+
+import hashlib
+
+
+VERSAO_VAZIA = '0:'
+
+
+def versao_linhas(gravadas):
+    """Versão das linhas (matricula, ins_quadra, n_ordem) de uma quadra, igual à calculada por SQL_VERSOES"""
+    if not gravadas:
+        return VERSAO_VAZIA
+    linhas = sorted(f"{'' if m is None else m}:{'' if n is None else n}" for m, _, n in gravadas)
+    return f"{len(linhas)}:{hashlib.md5(','.join(linhas).encode('utf-8')).hexdigest()}"
+
+
+def versoes_das_linhas(gravadas, quadras):
+    """{ins_quadra: versão} das quadras, a partir das linhas gravadas lidas na pré-visualização"""
+    por_quadra = {int(q): [] for q in quadras}
+    for linha in gravadas:
+        if linha[1] is not None and int(linha[1]) in por_quadra:
+            por_quadra[int(linha[1])].append(linha)
+    return {q: versao_linhas(linhas) for q, linhas in por_quadra.items()}
@@ -0,0 +1,55 @@
+"""Testes do diagnóstico de uma quadra usado na varredura (Ordenacao.diagnosticar_quadra)"""
+
+from ordenacaodelotes.services.Ordenacao import diagnosticar_quadra
+
+
+def _lote(matricula, ordem, nv_ordem=None):
+    return {'matricula': matricula, 'ordem': ordem, 'nv_ordem': nv_ordem}
+
+
+def test_diagnostico_quadra_correta():
+    lotes = [_lote('A', 1, 2), _lote('B', 2, 1)]
+    armazenadas = [('A', 10, 2), ('B', 10, 1)]
+    assert diagnosticar_quadra(lotes, armazenadas)['problemas'] == []
+
+
+def test_diagnostico_quadra_vazia():
+    diagnostico = diagnosticar_quadra([])
+    assert diagnostico['lotes'] == 0
+    assert diagnostico['problemas'] == []
+
+
+def test_diagnostico_ordem_repetida_e_nula():
+    lotes = [_lote('A', 1), _lote('B', 1), _lote('C', None)]
+    diagnostico = diagnosticar_quadra(lotes)
+    assert diagnostico['ordem']['duplicadas'] == [1]
+    assert diagnostico['ordem']['nulas'] == 1
+    assert 'ordem_duplicada' in diagnostico['problemas']
+    assert 'ordem_nula' in diagnostico['problemas']
+    assert diagnostico['nv_ordem'] is None
+
+
+def test_diagnostico_lacuna_e_fora_da_faixa():
+    diagnostico = diagnosticar_quadra([_lote('A', 1), _lote('B', 3)])
+    assert diagnostico['ordem']['lacunas'] == [2]
+    assert diagnostico['ordem']['fora_da_faixa'] == [3]
+    assert {'ordem_lacuna', 'ordem_fora_da_faixa'} <= set(diagnostico['problemas'])
+
+
+def test_diagnostico_sem_matricula_e_parcial():
+    lotes = [_lote('A', 1, 1), _lote('B', 2, None), _lote('', 3)]
+    diagnostico = diagnosticar_quadra(lotes)
+    assert diagnostico['sem_matricula'] == 1
+    assert diagnostico['parcial']
+    assert {'sem_matricula', 'parcial'} <= set(diagnostico['problemas'])
+
+
+def test_diagnostico_confere_a_novaordem():
+    lotes = [_lote('A', 1, 1), _lote('B', 2, 2)]
+    armazenadas = [('A', 10, 1), ('X', 10, 1)]
+    diagnostico = diagnosticar_quadra(lotes, armazenadas)
+    assert diagnostico['faltantes'] == ['B']
+    assert diagnostico['excedentes'] == ['X']
+    assert diagnostico['n_ordem']['duplicadas'] == [1]
+    assert {'novaordem_faltantes', 'novaordem_excedentes', 'n_ordem_duplicada', 'parcial'} <= set(
+        diagnostico['problemas'])
@@ -0,0 +1,55 @@
+"""Testes dos instantâneos do diário (Instantaneo.py, não depende do QGIS)"""
+
+from ordenacaodelotes.services.Instantaneo import (
+    linhas_desfazer, linhas_restauracao, lotes_do_instantaneo, montar_instantaneo, restauravel)
+
+
+def test_instantaneo_junta_gravadas_e_lotes():
+    gravadas = [('A', 10, 2), ('B', 10, 1)]
+    lotes = [{'matricula': 'A', 'ordem': 1}, {'matricula': 'C', 'ordem': 3}]
+    instantaneo = montar_instantaneo(10, gravadas, lotes, 'Reorganizar quadra 10')
+    assert instantaneo['ins_quadra'] == 10
+    assert instantaneo['descricao'] == 'Reorganizar quadra 10'
+    assert sorted(instantaneo['linhas']) == [['A', 2, 1, True], ['B', 1, None, True], ['C', None, 3, False]]
+    assert instantaneo['sem_matricula'] == 0
+
+
+def test_instantaneo_quadra_vazia():
+    instantaneo = montar_instantaneo('7', [], [])
+    assert instantaneo == {'ins_quadra': 7, 'descricao': '', 'linhas': [], 'sem_matricula': 0}
+    assert not restauravel(instantaneo)
+
+
+def test_instantaneo_conta_linhas_e_lotes_sem_matricula():
+    instantaneo = montar_instantaneo(10, [(None, 10, 1)], [{'matricula': '', 'ordem': 2},
+                                                            {'matricula': 'A', 'ordem': 1}])
+    assert instantaneo['sem_matricula'] == 2
+    assert not restauravel(instantaneo)
+
+
+def test_desfazer_volta_so_as_linhas_gravadas():
+    instantaneo = montar_instantaneo(10, [('A', 10, 2)], [{'matricula': 'A', 'ordem': 1},
+                                                           {'matricula': 'C', 'ordem': 3}])
+    assert linhas_desfazer(instantaneo) == [{'matricula': 'A', 'ins_quadra': 10, 'n_ordem': 2}]
+
+
+def test_restauracao_usa_a_ordem_original_e_ignora_nulas():
+    lotes = [{'matricula': 'A', 'ordem': 1}, {'matricula': 'B', 'ordem': None}]
+    instantaneo = montar_instantaneo(10, [('A', 10, 2), ('B', 10, 1)], lotes)
+    assert restauravel(instantaneo)
+    assert linhas_restauracao(instantaneo) == [{'matricula': 'A', 'ins_quadra': 10, 'n_ordem': 1}]
+
+
+def test_lotes_do_instantaneo_dispensam_a_camada():
+    instantaneo = montar_instantaneo(10, [('A', 10, 2)], [{'matricula': 'A', 'ordem': 1},
+                                                           {'matricula': 'C', 'ordem': 3}])
+    assert sorted(lotes_do_instantaneo(instantaneo), key=lambda l: l['matricula']) == [
+        {'matricula': 'A', 'ordem': 1}, {'matricula': 'C', 'ordem': 3}]
+
+
+def test_instantaneo_so_com_gravadas_desfaz_mas_nao_restaura():
+    # Renumeração: o instantâneo não lê a camada de lotes
+    instantaneo = montar_instantaneo(10, [('A', 10, 4), ('B', 10, 7)], [])
+    assert linhas_desfazer(instantaneo) == [{'matricula': 'A', 'ins_quadra': 10, 'n_ordem': 4},
+                                            {'matricula': 'B', 'ins_quadra': 10, 'n_ordem': 7}]
+    assert not restauravel(instantaneo)
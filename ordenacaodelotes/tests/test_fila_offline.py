@@ -0,0 +1,55 @@
+"""Testes da compactação e da classificação da fila offline (ClassificacaoFila.py, não depende do QGIS)"""
+
+from ordenacaodelotes.services.ClassificacaoFila import classificar, compactar
+from ordenacaodelotes.services.Versoes import VERSAO_VAZIA, versao_linhas
+
+
+def _operacao(id_operacao, ins_quadra, linhas, versao_base=None):
+    return {'id': id_operacao, 'ins_quadra': ins_quadra, 'versao_base': versao_base,
+            'linhas': [{'matricula': m, 'ins_quadra': ins_quadra, 'n_ordem': n} for m, n in linhas]}
+
+
+def test_compactar_fica_com_a_ultima_operacao_e_a_primeira_versao():
+    operacoes = [
+        _operacao(1, 10, [('A', 1)], 'v1'),
+        _operacao(2, 20, [('X', 1)], 'w1'),
+        _operacao(3, 10, [('A', 2)], 'v2'),
+    ]
+    compactadas = compactar(operacoes)
+    assert sorted(compactadas) == [10, 20]
+    assert compactadas[10]['ids'] == [1, 3]
+    assert compactadas[10]['operacoes'] == 2
+    assert compactadas[10]['versao_base'] == 'v1'
+    assert compactadas[10]['linhas'][0]['n_ordem'] == 2
+    assert compactadas[20]['ids'] == [2]
+
+
+def test_compactar_fila_vazia():
+    assert compactar([]) == {}
+
+
+def test_classificar_separa_gravar_conflitos_e_iguais():
+    base_10 = versao_linhas([('A', 10, 1), ('B', 10, 2)])
+    compactadas = compactar([
+        # Servidor ainda na versão de partida
+        _operacao(1, 10, [('A', 2), ('B', 1)], base_10),
+        # Outra sessão gravou a quadra 20 depois
+        _operacao(2, 20, [('X', 1)], versao_linhas([('X', 20, 2)])),
+        # O servidor já tem as linhas da fila
+        _operacao(3, 30, [('Y', 1)], VERSAO_VAZIA),
+    ])
+    gravadas = [('A', 10, 1), ('B', 10, 2), ('X', 20, 3), ('Y', 30, 1), ('Z', 99, 1)]
+    resultado = classificar(compactadas, gravadas)
+    assert resultado['gravar'] == [10]
+    assert resultado['conflitos'] == [20]
+    assert resultado['iguais'] == [30]
+    assert resultado['versoes'][10] == base_10
+    assert set(resultado['versoes']) == {10, 20, 30}
+
+
+def test_classificar_sem_versao_conhecida_so_grava_quadra_vazia():
+    compactadas = compactar([_operacao(1, 10, [('A', 1)]), _operacao(2, 20, [('B', 1)])])
+    resultado = classificar(compactadas, [('C', 20, 1)])
+    assert resultado['gravar'] == [10]
+    assert resultado['conflitos'] == [20]
+    assert resultado['versoes'][10] == VERSAO_VAZIA
@@ -0,0 +1,29 @@
+"""Testes do filtro da camada usado no cálculo no servidor (Consultas.filtro_isolavel)"""
+
+import pytest
+
+from ordenacaodelotes.services.Consultas import filtro_isolavel
+
+
+@pytest.mark.parametrize('filtro', [
+    '"setor" = 12',
+    "bairro = 'Centro' OR bairro = 'Aldeota'",
+    "(setor IN (1, 2)) AND nome LIKE '%;%'",
+    "nome = 'D''Ávila (sul)'",
+    '"coluna ""estranha)""" IS NOT NULL',
+])
+def test_filtro_isolavel(filtro):
+    assert filtro_isolavel(filtro)
+
+
+@pytest.mark.parametrize('filtro', [
+    'setor = 1; DELETE FROM comercial_umc.novaordem',
+    'setor = 1) OR (1 = 1',
+    'setor = 1 -- comentário',
+    'setor = 1 /* comentário */',
+    '(setor = 1',
+    "nome = 'aberta",
+    "nome = E'\\'' ) OR (1 = 1 --'",
+])
+def test_filtro_que_escaparia_dos_parenteses(filtro):
+    assert not filtro_isolavel(filtro)
@@ -0,0 +1,96 @@
+"""Cancelamento da gravação pela API de conexões do QGIS (sem psycopg2)"""
+
+import pytest
+
+pytest.importorskip('qgis')
+
+from ordenacaodelotes.services import NovaOrdem  # noqa: E402
+from ordenacaodelotes.services.Tarefas import TarefaCancelada, _LinhasMonitoradas  # noqa: E402
+
+
+class _ConexaoQgis:
+    """Conexão falsa: responde às consultas e guarda os scripts de gravação"""
+
+    def __init__(self, tabela, ao_consultar=None):
+        self.tabela = list(tabela)
+        self.scripts = []
+        self._ao_consultar = ao_consultar or (lambda: None)
+
+    def executeSql(self, sql):
+        if sql.lstrip().upper().startswith('SELECT'):
+            self._ao_consultar()
+            return [list(linha) for linha in self.tabela]
+        self.scripts.append(sql)
+        return []
+
+
+class _Tarefa:
+    def __init__(self):
+        self.cancelada = False
+
+    def isCanceled(self):
+        return self.cancelada
+
+    def setProgress(self, progresso):
+        pass
+
+    def verificar_cancelamento(self):
+        if self.cancelada:
+            raise TarefaCancelada()
+
+
+@pytest.fixture
+def sem_pool(monkeypatch):
+    def usar(conexao_qgis):
+        monkeypatch.setattr(NovaOrdem, 'pool_disponivel', lambda: False)
+        monkeypatch.setattr(NovaOrdem, '_conexao_qgis', lambda conexao: conexao_qgis)
+    return usar
+
+
+def _linhas():
+    return [{'matricula': m, 'ins_quadra': 10, 'n_ordem': n} for n, m in enumerate('ABC', 1)]
+
+
+GRAVADAS = [('A', 10, 3), ('B', 10, 2), ('C', 10, 1)]
+
+
+def test_cancelada_durante_a_leitura_nao_grava_linhas_pela_metade(sem_pool):
+    conexao = _ConexaoQgis(GRAVADAS)
+    sem_pool(conexao)
+    tarefa = _Tarefa()
+
+    class _Cancelando(list):
+        def __iter__(self):
+            for indice, linha in enumerate(list.__iter__(self)):
+                tarefa.cancelada = indice == 1
+                yield linha
+
+    with pytest.raises(TarefaCancelada):
+        NovaOrdem.substituir_quadras('banco', [10], _LinhasMonitoradas(tarefa, _Cancelando(_linhas())),
+                                     incremental=True, verificar_cancelamento=tarefa.verificar_cancelamento)
+    assert conexao.scripts == []
+    assert conexao.tabela == GRAVADAS
+
+
+def test_cancelada_durante_a_comparacao_nao_executa_o_script(sem_pool):
+    tarefa = _Tarefa()
+    conexao = _ConexaoQgis(GRAVADAS, ao_consultar=lambda: setattr(tarefa, 'cancelada', True))
+    sem_pool(conexao)
+
+    with pytest.raises(TarefaCancelada):
+        NovaOrdem.substituir_quadras('banco', [10], _LinhasMonitoradas(tarefa, _linhas()),
+                                     incremental=True, verificar_cancelamento=tarefa.verificar_cancelamento)
+    assert conexao.scripts == []
+    assert conexao.tabela == GRAVADAS
+
+
+def test_sem_cancelamento_grava_todas_as_linhas(sem_pool):
+    conexao = _ConexaoQgis(GRAVADAS)
+    sem_pool(conexao)
+    tarefa = _Tarefa()
+
+    contagem = NovaOrdem.substituir_quadras('banco', [10], _LinhasMonitoradas(tarefa, _linhas()),
+                                            incremental=True, verificar_cancelamento=tarefa.verificar_cancelamento)
+    assert contagem == {'atualizadas': 2, 'inseridas': 0, 'excluidas': 0}
+    assert len(conexao.scripts) == 1
+    assert all(f"'{m}'" in conexao.scripts[0] for m in 'ABC')
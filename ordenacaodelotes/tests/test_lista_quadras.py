@@ -0,0 +1,44 @@
+"""Testes da lista de quadras do modo em lote (Ordenacao.interpretar_lista_quadras)"""
+
+import pytest
+
+from ordenacaodelotes.services.Ordenacao import interpretar_lista_quadras
+
+
+def test_lista_com_intervalos_e_ordens():
+    assert interpretar_lista_quadras("101-103:2; 110", 1) == [(101, 2), (102, 2), (103, 2), (110, 1)]
+
+
+def test_lista_vale_a_ultima_ocorrencia():
+    assert interpretar_lista_quadras("101:2, 102\n101:5") == [(102, 1), (101, 5)]
+
+
+def test_lista_vazia():
+    assert interpretar_lista_quadras('') == []
+    assert interpretar_lista_quadras(None) == []
+
+
+def test_lista_intervalo_invertido():
+    with pytest.raises(ValueError, match='Intervalo de quadras inválido'):
+        interpretar_lista_quadras('120-101')
+
+
+def test_lista_item_invalido():
+    with pytest.raises(ValueError, match='Item inválido'):
+        interpretar_lista_quadras('101;abc')
+
+
+def test_lista_intervalo_grande_demais_e_recusado_antes_de_expandir():
+    with pytest.raises(ValueError, match='grande demais'):
+        interpretar_lista_quadras('1-999999999')
+
+
+def test_lista_intervalo_no_limite():
+    assert len(interpretar_lista_quadras('1-10', maximo_intervalo=10)) == 10
+    with pytest.raises(ValueError):
+        interpretar_lista_quadras('1-11', maximo_intervalo=10)
+
+
+def test_lista_quadra_fora_do_tipo_integer():
+    with pytest.raises(ValueError, match='fora da faixa'):
+        interpretar_lista_quadras('2147483648')
@@ -0,0 +1,64 @@
+"""Testes do núcleo de ordenação de Ordenacao.py (não depende do QGIS)"""
+
+from ordenacaodelotes.services import Ordenacao
+from ordenacaodelotes.services.Ordenacao import calcular_nova_ordem, montar_linhas
+
+
+# calcular_nova_ordem
+
+def test_nova_ordem_gira_a_sequencia():
+    assert calcular_nova_ordem([1, 2, 3, 4, 5], 3) == [4, 5, 1, 2, 3]
+
+
+def test_nova_ordem_a_partir_do_primeiro_mantem_a_ordem():
+    assert calcular_nova_ordem([3, 1, 2], 1) == [3, 1, 2]
+
+
+def test_nova_ordem_mantem_os_nulos():
+    assert calcular_nova_ordem([1, None, 3, 2], 2) == [3, None, 2, 1]
+
+
+def test_nova_ordem_quadra_vazia():
+    assert calcular_nova_ordem([], 1) == []
+
+
+def test_nova_ordem_com_ordens_repetidas():
+    # As repetições continuam repetidas, na mesma posição relativa
+    assert calcular_nova_ordem([1, 2, 2, 3], 2) == [4, 1, 1, 2]
+
+
+def test_nova_ordem_igual_com_e_sem_numpy(monkeypatch):
+    ordens = [None if i % 17 == 0 else (i * 7) % 300 + 1 for i in range(Ordenacao.LIMITE_NUMPY * 2)]
+    com_numpy = calcular_nova_ordem(ordens, 120)
+    monkeypatch.setattr(Ordenacao, 'np', None)
+    assert calcular_nova_ordem(ordens, 120) == com_numpy
+
+
+def test_nova_ordem_aceita_iterador():
+    assert calcular_nova_ordem(iter([2, 1, 3]), 2) == [1, 3, 2]
+
+
+# montar_linhas
+
+def test_linhas_prontas_para_gravar():
+    lotes = [{'matricula': 'A', 'ordem': 1, 'nv_ordem': 9, 'geometria': 'g1'},
+             {'matricula': 'B', 'ordem': 2, 'nv_ordem': None, 'geometria': 'g2'}]
+    assert montar_linhas(10, lotes, 2) == [
+        {'matricula': 'A', 'geometria': 'g1', 'ins_quadra': 10, 'n_ordem': 2},
+        {'matricula': 'B', 'geometria': 'g2', 'ins_quadra': 10, 'n_ordem': 1},
+    ]
+
+
+def test_linhas_sem_ordem_primeira_restauram_a_original():
+    lotes = [{'matricula': 'A', 'ordem': 3}, {'matricula': 'B', 'ordem': None}]
+    assert [linha['n_ordem'] for linha in montar_linhas(10, lotes)] == [3, None]
+
+
+def test_linhas_quadra_vazia():
+    assert montar_linhas(10, [], 1) == []
+
+
+def test_linhas_nao_alteram_os_lotes():
+    lotes = [{'matricula': 'A', 'ordem': 1}, {'matricula': 'B', 'ordem': 2}]
+    montar_linhas(10, lotes, 2)
+    assert lotes == [{'matricula': 'A', 'ordem': 1}, {'matricula': 'B', 'ordem': 2}]
@@ -26,7 +26,7 @@ from qgis.PyQt.QtGui import QIcon
 from qgis.PyQt.QtWidgets import QAction, QMessageBox
 from qgis.core import (QgsProcessing, QgsProcessingMultiStepFeedback, 
                        QgsProviderRegistry, QgsCoordinateReferenceSystem, 
-                       QgsProject, QgsVectorLayer)
+                       QgsProject, QgsVectorLayer, QgsWkbTypes)
 from qgis.gui import QgsMapToolIdentifyFeature
 import processing
 
@@ -35,6 +35,8 @@ from .resources import *
 # Import the code for the dialog
 from .poligonizador_linha_corte_dialog import PoligonizadorDialog
 from.services.Notification import show_notification
+from .services.ConnectionPool import uri_da_conexao
+from .services.RegistroCamadas import RegistroCamadas
 import os.path
 
 
@@ -77,6 +79,7 @@ class PoligonizadorLinhaCorte:
         self.quadra_selecionada = None
         self.map_tool = None
         self.previous_map_tool = None
+        self.registro_camadas = None
 
     # Traduz textos do plugin para o idioma do usuário.
     def tr(self, message):
@@ -178,6 +181,9 @@ class PoligonizadorLinhaCorte:
             callback=self.run,
             parent=self.iface.mainWindow())
 
+        # Camadas Quadra, Lote e Linhas_corte resolvidas pelos sinais do projeto
+        self.registro_camadas = RegistroCamadas()
+
         # will be set False in run()
         self.first_start = True
 #Remove o plugin do QGIS quando descarregado.
@@ -193,6 +199,17 @@ class PoligonizadorLinhaCorte:
         if self.previous_map_tool:
             self.iface.mapCanvas().setMapTool(self.previous_map_tool)
 
+        if self.registro_camadas:
+            self.registro_camadas.desconectar()
+            self.registro_camadas = None
+
+#Retorna a camada de um papel ('quadra', 'v_lote', 'linhas_corte') pelo registro.
+    def camada(self, papel):
+        """Retorna a camada do papel informado ou None"""
+        if self.registro_camadas is None:
+            self.registro_camadas = RegistroCamadas()
+        return self.registro_camadas.camada(papel)
+
 #Preenche o dropdown com conexões PostgreSQL disponíveis.
     def popular_conexoes(self):
         """Popula o combobox com as conexões PostgreSQL disponíveis"""
@@ -215,14 +232,12 @@ class PoligonizadorLinhaCorte:
     def selecionar_quadra(self):
         """Ativa a ferramenta de seleção de quadra no mapa"""
         # Busca a camada Quadra
-        quadra_layers = QgsProject.instance().mapLayersByName('Quadra')
-        if not quadra_layers:
+        quadra_layer = self.camada('quadra')
+        if not quadra_layer:
             show_notification("Aviso", "Camada 'Quadra' não encontrada no projeto", "warning")
            
             return
         
-        quadra_layer = quadra_layers[0]
-        
         # Minimiza o diálogo para permitir seleção no mapa
         self.dlg.showMinimized()
         
@@ -247,12 +262,10 @@ class PoligonizadorLinhaCorte:
     def quadra_identificada(self, feature):
         """Callback chamado quando uma quadra é identificada/selecionada"""
         # Busca a camada Quadra
-        quadra_layers = QgsProject.instance().mapLayersByName('Quadra')
-        if not quadra_layers:
+        quadra_layer = self.camada('quadra')
+        if not quadra_layer:
             return
         
-        quadra_layer = quadra_layers[0]
-        
         # Adiciona a feição à seleção (ao invés de substituir)
         quadra_layer.select(feature.id())
         self.dlg.showNormal()
@@ -276,9 +289,9 @@ class PoligonizadorLinhaCorte:
      
     def limpar_selecao_quadras(self):
         """Limpa a seleção de quadras"""
-        quadra_layers = QgsProject.instance().mapLayersByName('Quadra')
-        if quadra_layers:
-            quadra_layers[0].removeSelection()
+        quadra_layer = self.camada('quadra')
+        if quadra_layer:
+            quadra_layer.removeSelection()
             
             # Atualiza interface
             if hasattr(self.dlg, 'lblQuadraSelecionada'):
@@ -304,9 +317,9 @@ class PoligonizadorLinhaCorte:
        
         
         # Mostra quantas quadras foram selecionadas
-        quadra_layers = QgsProject.instance().mapLayersByName('Quadra')
-        if quadra_layers:
-            num_selecionadas = quadra_layers[0].selectedFeatureCount()
+        quadra_layer = self.camada('quadra')
+        if quadra_layer:
+            num_selecionadas = quadra_layer.selectedFeatureCount()
             show_notification("Concluído", f"seleção finalizada, total de{num_selecionadas} quadra(s) selecionada(s) ", "success")
         self.dlg.close()
             
@@ -371,23 +384,11 @@ class PoligonizadorLinhaCorte:
                 show_notification("Atenção", f"Não foi possível encontrar uma conexão com banco de dado", "warning")
                 return
             
-            metadata = QgsProviderRegistry.instance().providerMetadata('postgres')
-            if not metadata:
-                return
-            
-            connections = metadata.connections()
-            if conexao_nome not in connections:
-                return
-            
-            conn = connections[conexao_nome]
-            config = conn.configuration()
-            
             # Busca camada existente ao invés de remover
-            existing_layers = QgsProject.instance().mapLayersByName("Lote")
+            layer = self.camada('v_lote')
             
-            if existing_layers:
+            if layer:
                 # Se a camada já existe, apenas recarrega
-                layer = existing_layers[0]
                 layer.reload()
                 self.iface.mapCanvas().refresh()
 
@@ -395,24 +396,15 @@ class PoligonizadorLinhaCorte:
                
             else:
                 # Se não existe, cria uma nova camada
-                # Constrói a URI correta
-                uri = f"dbname='{config['database']}' "
-                uri += f"host='{config['host']}' "
-                uri += f"port='{config['port']}' "
-                uri += f"user='{config['username']}' "
-                
-                if 'password' in config and config['password']:
-                    uri += f"password='{config['password']}' "
-                
-                uri += "sslmode=disable "
-                uri += "key='id' "
-                uri += "srid=31984 "
-                uri += "type=Polygon "
-                uri += "checkPrimaryKeyUnicity='1' "
-                uri += 'table="comercial_umc"."v_lote" (geom)'
+                # A URI parte da mesma conexão usada pelo pool compartilhado
+                uri = uri_da_conexao(conexao_nome)
+                uri.setDataSource('comercial_umc', 'v_lote', 'geom', '', 'id')
+                uri.setSrid('31984')
+                uri.setWkbType(QgsWkbTypes.Polygon)
+                uri.setParam('checkPrimaryKeyUnicity', '1')
                 
                 # Cria nova camada
-                layer = QgsVectorLayer(uri, "Lote", "postgres")
+                layer = QgsVectorLayer(uri.uri(False), "Lote", "postgres")
                 
                 if layer.isValid():
                     QgsProject.instance().addMapLayer(layer)
@@ -428,25 +420,79 @@ class PoligonizadorLinhaCorte:
             import traceback
             show_notification("Erro", f"Erro ao atualizar camada de lotes: {str(e)}\n{traceback.format_exc()}", "error")
     
+#Grava os lotes gerados na tabela v_lote com COPY sobre o pool de conexões.
+    def exportar_lotes_copy(self, conexao_nome, camada):
+        """Exporta os lotes para comercial_umc.v_lote com COPY"""
+        colunas = camada.fields().names()
+
+        def linhas():
+            for feature in camada.getFeatures():
+                yield feature.attributes() + [feature.geometry()]
+
+        def _gravar(cur):
+            return inserir_em_massa(
+                cur, 'comercial_umc.v_lote', colunas + ['geom'], linhas(),
+                colunas_geometria=['geom'], srid=31984)
+
+        return obter_pool(conexao_nome).executar_transacao(_gravar)
+
+#Grava os lotes gerados na tabela v_lote via ogr2ogr (sem psycopg2).
+    def exportar_lotes_ogr2ogr(self, conexao_nome, camada, feedback=None):
+        """Exporta os lotes para comercial_umc.v_lote com ogr2ogr"""
+        alg_params = {
+            'ADDFIELDS': False,
+            'APPEND': True,
+            'A_SRS': QgsCoordinateReferenceSystem('EPSG:31984'),
+            'CLIP': False,
+            'DATABASE': conexao_nome,
+            'DIM': 0,
+            'GEOCOLUMN': 'geom',
+            'GT': None,
+            'GTYPE': 3,
+            'INDEX': False,
+            'INPUT': camada,
+            'LAUNDER': False,
+            'OPTIONS': '',
+            'OVERWRITE': False,
+            'PK': '',
+            'PRECISION': True,
+            'PRIMARY_KEY': '',
+            'PROMOTETOMULTI': False,
+            'SCHEMA': 'comercial_umc',
+            'SEGMENTIZE': '',
+            'SHAPE_ENCODING': '',
+            'SIMPLIFY': '',
+            'SKIPFAILURES': False,
+            'SPAT': None,
+            'S_SRS': None,
+            'TABLE': 'v_lote',
+            'T_SRS': None,
+            'WHERE': ''
+        }
+        processing.run(
+            'gdal:importvectorintopostgisdatabaseavailableconnections',
+            alg_params,
+            feedback=feedback
+        )
+
 #Executa todo o processo de transformar quadras + linhas em lotes - PRINCIPAL
     def executar_poligonizacao(self, conexao_nome):
         """Executa o processo de poligonização"""
         try:
             # Verifica se há feições selecionadas na camada Quadra
-            quadra_layer = QgsProject.instance().mapLayersByName('Quadra')
+            quadra_layer = self.camada('quadra')
             if not quadra_layer:
                 show_notification("Erro", "Camada 'Quadra' não encontrada no projeto!", "error")
               
                 return False
             
-            quadra_layer = quadra_layer[0]
             if quadra_layer.selectedFeatureCount() == 0:
                 show_notification("warning", "Selecione ao menos uma feição na camada 'Quadra' antes de executar!", "warning")
               
                 return False
 
             # Verifica camada de linhas de corte
-            linhas_corte_layer = QgsProject.instance().mapLayersByName('Linhas_corte')
+            linhas_corte_layer = self.camada('linhas_corte')
             if not linhas_corte_layer:
 
                 show_notification("Erro", "Camada 'Linhas_corte' não encontrada no projeto!", "error")
@@ -479,7 +525,7 @@ class PoligonizadorLinhaCorte:
             # Passo 2: Extrair por localização
             feedback.setCurrentStep(1)
             alg_params = {
-                'INPUT': linhas_corte_layer[0],
+                'INPUT': linhas_corte_layer,
                 'INTERSECT': outputs['ExtrairFeicoes']['OUTPUT'],
                 'PREDICATE': [0],
                 'OUTPUT': QgsProcessing.TEMPORARY_OUTPUT
@@ -634,41 +680,10 @@ class PoligonizadorLinhaCorte:
 
             # Passo 12: Exportar polígonos para PostgreSQL
             feedback.setCurrentStep(11)
-            alg_params = {
-                'ADDFIELDS': False,
-                'APPEND': True,
-                'A_SRS': QgsCoordinateReferenceSystem('EPSG:31984'),
-                'CLIP': False,
-                'DATABASE': conexao_nome,
-                'DIM': 0,
-                'GEOCOLUMN': 'geom',
-                'GT': None,
-                'GTYPE': 3,
-                'INDEX': False,
-                'INPUT': outputs['EditarCampos']['OUTPUT'],
-                'LAUNDER': False,
-                'OPTIONS': '',
-                'OVERWRITE': False,
-                'PK': '',
-                'PRECISION': True,
-                'PRIMARY_KEY': '',
-                'PROMOTETOMULTI': False,
-                'SCHEMA': 'comercial_umc',
-                'SEGMENTIZE': '',
-                'SHAPE_ENCODING': '',
-                'SIMPLIFY': '',
-                'SKIPFAILURES': False,
-                'SPAT': None,
-                'S_SRS': None,
-                'TABLE': 'v_lote',
-                'T_SRS': None,
-                'WHERE': ''
-            }
-            processing.run(
-                'gdal:importvectorintopostgisdatabaseavailableconnections',
-                alg_params,
-                feedback=feedback
-            )
+            if pool_disponivel():
+                self.exportar_lotes_copy(conexao_nome, outputs['EditarCampos']['OUTPUT'])
+            else:
+                self.exportar_lotes_ogr2ogr(conexao_nome, outputs['EditarCampos']['OUTPUT'], feedback)
 
             # Adiciona as linhas de corte como camada temporária no projeto
             self.adicionar_linhas_corte_temporarias(outputs['EstenderLinhas']['OUTPUT'])
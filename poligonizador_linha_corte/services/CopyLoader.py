@@ -0,0 +1,178 @@
+"""
+Carga em massa com COPY ... FROM STDIN
+Arquivo: CopyLoader.py
+
+Substitui a importação via ogr2ogr: as linhas são enviadas em fluxo para uma
+tabela temporária com COPY sobre uma conexão do pool e depois inseridas na
+tabela de destino com um único INSERT ... SELECT, dentro da mesma transação.
+As geometrias vão como EWKB em hexadecimal.
+"""
+
+import struct
+
+from qgis.PyQt.QtCore import QSettings, QVariant
+
+
+TAMANHO_LOTE_PADRAO = 5000
+_FLAG_SRID_EWKB = 0x20000000
+
+
+def tamanho_lote_configurado():
+    """Linhas por comando COPY (configuração OrganizaLoteClick/copy/tamanho_lote)"""
+    return QSettings().value('OrganizaLoteClick/copy/tamanho_lote', TAMANHO_LOTE_PADRAO, type=int)
+
+
+def wkb_da_geometria(geometria):
+    """Retorna o WKB da geometria (QgsGeometry ou bytes) ou None"""
+    if geometria is None:
+        return None
+    if hasattr(geometria, 'asWkb'):
+        if geometria.isNull():
+            return None
+        return bytes(geometria.asWkb())
+    return bytes(geometria)
+
+
+def ewkb_hex(geometria, srid):
+    """Converte a geometria em EWKB hexadecimal com o SRID embutido"""
+    wkb = wkb_da_geometria(geometria)
+    if wkb is None:
+        return None
+    ordem = '<' if wkb[0] == 1 else '>'
+    tipo = struct.unpack(ordem + 'I', wkb[1:5])[0]
+    if tipo & _FLAG_SRID_EWKB:
+        return wkb.hex()
+    cabecalho = wkb[:1] + struct.pack(ordem + 'II', tipo | _FLAG_SRID_EWKB, srid)
+    return (cabecalho + wkb[5:]).hex()
+
+
+def _texto_copy(valor):
+    """Formata um valor para o formato texto do COPY"""
+    if valor is None or (isinstance(valor, QVariant) and valor.isNull()):
+        return '\\N'
+    if isinstance(valor, bool):
+        return 't' if valor else 'f'
+    if hasattr(valor, 'toPyDateTime'):
+        valor = valor.toPyDateTime().isoformat()
+    elif hasattr(valor, 'toPyDate'):
+        valor = valor.toPyDate().isoformat()
+    return (str(valor)
+            .replace('\\', '\\\\')
+            .replace('\t', '\\t')
+            .replace('\n', '\\n')
+            .replace('\r', '\\r'))
+
+
+class _FluxoCopy:
+    """Arquivo somente leitura que gera as linhas do COPY sob demanda"""
+
+    def __init__(self, linhas, indices_geometria, srid):
+        self._linhas = iter(linhas)
+        self._indices_geometria = indices_geometria
+        self._srid = srid
+        self._buffer = b''
+        self.total = 0
+
+    def _formatar(self, linha):
+        valores = []
+        for indice, valor in enumerate(linha):
+            if indice in self._indices_geometria:
+                valor = ewkb_hex(valor, self._srid)
+            valores.append(_texto_copy(valor))
+        return ('\t'.join(valores) + '\n').encode('utf-8')
+
+    def read(self, tamanho=-1):
+        while tamanho < 0 or len(self._buffer) < tamanho:
+            linha = next(self._linhas, None)
+            if linha is None:
+                break
+            self._buffer += self._formatar(linha)
+            self.total += 1
+        if tamanho < 0:
+            dados, self._buffer = self._buffer, b''
+        else:
+            dados, self._buffer = self._buffer[:tamanho], self._buffer[tamanho:]
+        return dados
+
+
+def _em_lotes(linhas, tamanho_lote):
+    lote = []
+    for linha in linhas:
+        lote.append(linha)
+        if len(lote) >= tamanho_lote:
+            yield lote
+            lote = []
+    if lote:
+        yield lote
+
+
+def copiar_linhas(cursor, tabela, colunas, linhas, colunas_geometria=(), srid=31984, tamanho_lote=None,
+                  verificar_cancelamento=None):
+    """
+    Grava linhas em uma tabela com COPY ... FROM STDIN
+
+    Args:
+        cursor: Cursor psycopg2 (a transação é controlada por quem chama)
+        tabela: Tabela de destino
+        colunas: Nomes das colunas, na ordem dos valores de cada linha
+        linhas: Iterável de sequências de valores
+        colunas_geometria: Colunas cujos valores são geometrias
+        srid: SRID gravado no EWKB
+        tamanho_lote: Linhas por comando COPY (padrão: configuração do plugin)
+        verificar_cancelamento: Função sem argumentos chamada antes e depois
+            de cada COPY, que levanta exceção para interromper. Não adianta
+            levantar de dentro do fluxo: o psycopg2 engole a exceção e o
+            servidor responde com QueryCanceled.
+
+    Returns:
+        Número de linhas gravadas
+    """
+    verificar_cancelamento = verificar_cancelamento or (lambda: None)
+    tamanho_lote = tamanho_lote or tamanho_lote_configurado()
+    indices_geometria = {colunas.index(c) for c in colunas_geometria}
+    lista_colunas = ', '.join(colunas)
+    total = 0
+    for lote in _em_lotes(linhas, tamanho_lote):
+        verificar_cancelamento()
+        fluxo = _FluxoCopy(lote, indices_geometria, srid)
+        cursor.copy_expert(f'COPY {tabela} ({lista_colunas}) FROM STDIN', fluxo)
+        total += fluxo.total
+        verificar_cancelamento()
+    return total
+
+
+def criar_tabela_temporaria(cursor, nome, tabela_modelo, colunas, colunas_geometria=()):
+    """Cria tabela temporária com os tipos das colunas da tabela modelo"""
+    selecao = ', '.join(
+        f'{c}::geometry AS {c}' if c in colunas_geometria else c
+        for c in colunas
+    )
+    cursor.execute(
+        f'CREATE TEMP TABLE {nome} ON COMMIT DROP AS '
+        f'SELECT {selecao} FROM {tabela_modelo} WITH NO DATA'
+    )
+
+
+def inserir_em_massa(cursor, tabela, colunas, linhas, colunas_geometria=(), srid=31984,
+                     promover_multi=False, tamanho_lote=None):
+    """
+    Insere linhas na tabela passando por uma tabela temporária carregada com COPY
+
+    A tabela de destino pode ser uma view com gatilho de inserção.
+
+    Returns:
+        Número de linhas gravadas
+    """
+    temporaria = 'copia_' + tabela.split('.')[-1].strip('"')
+    criar_tabela_temporaria(cursor, temporaria, tabela, colunas, colunas_geometria)
+    total = copiar_linhas(cursor, temporaria, colunas, linhas, colunas_geometria, srid, tamanho_lote)
+
+    selecao = ', '.join(
+        f'ST_Multi({c})' if promover_multi and c in colunas_geometria else c
+        for c in colunas
+    )
+    cursor.execute(
+        f'INSERT INTO {tabela} ({", ".join(colunas)}) SELECT {selecao} FROM {temporaria}; '
+        f'DROP TABLE {temporaria}'
+    )
+    return total